@@ -1,19 +1,18 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta, time
-import time as timer_module
+import numpy as np
 import random
-from st_gsheets_connection import GSheetsConnection
+import os
+import uuid
+import html
+import re
+from stockage import StockageGSheets, StockageSQLite
+from donnees import concat_logs
+from archives import ONGLET_ARCHIVES, COLS_ARCHIVES
+from profilage import Profileur, CompteurAppels, etape, chronometre
+from moteur import Moteur, COLS_LOGS, COLS_PANNES, PANNES_DEFAUT
+from calculs import SHIFTS, pareto_causes
 
-# ==============================================================================
-# 1. CONFIGURATION (VERSION 78 - CLOUD GOOGLE SHEETS)
-# ==============================================================================
-# ... (laisse le reste de ton code comme avant)
-# ---------------------------------------
-
-from datetime import datetime, timedelta, time
-import time as timer_module
-import random
 # ==============================================================================
 # 1. CONFIGURATION (VERSION 78 - CLOUD GOOGLE SHEETS)
 # ==============================================================================
@@ -23,12 +22,71 @@ st.set_page_config(page_title="Suivi V78 Cloud", layout="wide", page_icon="☁
 MOT_DE_PASSE_REGLEUR = "1234"
 MOT_DE_PASSE_CHEF = "0000"
 
-# --- CONNEXION GOOGLE SHEETS ---
-# C'est ici que la magie opère grâce à tes secrets
-conn = st.connection("gsheets", type=GSheetsConnection)
+# --- STOCKAGE (GOOGLE SHEETS PAR DÉFAUT, SQLITE LOCAL EN OPTION) ---
+# Choix par variable d'environnement ou par secrets.toml :
+#   [stockage]
+#   backend = "sqlite"        # ou "gsheets"
+#   chemin = "atelier.db"
+def get_config_stockage():
+    config = {}
+    try: config = dict(st.secrets.get("stockage", {}))
+    except Exception: pass
+    backend = os.environ.get("STOCKAGE_BACKEND", config.get("backend", "gsheets"))
+    chemin = os.environ.get("STOCKAGE_CHEMIN", config.get("chemin", "atelier.db"))
+    return backend, chemin
+
+def get_identite_stockage(backend, chemin):
+    # Source des données, pour l'instantané et le journal : le fichier SQLite, ou le classeur
+    # de [connections.gsheets] (URL ou identifiant, ramenés à l'identifiant)
+    if backend == "sqlite": return f"sqlite:{chemin}"
+    classeur = ""
+    try: classeur = str(st.secrets["connections"]["gsheets"].get("spreadsheet", ""))
+    except Exception: pass
+    id_classeur = re.search(r"/spreadsheets/d/([\w-]+)", classeur)
+    classeur = id_classeur.group(1) if id_classeur else classeur.strip()
+    return f"gsheets:{classeur}" if classeur else f"gsheets:{chemin}"
+
+@st.cache_resource
+def get_stockage(backend, chemin):
+    # CompteurAppels : nombre et durée des appels au stockage, pour le panneau admin
+    if backend == "sqlite": return CompteurAppels(StockageSQLite(chemin))
+    # C'est ici que la magie opère grâce à tes secrets
+    from st_gsheets_connection import GSheetsConnection
+    # Pas de cache côté connecteur : c'est CacheFeuilles qui mutualise les lectures
+    return CompteurAppels(StockageGSheets(st.connection("gsheets", type=GSheetsConnection), ttl=0))
+
+# --- MOTEUR (UN PAR PROCESS, COMMUN À TOUS LES ÉCRANS) ---
+# Caches partagés des onglets, file d'écritures (les clics n'attendent plus le Cloud),
+# calendrier et calculs : voir moteur.py. Le script ne fait plus que dessiner.
+# INSTANTANE_LOGS : fichier local de l'état dérivé des Logs (redémarrage sans tout relire)
+# JOURNAL_ECRITURES : journal local des saisies pas encore envoyées (rejouées au redémarrage)
+@st.cache_resource
+def get_moteur(backend, chemin):
+    fichier = os.environ.get("INSTANTANE_LOGS", ".instantane_logs.pkl") or None
+    journal = os.environ.get("JOURNAL_ECRITURES", ".journal_ecritures.db") or None
+    # Ancienne identité "gsheets:<chemin>" (sans le classeur) : ses saisies en attente sont reprises
+    moteur = Moteur(get_stockage(backend, chemin), fichier_instantane=fichier, identite=get_identite_stockage(backend, chemin),
+                    fichier_journal=journal, anciennes_identites=[f"{backend}:{chemin}"])
+    moteur.migrer()   # initialisation des onglets (Pannes par défaut), une fois par process
+    return moteur
+
+# --- PROFILAGE (PANNEAU MODE ADMIN) ---
+# PROFILAGE_FICHIER : chemin d'un fichier JSON lignes où tracer chaque rerun (suivi sur un shift)
+@st.cache_resource
+def get_profileur():
+    return Profileur(os.environ.get("PROFILAGE_FICHIER") or None)
+
+profileur = get_profileur()
+if "id_session" not in st.session_state: st.session_state.id_session = uuid.uuid4().hex[:8]
+mesure_rerun = profileur.demarrer("rerun", st.session_state.id_session)
+
+config_stockage = get_config_stockage()
+moteur = get_moteur(*config_stockage)
+stockage = moteur.stockage
+file_ecritures = moteur.file_ecritures
 
 def get_heure_fr():
-    return datetime.utcnow() + timedelta(hours=1)
+    return moteur.maintenant()
 
 if 'mode_admin' not in st.session_state: st.session_state.mode_admin = False
 
@@ -61,6 +119,23 @@ st.markdown("""
         border: 2px solid #ff4b4b; padding: 10px; border-radius: 5px;
         text-align: center; margin-bottom: 10px;
     }
+
+    /* Cartes postes en un seul bloc HTML (rendu par défaut) */
+    .poste-card {
+        border: 1px solid rgba(250, 250, 250, 0.2); border-radius: 0.5rem;
+        padding: 1rem; margin-bottom: 1rem;
+    }
+    .poste-titre { font-size: 1.5rem; font-weight: 600; margin-bottom: 0.5rem; }
+    .poste-msn { font-size: 2rem; font-weight: 700; margin-bottom: 0.75rem; }
+    .poste-alerte { padding: 0.75rem 1rem; border-radius: 0.5rem; margin-bottom: 0.75rem; }
+    .poste-alerte.rouge { background-color: rgba(255, 43, 43, 0.09); color: #ffdede; }
+    .poste-alerte.orange { background-color: rgba(255, 227, 18, 0.1); color: #ffffc2; }
+    .poste-alerte.vert { background-color: rgba(61, 213, 109, 0.1); color: #dffde9; }
+    .poste-alerte.bleu { background-color: rgba(61, 157, 243, 0.1); color: #c7ebff; }
+    .poste-barre { height: 0.5rem; background-color: #262730; border-radius: 0.25rem; margin-bottom: 0.75rem; }
+    .poste-barre > div { height: 100%; background-color: #61dafb; border-radius: 0.25rem; }
+    .poste-etape { color: #9ca3af; font-size: 0.875rem; margin-bottom: 0.5rem; }
+    .poste-ligne { margin-bottom: 0.25rem; }
 </style>
 """, unsafe_allow_html=True)
 
@@ -68,232 +143,155 @@ if not st.session_state.mode_admin:
     st.markdown("""<style>header, footer, .stDeployButton {display:none;} .block-container{padding-top:1rem;}</style>""", unsafe_allow_html=True)
 
 # ==============================================================================
-# 2. GESTION DES DONNÉES (LECTURE / ÉCRITURE GSHEETS)
+# 2. GESTION DES DONNÉES (LECTURE / ÉCRITURE VIA LE STOCKAGE)
 # ==============================================================================
 
 def safe_read(worksheet, cols):
-    try:
-        df = conn.read(worksheet=worksheet, ttl=5)
-        if df.empty or len(df.columns) < len(cols):
-            return pd.DataFrame(columns=cols)
-        # On ne garde que les colonnes utiles
-        return df[df.columns[:len(cols)]].set_axis(cols, axis=1)
-    except:
-        return pd.DataFrame(columns=cols)
+    return moteur.lire(worksheet, cols)
 
+# Les écritures partent en file (thread de fond) ; l'écran est mis à jour tout de suite
+# avec la valeur attendue. Les erreurs Cloud s'affichent dans la sidebar et sont retentées.
 def append_row(worksheet, new_row_list, cols):
-    try:
-        # 1. Lire l'existant
-        df_old = safe_read(worksheet, cols)
-        # 2. Créer la nouvelle ligne
-        df_new = pd.DataFrame([new_row_list], columns=cols)
-        # 3. Coller (Concaténer)
-        df_final = pd.concat([df_old, df_new], ignore_index=True)
-        # 4. Tout renvoyer
-        conn.update(worksheet=worksheet, data=df_final)
-    except Exception as e:
-        st.error(f"Erreur Sauvegarde Cloud : {e}")
+    moteur.ajouter(worksheet, new_row_list, cols)
 
 def overwrite_data(worksheet, df_to_write):
-    try:
-        conn.update(worksheet=worksheet, data=df_to_write)
-    except Exception as e:
-        st.error(f"Erreur Mise à jour Cloud : {e}")
+    moteur.ecraser(worksheet, df_to_write)
+
+# Suppression par clé : l'écriture réelle se refait sur le contenu à jour de l'onglet,
+# donc ce qu'un autre écran vient d'ajouter n'est pas effacé au passage
+def delete_rows(worksheet, cols, cle, df_a_supprimer, df_restant):
+    moteur.supprimer(worksheet, cols, cle, df_a_supprimer, df_restant)
 
 # --- CHARGEMENT INITIAL ---
-# 1. LOGS
-COLS_LOGS = ["Date", "Heure", "Poste", "SE_Unique", "MSN_Display", "Etape", "Info_Sup"]
-df = safe_read("Logs", COLS_LOGS)
-if not df.empty:
-    df["DateTime"] = pd.to_datetime(df["Date"] + " " + df["Heure"], errors='coerce')
-    df = df.dropna(subset=["DateTime"]) 
-else:
-    df["DateTime"] = pd.to_datetime([])
-
-# 2. CONSIGNES
+# 1. LOGS (cache process : on ne lit et ne parse que les nouvelles lignes)
+with etape("chargement_logs"): df = moteur.rafraichir_logs()
+# État courant de chaque poste (dernier événement, dernier événement prod...) et de chaque MSN
+etats_postes = moteur.etats
+index_msn = moteur.index_msn
+
+# 2. CONSIGNES, PANNES, OBJECTIF : lus à la demande, par le code qui s'en sert (et via
+# le cache partagé). Pannes à l'ouverture d'un appel / d'un arrêt manuel, Objectif pour
+# le bandeau : un écran opérateur qui ne fait que pointer ne les lit jamais.
 COLS_CONSIGNES = ["Type", "MSN", "Poste", "Emplacement"]
-df_consignes = safe_read("Consignes", COLS_CONSIGNES)
-
-# 3. PANNES
-COLS_PANNES = ["Zone", "Nom"]
-df_pannes = safe_read("Pannes", COLS_PANNES)
-if df_pannes.empty:
-    data_defaut = [["GAUCHE", "🔧 Capot Gauche (ST1)"], ["GAUCHE", "🔧 PAF"], 
-                   ["DROIT", "🔧 Capot Droit (ST2)"], ["GENERIC", "⚠️ SO3 - Pipes"]]
-    df_pannes = pd.DataFrame(data_defaut, columns=COLS_PANNES)
-    # On initialise l'onglet Pannes s'il est vide
-    overwrite_data("Pannes", df_pannes)
-
-# 4. OBJECTIF
 COLS_OBJ = ["Valeur"]
-df_obj = safe_read("Objectif", COLS_OBJ)
-VAL_OBJECTIF = int(df_obj.iloc[0]["Valeur"]) if not df_obj.empty else 35
 
-# --- HELPERS LISTES PANNES ---
-def get_liste_pannes(zone):
-    if df_pannes.empty: return []
-    return df_pannes[df_pannes["Zone"] == zone]["Nom"].tolist()
+def lire_consignes():
+    return safe_read("Consignes", COLS_CONSIGNES)
+
+def lire_objectif():
+    df_obj = safe_read("Objectif", COLS_OBJ)
+    return int(df_obj.iloc[0]["Valeur"]) if not df_obj.empty else 35
+
+# 5. POSTES (onglet optionnel : une ligne par poste, dans l'ordre d'affichage, avec sa cellule)
+COLS_POSTES = ["Poste", "Cellule"]
+POSTES_DEFAUT = [["Poste_01", "Cellule 1"], ["Poste_02", "Cellule 1"], ["Poste_03", "Cellule 1"]]
+df_postes = safe_read("Postes", COLS_POSTES).astype(str).apply(lambda c: c.str.strip())
+df_postes = df_postes[df_postes["Poste"] != ""].drop_duplicates("Poste")
+if df_postes.empty: df_postes = pd.DataFrame(POSTES_DEFAUT, columns=COLS_POSTES)
+LISTE_POSTES = df_postes["Poste"].tolist()
+CELLULE_POSTE = dict(zip(df_postes["Poste"], df_postes["Cellule"].replace("", "Atelier")))
+CELLULES = list(dict.fromkeys(CELLULE_POSTE.values()))
 
-REGLAGES_GAUCHE = get_liste_pannes("GAUCHE")
-REGLAGES_DROIT = get_liste_pannes("DROIT")
-REGLAGES_GENERIC = get_liste_pannes("GENERIC")
+def libelle_poste(poste):
+    # La cellule n'apparaît que s'il y en a plusieurs
+    return f"{poste} ({CELLULE_POSTE[poste]})" if len(CELLULES) > 1 else poste
 
-# --- FONCTIONS CALCULS ---
+# --- HELPERS LISTES PANNES ---
+def lire_pannes():
+    # Onglet encore vide (migration pas passée) : liste par défaut, sans rien écrire
+    df_pannes = safe_read("Pannes", COLS_PANNES)
+    return df_pannes if not df_pannes.empty else pd.DataFrame(PANNES_DEFAUT, columns=COLS_PANNES)
+
+def get_liste_pannes(*zones):
+    df_pannes = lire_pannes()
+    return [nom for zone in zones for nom in df_pannes[df_pannes["Zone"] == zone]["Nom"]]
+
+def section_a_la_demande(label, key):
+    # Expander dont le contenu (et les onglets qu'il lit) n'est construit qu'une fois ouvert.
+    # Streamlit sans suivi de l'ouverture (on_change) : contenu toujours construit.
+    try: section = st.expander(label, key=key, on_change="rerun")
+    except TypeError: section = st.expander(label)
+    return section, getattr(section, "open", None) is not False
+
+# --- FONCTIONS CALCULS (calendrier des shifts : calculs.py) ---
 def get_start_of_week():
-    now = get_heure_fr()
-    today_weekday = now.weekday() 
-    monday_six_thirty = now.replace(hour=6, minute=30, second=0, microsecond=0) - timedelta(days=today_weekday)
-    if today_weekday == 0 and now.time() < time(6, 30): monday_six_thirty -= timedelta(days=7)
-    return monday_six_thirty
+    return moteur.debut_semaine()
 
 def get_current_shift_info():
-    now = get_heure_fr()
-    day = now.weekday() 
-    t = now.time()
-    nom_shift = "💤 Hors Shift"
-    shifts_passes = 0.0
-    if day < 4: shifts_passes = day * 2
-    elif day == 4: shifts_passes = 8
-    else: shifts_passes = 9
-    if day < 4: 
-        if time(6,30) <= t < time(14,50): nom_shift, shifts_passes = "🌅 Shift Matin", shifts_passes + 0.5
-        elif time(14,50) <= t or t <= time(0,9): nom_shift, shifts_passes = "🌙 Shift Soir", shifts_passes + 1.5
-        else: shifts_passes += 2.0 
-    elif day == 4: 
-        if time(6,30) <= t < time(15,50): nom_shift, shifts_passes = "🌅 Shift Matin (Vendredi)", shifts_passes + 0.5
-        else: shifts_passes += 1.0 
-    return nom_shift, min(shifts_passes, 9.0)
-
-def analyser_type(se_name):
-    if not isinstance(se_name, str) or len(se_name) < 1: return "Inconnu"
-    if se_name[0].upper() == "S": return "Série"
-    if se_name[0].upper() == "R": return "Rework"
-    if se_name[0].upper() == "M": return "MIP"
-    return "Autre"
-
-def deviner_contexte_poste(poste_choisi, dataframe):
-    if dataframe.empty: return "Inconnu"
-    df_clean = dataframe[~dataframe["Etape"].str.contains("INCIDENT|APPEL", na=False)]
-    actions_poste = df_clean[df_clean["Poste"] == poste_choisi].sort_values("DateTime")
-    if actions_poste.empty: return "Inconnu"
-    derniere_etape = actions_poste.iloc[-1]["Etape"]
-    if derniere_etape in ["PHASE_SETUP", "STATION_BRAS", "STATION_TRK1"]: return "GAUCHE"
-    elif derniere_etape in ["STATION_TRK2", "PHASE_RAPPORT"]: return "DROIT"
-    else: return "GENERIC"
-
-def get_info_msn(msn_cherhe, df_logs):
-    if df_logs.empty: return "⚪ À faire", "⚡ Premier Dispo"
-    logs_msn = df_logs[df_logs["MSN_Display"].astype(str).str.contains(str(msn_cherhe), na=False)]
-    if logs_msn.empty: return "⚪ À faire", "⚡ Premier Dispo"
-    last_log = logs_msn.sort_values("DateTime").iloc[-1]
-    qui = last_log["Poste"]
-    if last_log["Etape"] == "FIN": return "🟢 Fini", f"✅ Fait par {qui}"
-    return "🟡 En cours", f"🛠️ Pris par {qui}"
-    
-def calculer_kpi_pannes(dataframe):
-    if dataframe.empty: return pd.DataFrame()
-    df_maint = dataframe[dataframe['Etape'].isin(['APPEL_REGLAGE', 'INCIDENT_EN_COURS', 'INCIDENT_FINI'])].sort_values('DateTime')
-    rapports = []
-    
-    for poste in df_maint['Poste'].unique():
-        logs_poste = df_maint[df_maint['Poste'] == poste].sort_values('DateTime')
-        current_cycle = {}
-        for index, row in logs_poste.iterrows():
-            etape = row['Etape']
-            msn_brut = str(row['MSN_Display'])
-            msn_clean = msn_brut.replace("MSN-", "") if "MSN-" in msn_brut else msn_brut
-            
-            if etape == 'APPEL_REGLAGE':
-                current_cycle = {'Poste': poste, 'MSN': msn_clean, 'Cause': row['Info_Sup'], 'Heure_Appel': row['DateTime'], 'Heure_Debut': None, 'Heure_Fin': None}
-            elif etape == 'INCIDENT_EN_COURS':
-                if not current_cycle:
-                    current_cycle = {'Poste': poste, 'MSN': msn_clean, 'Cause': row['Info_Sup'], 'Heure_Appel': row['DateTime'], 'Heure_Debut': row['DateTime'], 'Heure_Fin': None}
-                else:
-                    current_cycle['Heure_Debut'] = row['DateTime']
-            elif etape == 'INCIDENT_FINI':
-                if current_cycle and current_cycle.get('Heure_Debut'):
-                    current_cycle['Heure_Fin'] = row['DateTime']
-                    attente = (current_cycle['Heure_Debut'] - current_cycle['Heure_Appel']).total_seconds() / 60
-                    reglage = (current_cycle['Heure_Fin'] - current_cycle['Heure_Debut']).total_seconds() / 60
-                    rapports.append({
-                        "Date": current_cycle['Heure_Appel'].strftime("%d/%m"),
-                        "Heure": current_cycle['Heure_Appel'].strftime("%H:%M"),
-                        "Poste": poste,
-                        "MSN": current_cycle.get('MSN', '?'),
-                        "Cause": current_cycle['Cause'],
-                        "Attente (min)": int(attente),
-                        "Réglage (min)": int(reglage),
-                        "Total (min)": int(attente + reglage)
-                    })
-                    current_cycle = {} 
-    return pd.DataFrame(rapports)
-
+    return moteur.info_shift()
 
 # ==============================================================================
 # 4. SIDEBAR
 # ==============================================================================
-sim_mode = False; nb_pieces_simu = 0
+prevision_active = False
 acces_chef_ok = False 
 
-with st.sidebar:
+with st.sidebar, etape("sidebar"):
     st.title("🎛️ COMMANDES")
     st.caption(f"Heure : {get_heure_fr().strftime('%H:%M')}")
+    erreur_ecriture = file_ecritures.derniere_erreur   # lue une fois : le thread d'écriture peut la remettre à None
+    if erreur_ecriture:
+        st.warning(f"☁️ Erreur Sauvegarde Cloud ({file_ecritures.en_attente} saisie(s) gardée(s) en local, nouvel essai en cours) : {erreur_ecriture[1]}")
+    elif file_ecritures.en_attente:
+        st.caption(f"⏳ {file_ecritures.en_attente} enregistrement(s) en cours...")
+    if file_ecritures.rejetees:
+        st.error(f"⛔ {len(file_ecritures.rejetees)} enregistrement(s) refusé(s) par le stockage (voir Mode Admin)")
     st.divider()
     role = st.selectbox("👤 Qui êtes-vous ?", ["Opérateur", "Régleur", "Chef d'Équipe", "RDZ (Responsable)"])
     st.divider()
     
     # 🟢 OPÉRATEUR
     if role == "Opérateur":
-        sim_poste = st.selectbox("📍 Poste concerné", ["Poste_01", "Poste_02", "Poste_03"])
+        sim_poste = st.selectbox("📍 Poste concerné", LISTE_POSTES, format_func=libelle_poste)
         st.subheader("🔨 Production")
 
         poste_occupe = False; msn_en_cours = ""; se_unique_en_cours = ""; type_en_cours = "Série"; etat_appel = False
 
-        if not df.empty:
-            df_poste = df[df["Poste"] == sim_poste].sort_values("DateTime")
-            if not df_poste.empty:
-                last_action = df_poste.iloc[-1]
-                if last_action["Etape"] == "APPEL_REGLAGE":
-                    poste_occupe = True; etat_appel = True
-                    prev = df_poste[df_poste["Etape"] != "APPEL_REGLAGE"]
-                    if not prev.empty:
-                        last_real = prev.iloc[-1]
-                        msn_en_cours = str(last_real["MSN_Display"]).replace("MSN-", "")
-                        se_unique_en_cours = last_real["SE_Unique"]
-                elif last_action["Etape"] == "INCIDENT_EN_COURS":
-                    poste_occupe = True; msn_en_cours = "MAINTENANCE"
-                elif last_action["Etape"] != "FIN":
-                    poste_occupe = True
-                    msn_en_cours = str(last_action["MSN_Display"]).replace("MSN-", "")
-                    se_unique_en_cours = last_action["SE_Unique"]
-                    if se_unique_en_cours.startswith("R"): type_en_cours = "Rework"
-                    elif se_unique_en_cours.startswith("M"): type_en_cours = "MIP"
+        etat = etats_postes.get(sim_poste)
+        last_action = etat["dernier"]
+        if last_action is not None:
+            if last_action["Etape"] == "APPEL_REGLAGE":
+                poste_occupe = True; etat_appel = True
+                last_real = etat["dernier_hors_appel"]
+                if last_real is not None:
+                    msn_en_cours = str(last_real["MSN_Display"]).replace("MSN-", "")
+                    se_unique_en_cours = last_real["SE_Unique"]
+            elif last_action["Etape"] == "INCIDENT_EN_COURS":
+                poste_occupe = True; msn_en_cours = "MAINTENANCE"
+            elif last_action["Etape"] != "FIN":
+                poste_occupe = True
+                msn_en_cours = str(last_action["MSN_Display"]).replace("MSN-", "")
+                se_unique_en_cours = last_action["SE_Unique"]
+                if se_unique_en_cours.startswith("R"): type_en_cours = "Rework"
+                elif se_unique_en_cours.startswith("M"): type_en_cours = "MIP"
 
         if poste_occupe:
             if etat_appel: st.error("🆘 APPEL LANCÉ !"); st.info("Attendez le régleur.")
             elif msn_en_cours == "MAINTENANCE": st.warning("🔧 Régleur en cours...")
             else:
                 st.warning(f"⚠️ **EN COURS : MSN-{msn_en_cours}**")
-                with st.expander("🚨 APPEL RÉGLEUR"):
-                    contexte = deviner_contexte_poste(sim_poste, df)
-                    if contexte == "GAUCHE": liste_pannes = REGLAGES_GAUCHE + REGLAGES_GENERIC
-                    elif contexte == "DROIT": liste_pannes = REGLAGES_DROIT + REGLAGES_GENERIC
-                    else: liste_pannes = REGLAGES_GAUCHE + REGLAGES_DROIT + REGLAGES_GENERIC
-                    
-                    raisons_appel = st.multiselect("Quels réglages ?", liste_pannes)
-                    num_mat = st.text_input("📝 N° MAT / Outillage (Optionnel)", placeholder="Ex: MAT-1234")
-                    
-                    if st.button("📢 SONNER RÉGLEUR", type="primary"):
-                        if not raisons_appel:
-                            st.error("⚠️ Choisissez au moins un problème !")
-                        else:
-                            now = get_heure_fr()
-                            str_raisons = " + ".join(raisons_appel)
-                            if num_mat: str_raisons = f"[MAT:{num_mat}] {str_raisons}"
-                            # WRITE CLOUD
-                            new_data = [now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), sim_poste, se_unique_en_cours, f"MSN-{msn_en_cours}", "APPEL_REGLAGE", str_raisons]
-                            append_row("Logs", new_data, COLS_LOGS)
-                            st.rerun()
+                section_appel, appel_ouvert = section_a_la_demande("🚨 APPEL RÉGLEUR", f"appel_{sim_poste}")
+                with section_appel:
+                    if appel_ouvert:
+                        contexte = moteur.contexte_poste(sim_poste)
+                        if contexte == "GAUCHE": liste_pannes = get_liste_pannes("GAUCHE", "GENERIC")
+                        elif contexte == "DROIT": liste_pannes = get_liste_pannes("DROIT", "GENERIC")
+                        else: liste_pannes = get_liste_pannes("GAUCHE", "DROIT", "GENERIC")
+
+                        raisons_appel = st.multiselect("Quels réglages ?", liste_pannes)
+                        num_mat = st.text_input("📝 N° MAT / Outillage (Optionnel)", placeholder="Ex: MAT-1234")
+
+                        if st.button("📢 SONNER RÉGLEUR", type="primary"):
+                            if not raisons_appel:
+                                st.error("⚠️ Choisissez au moins un problème !")
+                            else:
+                                now = get_heure_fr()
+                                str_raisons = " + ".join(raisons_appel)
+                                if num_mat: str_raisons = f"[MAT:{num_mat}] {str_raisons}"
+                                # WRITE CLOUD
+                                new_data = [now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), sim_poste, se_unique_en_cours, f"MSN-{msn_en_cours}", "APPEL_REGLAGE", str_raisons]
+                                append_row("Logs", new_data, COLS_LOGS)
+                                st.rerun()
                 st.markdown("---")
                 sim_msn = msn_en_cours; nom_se_complet = se_unique_en_cours
                 c1, c2 = st.columns(2)
@@ -327,6 +325,7 @@ with st.sidebar:
         else:
             st.success("✅ Poste Libre")
             sim_type = st.radio("Type", ["Série", "Rework", "MIP"], horizontal=True)
+            df_consignes = lire_consignes()
             if not df_consignes.empty:
                 liste_msn = df_consignes["MSN"].unique().tolist()
                 st.markdown("👇 **Prendre dans la liste :**"); selection_msn = st.selectbox("Sélection MSN", liste_msn); sim_msn = selection_msn.replace("MSN-", "")
@@ -337,11 +336,9 @@ with st.sidebar:
                 st.warning("⚠️ Aucune consigne, saisie manuelle."); sim_msn = col_msn.text_input("Saisie MSN", st.session_state.current_msn)
 
             msn_deja_pris = False; qui_a_le_msn = ""
-            if not df.empty:
-                df_msn_check = df[df["MSN_Display"] == f"MSN-{sim_msn}"].sort_values("DateTime")
-                if not df_msn_check.empty:
-                    last_check = df_msn_check.iloc[-1]
-                    if last_check["Etape"] not in ["FIN", "INCIDENT_FINI"] and last_check["Poste"] != sim_poste: msn_deja_pris = True; qui_a_le_msn = last_check["Poste"]
+            last_check = index_msn.get(f"MSN-{sim_msn}")
+            if last_check is not None:
+                if last_check["Etape"] not in ["FIN", "INCIDENT_FINI"] and last_check["Poste"] != sim_poste: msn_deja_pris = True; qui_a_le_msn = last_check["Poste"]
             
             prefix = "S" if sim_type == "Série" else ("R" if sim_type == "Rework" else "M")
             nom_se_complet = f"{prefix}-SE-MSN-{sim_msn}"
@@ -359,17 +356,16 @@ with st.sidebar:
         st.button("🔓 Se connecter", key="btn_regleur")
         if pwd == MOT_DE_PASSE_REGLEUR:
             st.success("Accès autorisé")
-            sim_poste = st.selectbox("📍 Poste concerné", ["Poste_01", "Poste_02", "Poste_03"])
+            sim_poste = st.selectbox("📍 Poste concerné", LISTE_POSTES, format_func=libelle_poste)
             st.subheader("🔧 Intervention")
             etat_poste = "VIDE"; info_sup = ""; start_time_evt = None
-            if not df.empty:
-                df_p = df[df["Poste"] == sim_poste].sort_values("DateTime")
-                if not df_p.empty:
-                    last_evt = df_p.iloc[-1]; info_sup = str(last_evt.get("Info_Sup", ""))
-                    start_time_evt = last_evt["DateTime"]
-                    if last_evt["Etape"] == "APPEL_REGLAGE": etat_poste = "APPEL_EN_COURS"
-                    elif last_evt["Etape"] == "INCIDENT_EN_COURS": etat_poste = "INTERVENTION_EN_COURS"
-                    elif last_evt["Etape"] != "FIN": etat_poste = "EN_PROD"
+            last_evt = etats_postes.get(sim_poste)["dernier"]
+            if last_evt is not None:
+                info_sup = str(last_evt.get("Info_Sup", ""))
+                start_time_evt = last_evt["DateTime"]
+                if last_evt["Etape"] == "APPEL_REGLAGE": etat_poste = "APPEL_EN_COURS"
+                elif last_evt["Etape"] == "INCIDENT_EN_COURS": etat_poste = "INTERVENTION_EN_COURS"
+                elif last_evt["Etape"] != "FIN": etat_poste = "EN_PROD"
             if etat_poste == "VIDE": st.warning(f"🚫 {sim_poste} est vide.")
             elif etat_poste == "APPEL_EN_COURS":
                 st.markdown(f"<h3 style='color:red'>🚨 APPEL : {info_sup}</h3>", unsafe_allow_html=True)
@@ -390,18 +386,20 @@ with st.sidebar:
                     new_data = [now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), sim_poste, "MAINTENANCE", "System", "INCIDENT_FINI", "Reprise"]
                     append_row("Logs", new_data, COLS_LOGS); st.rerun()
             elif etat_poste == "EN_PROD":
-                st.info("Arrêt manuel ?")
-                liste_complete = REGLAGES_GAUCHE + REGLAGES_DROIT + REGLAGES_GENERIC
-                causes_choisies = st.multiselect("Motif :", liste_complete)
-                num_mat_regleur = st.text_input("📝 N° MAT (Optionnel)", placeholder="Ex: MAT-1234")
-                if st.button("🛑 DÉBUT RÉGLAGE"):
-                    if not causes_choisies: st.error("Motif obligatoire")
-                    else:
-                        now = get_heure_fr()
-                        str_raisons = ' + '.join(causes_choisies)
-                        if num_mat_regleur: str_raisons = f"[MAT:{num_mat_regleur}] {str_raisons}"
-                        new_data = [now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), sim_poste, "MAINTENANCE", "System", "INCIDENT_EN_COURS", str_raisons]
-                        append_row("Logs", new_data, COLS_LOGS); st.rerun()
+                section_arret, arret_ouvert = section_a_la_demande("🛑 Arrêt manuel ?", f"arret_{sim_poste}")
+                with section_arret:
+                    if arret_ouvert:
+                        liste_complete = get_liste_pannes("GAUCHE", "DROIT", "GENERIC")
+                        causes_choisies = st.multiselect("Motif :", liste_complete)
+                        num_mat_regleur = st.text_input("📝 N° MAT (Optionnel)", placeholder="Ex: MAT-1234")
+                        if st.button("🛑 DÉBUT RÉGLAGE"):
+                            if not causes_choisies: st.error("Motif obligatoire")
+                            else:
+                                now = get_heure_fr()
+                                str_raisons = ' + '.join(causes_choisies)
+                                if num_mat_regleur: str_raisons = f"[MAT:{num_mat_regleur}] {str_raisons}"
+                                new_data = [now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), sim_poste, "MAINTENANCE", "System", "INCIDENT_EN_COURS", str_raisons]
+                                append_row("Logs", new_data, COLS_LOGS); st.rerun()
         elif pwd: st.error("⛔ Code Faux !")
 
     # CHEF D'ÉQUIPE (AVEC VERROU SECURISE)
@@ -415,7 +413,7 @@ with st.sidebar:
             
             # 1. OBJECTIF
             st.subheader("🎯 Objectif Semaine")
-            val_actuelle = VAL_OBJECTIF
+            val_actuelle = lire_objectif()
             nouveau_obj = st.number_input("Définir l'objectif :", value=val_actuelle, step=1)
             if st.button("💾 Valider Objectif"):
                 df_new_obj = pd.DataFrame([[nouveau_obj]], columns=["Valeur"])
@@ -424,26 +422,28 @@ with st.sidebar:
             st.divider()
 
             # 2. GESTION DES PANNES
-            with st.expander("⚙️ Gérer la liste des Pannes"):
-                st.write("Ajouter ou supprimer des pannes")
-                new_panne = st.text_input("Nouvelle Panne")
-                new_zone = st.selectbox("Zone", ["GAUCHE", "DROIT", "GENERIC"])
-                if st.button("Ajouter à la liste"):
-                    append_row("Pannes", [new_zone, new_panne], COLS_PANNES)
-                    st.success("Ajouté !"); st.rerun()
-                st.markdown("---")
-                if not df_pannes.empty:
-                    df_pannes['Label'] = df_pannes['Zone'] + " - " + df_pannes['Nom']
-                    to_del = st.selectbox("Supprimer une panne :", df_pannes['Label'].unique())
-                    if st.button("Supprimer"):
-                        df_new = df_pannes[df_pannes['Label'] != to_del]
-                        df_new = df_new.drop(columns=['Label'], errors='ignore')
-                        overwrite_data("Pannes", df_new)
-                        st.success("Supprimé !"); st.rerun()
+            section_pannes, pannes_ouvert = section_a_la_demande("⚙️ Gérer la liste des Pannes", "gestion_pannes")
+            with section_pannes:
+                if pannes_ouvert:
+                    df_pannes = safe_read("Pannes", COLS_PANNES)
+                    st.write("Ajouter ou supprimer des pannes")
+                    new_panne = st.text_input("Nouvelle Panne")
+                    new_zone = st.selectbox("Zone", ["GAUCHE", "DROIT", "GENERIC"])
+                    if st.button("Ajouter à la liste"):
+                        append_row("Pannes", [new_zone, new_panne], COLS_PANNES)
+                        st.success("Ajouté !"); st.rerun()
+                    st.markdown("---")
+                    if not df_pannes.empty:
+                        df_pannes['Label'] = df_pannes['Zone'] + " - " + df_pannes['Nom']
+                        to_del = st.selectbox("Supprimer une panne :", df_pannes['Label'].unique())
+                        if st.button("Supprimer"):
+                            masque = df_pannes['Label'] == to_del
+                            df_new = df_pannes[~masque].drop(columns=['Label'], errors='ignore')
+                            delete_rows("Pannes", COLS_PANNES, COLS_PANNES, df_pannes[masque], df_new)
+                            st.success("Supprimé !"); st.rerun()
             
             st.divider()
-            sim_mode = st.checkbox("🔮 Activer Simulation", value=False)
-            if sim_mode: nb_pieces_simu = st.number_input("Nb Pièces :", value=10)
+            prevision_active = st.checkbox("🔮 Prévision fin de semaine", value=False)
             st.divider()
             if st.button("⚠️ RAZ Logs Production"): 
                 # On remplace par un dataframe vide avec les bonnes colonnes
@@ -457,6 +457,7 @@ with st.sidebar:
         if pwd == MOT_DE_PASSE_CHEF: 
             st.success("Accès autorisé")
             st.subheader("📋 Consignes")
+            df_consignes = lire_consignes()
             with st.form("form_consigne"):
                 c_type = st.selectbox("Type", ["Série", "Rework", "MIP"])
                 c_msn = st.text_input("Numéro MSN")
@@ -475,9 +476,9 @@ with st.sidebar:
                 df_consignes['Label'] = df_consignes['MSN'] + " (" + df_consignes['Type'] + ")"
                 to_delete = st.multiselect("Effacer :", df_consignes['Label'].unique())
                 if st.button("Supprimer Sélection"):
-                    df_new = df_consignes[~df_consignes['Label'].isin(to_delete)]
-                    df_new = df_new.drop(columns=['Label'], errors='ignore')
-                    overwrite_data("Consignes", df_new)
+                    masque = df_consignes['Label'].isin(to_delete)
+                    df_new = df_consignes[~masque].drop(columns=['Label'], errors='ignore')
+                    delete_rows("Consignes", COLS_CONSIGNES, ["MSN", "Type"], df_consignes[masque], df_new)
                     st.success("Supprimé !"); st.rerun()
             if st.button("🔥 Tout effacer"): 
                  overwrite_data("Consignes", pd.DataFrame(columns=COLS_CONSIGNES)); st.rerun()
@@ -485,133 +486,230 @@ with st.sidebar:
 
     st.divider()
     st.checkbox("🔓 Mode Admin", key="mode_admin")
+    if st.session_state.mode_admin:
+        # Efficacité du cache partagé depuis le démarrage du serveur
+        stats_cache = dict(moteur.cache_feuilles.stats, Logs=moteur.cache_logs.stats)
+        st.caption("📦 Cache partagé (hits / misses)")
+        st.dataframe(pd.DataFrame(stats_cache).T, use_container_width=True)
+        # Écritures mises de côté par la file après des échecs répétés
+        rejetees = file_ecritures.rejetees
+        if rejetees:
+            st.caption("⛔ Écritures refusées")
+            st.dataframe(pd.DataFrame([{"Onglet": r["op"]["worksheet"], "Opération": r["op"]["type"], "Erreur": r["erreur"],
+                                        "Quand": (pd.Timestamp(r["quand"], unit="s") + pd.Timedelta(hours=1)).strftime("%d/%m %H:%M")} for r in rejetees]),
+                         use_container_width=True, hide_index=True)
+            c1, c2 = st.columns(2)
+            if c1.button("🔁 Renvoyer"): moteur.relancer_rejetees(); st.rerun()
+            if c2.button("🗑️ Abandonner"): moteur.abandonner_rejetees(); st.rerun()
 
 # ==============================================================================
-# 5. DASHBOARD
+# 5. DASHBOARD (PARTIE LIVE)
 # ==============================================================================
-debut_semaine = get_start_of_week()
-nom_shift_actuel, shifts_ecoules = get_current_shift_info()
-mapping_etapes = {"PHASE_SETUP": 5, "STATION_BRAS": 15, "STATION_TRK1": 30, "STATION_TRK2": 65, "PHASE_RAPPORT": 90, "PHASE_DESETUP": 95, "FIN": 100}
-
-if not df.empty:
-    df_week = df[df["DateTime"] >= debut_semaine].copy()
-    if not df_week.empty:
-        df_week["Type"] = df_week["SE_Unique"].apply(analyser_type)
-        df_week["Progression"] = df_week["Etape"].map(mapping_etapes).fillna(0)
-        
-        df_prod_pure = df_week[~df_week["Etape"].str.contains("INCIDENT|APPEL")].copy()
-        
-        # Pour éviter l'erreur groupby sur vide
-        if not df_prod_pure.empty:
-            etat_global = df_prod_pure.sort_values("DateTime").groupby("SE_Unique").last().reset_index()
-            pieces_terminees = etat_global[etat_global["Progression"] >= 95]
-            nb_realise = pieces_terminees[pieces_terminees["Type"] == "Série"].shape[0]
-            nb_rework = pieces_terminees[pieces_terminees["Type"] == "Rework"].shape[0]
-            nb_mip = pieces_terminees[pieces_terminees["Type"] == "MIP"].shape[0]
-            
-            last_actions_prod = df_prod_pure.sort_values("DateTime").groupby("Poste").last().reset_index()
+# Seule la partie live (bandeau, consignes, KPI, état des postes) se relance toute seule,
+# via st.fragment : la sidebar, le CSS et les autres onglets ne sont ré-exécutés que sur
+# une action de l'utilisateur. Les comptages ne sont refaits que si les Logs ont bougé.
+INTERVALLE_LIVE = 10
+# Rendu par défaut : chaque colonne de consignes et chaque carte poste part en UN seul bloc
+# HTML. Un bloc identique au rafraîchissement précédent n'est pas renvoyé : Streamlit
+# n'envoie qu'une référence vers la copie déjà en cache dans le navigateur (seuil
+# global.minCachedMessageSize abaissé dans .streamlit/config.toml).
+# ?rendu=classique dans l'URL revient aux composants Streamlit un par un.
+RENDU_HTML = st.query_params.get("rendu", "html") != "classique"
+JOURS_SEMAINE = ["Lun", "Mar", "Mer", "Jeu", "Ven", "Sam", "Dim"]
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner="Chargement des archives...")
+def charger_archives(config, onglets):
+    return get_moteur(*config).charger_archives(onglets)
+
+def html_carte_prio(rank, msn, emplacement, txt_statut, txt_qui, couleur_bordure):
+    if txt_statut == "🟢 Fini": opacity = "0.4"
+    elif txt_statut == "🟡 En cours": opacity = "1.0; border: 2px solid #f1c40f"
+    else: opacity = "1.0"
+    return f"""
+            <div class="prio-card" style="border-left: 6px solid {couleur_bordure}; opacity: {opacity};">
+                <div style="display:flex; justify-content:space-between;">
+                    <span class="prio-rank">#{rank}</span>
+                    <span class="prio-msn">{html.escape(str(msn))}</span>
+                </div>
+                <div class="prio-loc">📍 {html.escape(str(emplacement))}</div>
+                <div class="prio-info">{html.escape(str(txt_statut))} | {html.escape(str(txt_qui))}</div>
+            </div>
+            """
+
+@chronometre("afficher_colonne_prio")
+def afficher_colonne_prio(df_consignes, type_col, couleur_bordure):
+    if not df_consignes.empty:
+        items = df_consignes[df_consignes["Type"] == type_col]
+        cartes = []
+        for rank, row in enumerate(items.to_dict("records"), start=1):
+            txt_statut, txt_qui = moteur.statut_msn(row['MSN'])
+            cartes.append(html_carte_prio(rank, row['MSN'], row.get('Emplacement', 'Non précisé'), txt_statut, txt_qui, couleur_bordure))
+        if RENDU_HTML:
+            if cartes: st.markdown("".join(cartes), unsafe_allow_html=True)
         else:
-            nb_realise = 0; nb_rework = 0; nb_mip = 0; last_actions_prod = pd.DataFrame()
-
-        last_actions_absolute = df_week.sort_values("DateTime").groupby("Poste").last().reset_index()
+            for carte in cartes: st.markdown(carte, unsafe_allow_html=True)
+    else: st.caption("Aucune consigne.")
+
+# --- GRILLE DES POSTES ---
+# Au-delà d'une cellule : un résumé d'une ligne par cellule, puis les cartes de la cellule
+# choisie seulement, par pages. Le nombre de cartes dessinées reste borné.
+NB_COLONNES_GRILLE = 3
+CARTES_PAR_PAGE = 12
+ICONES_STATUT = {"APPEL": "🚨", "REGLAGE": "🟠", "PROD": "🟦", "LIBRE": "✅", "ATTENTE": "⬜"}
+
+def dessiner_carte_poste(r):
+    p = r.Poste
+    with st.container(border=True):
+        if r.Statut == "APPEL":
+            st.markdown(f"<div class='blink-red'>🚨 APPEL RÉGLEUR EN COURS</div>", unsafe_allow_html=True)
+            st.markdown(f"### ⚠️ {p}"); st.markdown(f"## **{r.abs_MSN_Display}**"); 
+            st.error(f"Motif : {r.abs_Info_Sup}")
+            st.markdown(f"⏳ Attente Régleur : **{int(r.Duree_min)} min**")
+        elif r.Statut == "REGLAGE":
+            msn_display = r.prod_MSN_Display if isinstance(r.prod_MSN_Display, str) else "MAINTENANCE"
+            st.markdown(f"### 🟠 {p}"); st.markdown(f"## **{msn_display}**"); st.warning(f"🔧 {r.abs_Info_Sup}")
+            st.markdown(f"🔧 Temps de Réglage : **{int(r.Duree_min)} min**")
+        elif r.Statut == "PROD":
+            icon = "🟨" if r.prod_Etape == "PHASE_SETUP" else ("🟪" if r.prod_Etape == "PHASE_DESETUP" else "🟦")
+            if r.Type == "Rework": icon = "🟥"
+            st.markdown(f"### {icon} {p}"); st.markdown(f"## **{r.prod_MSN_Display}**"); st.progress(int(r.Progression))
+            reste = int(r.Reste_min)
+            if reste >= 60: str_duree = f"{reste // 60}h{reste % 60:02d}"
+            else: str_duree = f"{reste} min"
+            st.caption(f"📍 {r.prod_Etape}"); st.markdown(f"⏳ Reste : **{str_duree}**")
+            st.markdown(f"🏁 Sortie : **{r.Sortie}**" + (f" (au plus tard {r.Sortie_max})" if r.Sortie_max != r.Sortie else ""))
+        elif r.Statut == "LIBRE": st.markdown(f"### 🟦 {p}"); st.success("✅ Poste Libre")
+        else: st.markdown(f"### ⬜ {p}"); st.info("En attente")
+
+def html_carte_poste(r):
+    # Même contenu que dessiner_carte_poste, en un seul élément
+    p = html.escape(str(r.Poste)); e = lambda v: html.escape(str(v))
+    lignes = []
+    if r.Statut == "APPEL":
+        lignes += ["<div class='blink-red'>🚨 APPEL RÉGLEUR EN COURS</div>",
+                   f"<div class='poste-titre'>⚠️ {p}</div>", f"<div class='poste-msn'>{e(r.abs_MSN_Display)}</div>",
+                   f"<div class='poste-alerte rouge'>Motif : {e(r.abs_Info_Sup)}</div>",
+                   f"<div class='poste-ligne'>⏳ Attente Régleur : <b>{int(r.Duree_min)} min</b></div>"]
+    elif r.Statut == "REGLAGE":
+        msn_display = r.prod_MSN_Display if isinstance(r.prod_MSN_Display, str) else "MAINTENANCE"
+        lignes += [f"<div class='poste-titre'>🟠 {p}</div>", f"<div class='poste-msn'>{e(msn_display)}</div>",
+                   f"<div class='poste-alerte orange'>🔧 {e(r.abs_Info_Sup)}</div>",
+                   f"<div class='poste-ligne'>🔧 Temps de Réglage : <b>{int(r.Duree_min)} min</b></div>"]
+    elif r.Statut == "PROD":
+        icon = "🟨" if r.prod_Etape == "PHASE_SETUP" else ("🟪" if r.prod_Etape == "PHASE_DESETUP" else "🟦")
+        if r.Type == "Rework": icon = "🟥"
+        reste = int(r.Reste_min)
+        str_duree = f"{reste // 60}h{reste % 60:02d}" if reste >= 60 else f"{reste} min"
+        lignes += [f"<div class='poste-titre'>{icon} {p}</div>", f"<div class='poste-msn'>{e(r.prod_MSN_Display)}</div>",
+                   f"<div class='poste-barre'><div style='width:{int(r.Progression)}%'></div></div>",
+                   f"<div class='poste-etape'>📍 {e(r.prod_Etape)}</div>",
+                   f"<div class='poste-ligne'>⏳ Reste : <b>{str_duree}</b></div>",
+                   f"<div class='poste-ligne'>🏁 Sortie : <b>{r.Sortie}</b>"
+                   + (f" <small>(au plus tard {r.Sortie_max})</small>" if r.Sortie_max != r.Sortie else "") + "</div>"]
+    elif r.Statut == "LIBRE":
+        lignes += [f"<div class='poste-titre'>🟦 {p}</div>", "<div class='poste-alerte vert'>✅ Poste Libre</div>"]
     else:
-        nb_realise = 0; nb_rework = 0; nb_mip = 0; last_actions_absolute = pd.DataFrame(); last_actions_prod = pd.DataFrame()
-else:
-    nb_realise = 0; nb_rework = 0; nb_mip = 0; last_actions_absolute = pd.DataFrame(); last_actions_prod = pd.DataFrame()
-
-target = VAL_OBJECTIF
-cadence_par_shift = target / 9.0 
-
-if sim_mode:
-    delta = nb_pieces_simu - (shifts_ecoules * cadence_par_shift)
-    affichage_realise = nb_pieces_simu
-    titre_mode = "🔮 SIMULATION"
-    couleur_bandeau = "#9b59b6"
-else:
+        lignes += [f"<div class='poste-titre'>⬜ {p}</div>", "<div class='poste-alerte bleu'>En attente</div>"]
+    return "<div class='poste-card'>" + "".join(lignes) + "</div>"
+
+def afficher_grille_postes(df_etats):
+    choix = ""
+    if len(CELLULES) > 1:
+        cellules = df_etats["Poste"].map(CELLULE_POSTE)
+        comptes = pd.crosstab(cellules, df_etats["Statut"])
+        for cellule in CELLULES:
+            if cellule not in comptes.index: continue
+            detail = " · ".join(f"{icone} {comptes.at[cellule, s]}" for s, icone in ICONES_STATUT.items() if s in comptes.columns and comptes.at[cellule, s])
+            st.caption(f"**{cellule}** : {detail}")
+        choix = st.radio("Cellule", CELLULES, horizontal=True, key="cellule_live", label_visibility="collapsed")
+        df_etats = df_etats[cellules == choix]
+    nb_pages = -(-len(df_etats) // CARTES_PAR_PAGE)
+    if nb_pages > 1:
+        page = st.radio("Page", range(1, nb_pages + 1), horizontal=True, key=f"page_live_{choix}", format_func=lambda n: f"Page {n}")
+        df_etats = df_etats.iloc[(page - 1) * CARTES_PAR_PAGE: page * CARTES_PAR_PAGE]
+    with etape("cartes_postes"):
+        for debut in range(0, len(df_etats), NB_COLONNES_GRILLE):
+            cols = st.columns(NB_COLONNES_GRILLE)
+            for col, r in zip(cols, df_etats.iloc[debut:debut + NB_COLONNES_GRILLE].itertuples(index=False)):
+                with col:
+                    if RENDU_HTML: st.markdown(html_carte_poste(r), unsafe_allow_html=True)
+                    else: dessiner_carte_poste(r)
+
+@st.fragment(run_every=INTERVALLE_LIVE)
+def afficher_pilotage_live(prevision_active):
+    # Relance seule du fragment = un rerun à part entière pour le profilage
+    with profileur.mesure("fragment_live", st.session_state.id_session):
+        dessiner_pilotage_live(prevision_active)
+
+def dessiner_pilotage_live(prevision_active):
+    # Lecture incrémentale : ne coûte qu'un petit appel si rien n'a changé
+    with etape("rafraichir_logs"): moteur.rafraichir_logs()
+
+    df_consignes = lire_consignes()
+    debut_semaine = get_start_of_week()
+    moteur.planifier_rotation(debut_semaine, df_consignes["MSN"].astype(str).tolist() if not df_consignes.empty else [])
+    nom_shift_actuel, shifts_ecoules = get_current_shift_info()
+    with etape("agregation_semaine"): nb_realise, nb_rework, nb_mip = moteur.comptages_semaine(debut_semaine)
+
+    target = lire_objectif()
+    cadence_par_shift = target / 9.0 
+
     delta = nb_realise - (shifts_ecoules * cadence_par_shift)
-    affichage_realise = nb_realise
-    titre_mode = f"📍 PILOTAGE LIVE | {nom_shift_actuel}"
-    couleur_bandeau = "#2ecc71" if delta >= 0 else "#e74c3c"
-
-now = get_heure_fr() 
-st.title(titre_mode)
-if sim_mode: msg = f"Avec {int(nb_pieces_simu)} pièces MAINTENANT 👉 DELTA : {delta:+.1f}"
-else: msg = f"🚀 AVANCE : {delta:+.1f}" if delta >= 0 else f"🐢 RETARD : {delta:+.1f}"
-st.markdown(f"<div style='padding:10px;border-radius:5px;background-color:{couleur_bandeau};color:white;text-align:center;font-weight:bold;'>{msg}</div>", unsafe_allow_html=True)
-
-if not sim_mode:
-    st.write("")
-    st.subheader("📋 ORDRE DE PASSAGE & EMPLACEMENTS")
-    col_serie, col_mip, col_rework = st.columns(3)
-    def afficher_colonne_prio(type_col, couleur_bordure):
-        if not df_consignes.empty:
-            items = df_consignes[df_consignes["Type"] == type_col]
-            rank = 1
-            for index, row in items.iterrows():
-                txt_statut, txt_qui = get_info_msn(row['MSN'], df)
-                if txt_statut == "🟢 Fini": opacity = "0.4"
-                elif txt_statut == "🟡 En cours": opacity = "1.0; border: 2px solid #f1c40f"
-                else: opacity = "1.0"
-                st.markdown(f"""
-                <div class="prio-card" style="border-left: 6px solid {couleur_bordure}; opacity: {opacity};">
-                    <div style="display:flex; justify-content:space-between;">
-                        <span class="prio-rank">#{rank}</span>
-                        <span class="prio-msn">{row['MSN']}</span>
-                    </div>
-                    <div class="prio-loc">📍 {row.get('Emplacement', 'Non précisé')}</div>
-                    <div class="prio-info">{txt_statut} | {txt_qui}</div>
-                </div>
-                """, unsafe_allow_html=True)
-                rank += 1
-        else: st.caption("Aucune consigne.")
-    with col_serie: st.markdown("### 🟦 SÉRIE"); afficher_colonne_prio("Série", "#3498db")
-    with col_mip: st.markdown("### 🟧 MIP"); afficher_colonne_prio("MIP", "#e67e22")
-    with col_rework: st.markdown("### 🟥 REWORK"); afficher_colonne_prio("Rework", "#c0392b")
-
-st.divider()
-
-k1, k2, k3, k4, k5 = st.columns(5)
-k1.metric("🎯 Objectif", target)
-k2.metric("📊 Réalisé", affichage_realise)
-k3.metric("🔴 Reworks", nb_rework)
-k4.metric("🟠 MIPs", nb_mip)
-k5.metric("🕒 Heure", now.strftime("%H:%M"))
-
-st.subheader("📡 État des Postes (Live)")
-cols = st.columns(3)
-TEMPS_RESTANT = { "PHASE_SETUP": 245, "STATION_BRAS": 210, "STATION_TRK1": 175, "STATION_TRK2": 85, "PHASE_RAPPORT": 45, "PHASE_DESETUP": 25, "FIN": 0 }
-
-for i, p in enumerate(["Poste_01", "Poste_02", "Poste_03"]):
-    info_abs = last_actions_absolute[last_actions_absolute["Poste"] == p] if not last_actions_absolute.empty else pd.DataFrame()
-    info_prod = last_actions_prod[last_actions_prod["Poste"] == p] if not last_actions_prod.empty else pd.DataFrame()
-    with cols[i]:
-        with st.container(border=True):
-            if not info_abs.empty and info_abs.iloc[0]['Etape'] == "APPEL_REGLAGE":
-                row_abs = info_abs.iloc[0]; msn_display = row_abs["MSN_Display"]
-                st.markdown(f"<div class='blink-red'>🚨 APPEL RÉGLEUR EN COURS</div>", unsafe_allow_html=True)
-                st.markdown(f"### ⚠️ {p}"); st.markdown(f"## **{msn_display}**"); 
-                st.error(f"Motif : {row_abs.get('Info_Sup', 'Inconnu')}")
-                duree = int((now - row_abs['DateTime']).total_seconds() / 60)
-                st.markdown(f"⏳ Attente Régleur : **{duree} min**")
-            elif not info_abs.empty and info_abs.iloc[0]['Etape'] == "INCIDENT_EN_COURS":
-                row_abs = info_abs.iloc[0]; msn_display = "MAINTENANCE"
-                if not info_prod.empty: msn_display = info_prod.iloc[0]['MSN_Display']
-                st.markdown(f"### 🟠 {p}"); st.markdown(f"## **{msn_display}**"); st.warning(f"🔧 {row_abs.get('Info_Sup', '')}")
-                duree = int((now - row_abs['DateTime']).total_seconds() / 60)
-                st.markdown(f"🔧 Temps de Réglage : **{duree} min**")
-            elif not info_prod.empty:
-                row_prod = info_prod.iloc[0]
-                if row_prod.get('Progression', 0) < 100:
-                    icon = "🟨" if row_prod['Etape'] == "PHASE_SETUP" else ("🟪" if row_prod['Etape'] == "PHASE_DESETUP" else "🟦")
-                    if row_prod['Type'] == "Rework": icon = "🟥"
-                    st.markdown(f"### {icon} {p}"); st.markdown(f"## **{row_prod['MSN_Display']}**"); st.progress(int(row_prod.get('Progression', 0)))
-                    reste = TEMPS_RESTANT.get(row_prod['Etape'], 30)
-                    sortie = now + timedelta(minutes=reste)
-                    if reste >= 60: str_duree = f"{reste // 60}h{reste % 60:02d}"
-                    else: str_duree = f"{reste} min"
-                    st.caption(f"📍 {row_prod['Etape']}"); st.markdown(f"⏳ Reste : **{str_duree}**"); st.markdown(f"🏁 Sortie : **{sortie.strftime('%H:%M')}**")
-                else: st.markdown(f"### 🟦 {p}"); st.success("✅ Poste Libre")
-            else: st.markdown(f"### ⬜ {p}"); st.info("En attente")
+    now = get_heure_fr() 
+    if prevision_active:
+        # Monte Carlo sur le reste de la semaine (prevision.py), depuis l'état actuel des postes
+        with etape("prevision"): prev = moteur.prevision(LISTE_POSTES, debut_semaine, now, target, nb_realise)
+        titre_mode = "🔮 PRÉVISION FIN DE SEMAINE"
+        couleur_bandeau = "#9b59b6"
+        msg = f"🎯 {prev['proba']:.0%} de chances d'atteindre l'objectif 👉 {prev['p50']} pièces attendues (entre {prev['p10']} et {prev['p90']})"
+    else:
+        titre_mode = f"📍 PILOTAGE LIVE | {nom_shift_actuel}"
+        couleur_bandeau = "#2ecc71" if delta >= 0 else "#e74c3c"
+        msg = f"🚀 AVANCE : {delta:+.1f}" if delta >= 0 else f"🐢 RETARD : {delta:+.1f}"
+
+    st.title(titre_mode)
+    st.markdown(f"<div style='padding:10px;border-radius:5px;background-color:{couleur_bandeau};color:white;text-align:center;font-weight:bold;'>{msg}</div>", unsafe_allow_html=True)
+
+    if prevision_active:
+        st.write("")
+        st.subheader("🔮 SORTIES PRÉVUES PAR POSTE")
+        df_prev = prev["postes"].assign(
+            Sortie=[f"{JOURS_SEMAINE[d.weekday()]} {d:%H:%M}" if pd.notna(d) else "Semaine prochaine" for d in prev["postes"]["Sortie"]])
+        st.dataframe(
+            df_prev, 
+            use_container_width=True, 
+            hide_index=True,
+            column_config={
+                "Poste": st.column_config.TextColumn("📍 Poste", width="small"),
+                "Etape": st.column_config.TextColumn("🛠️ Étape", width="medium"),
+                "MSN": st.column_config.TextColumn("🔢 MSN", width="small"),
+                "Sortie": st.column_config.TextColumn("🕒 Sortie prévue", width="small"),
+                "Proba_sortie": st.column_config.ProgressColumn("✅ Sort cette semaine", format="%.0f %%", min_value=0, max_value=1),
+                "Pieces": st.column_config.NumberColumn("📦 Pièces d'ici vendredi", format="%.1f"),
+            }
+        )
+    else:
+        st.write("")
+        st.subheader("📋 ORDRE DE PASSAGE & EMPLACEMENTS")
+        col_serie, col_mip, col_rework = st.columns(3)
+        with col_serie: st.markdown("### 🟦 SÉRIE"); afficher_colonne_prio(df_consignes, "Série", "#3498db")
+        with col_mip: st.markdown("### 🟧 MIP"); afficher_colonne_prio(df_consignes, "MIP", "#e67e22")
+        with col_rework: st.markdown("### 🟥 REWORK"); afficher_colonne_prio(df_consignes, "Rework", "#c0392b")
+
+    st.divider()
+
+    k1, k2, k3, k4, k5 = st.columns(5)
+    k1.metric("🎯 Objectif", target)
+    k2.metric("📊 Réalisé", nb_realise)
+    k3.metric("🔴 Reworks", nb_rework)
+    k4.metric("🟠 MIPs", nb_mip)
+    k5.metric("🕒 Heure", now.strftime("%H:%M"))
+
+    st.subheader("📡 État des Postes (Live)")
+    with etape("etats_postes"): df_etats = moteur.etats_live(LISTE_POSTES, debut_semaine, now)
+    afficher_grille_postes(df_etats)
+
+afficher_pilotage_live(prevision_active)
 
 # ==============================================================================
 # 6. TABLEAU ANALYTIQUE EN BAS (UNIQUEMENT SI VERROU CHEF OUVERT)
@@ -620,9 +718,20 @@ if acces_chef_ok:
     st.divider()
     st.markdown("---")
     st.subheader("📊 ANALYSE PERFORMANCE (Accès Chef)")
-    
-    if not df.empty:
-        df_kpi = calculer_kpi_pannes(df)
+
+    # L'onglet Logs ne contient que la semaine en cours : les semaines closes sont
+    # chargées à la demande depuis leurs partitions d'archive
+    df_archives = safe_read(ONGLET_ARCHIVES, COLS_ARCHIVES)
+    semaines = st.multiselect("📚 Inclure les semaines archivées :", df_archives["Semaine"].tolist()[::-1]) if not df_archives.empty else []
+    df_analyse = df
+    if semaines:
+        onglets = df_archives[df_archives["Semaine"].isin(semaines)]["Onglet"].tolist()
+        with etape("charger_archives"): df_hist = charger_archives(config_stockage, tuple(onglets))
+        # Les événements reportés dans l'onglet actif sont aussi dans leur archive
+        if df_hist is not None: df_analyse = concat_logs([df_hist, df]).drop_duplicates(subset=COLS_LOGS, ignore_index=True)
+
+    if not df_analyse.empty:
+        with etape("calculer_kpi_pannes"): df_kpi = moteur.kpi_pannes(df_analyse)
         if not df_kpi.empty:
             total_pannes = len(df_kpi)
             total_attente = int(df_kpi['Attente (min)'].sum())
@@ -660,4 +769,80 @@ if acces_chef_ok:
     else:
         st.info("Pas encore de données.")
 
-timer_module.sleep(10); st.rerun()
+    # Pareto des causes : cube par (semaine, shift, poste, MAT, cause) tenu par le moteur,
+    # les Logs ne sont pas reparcourus. Mêmes semaines que l'historique ci-dessus.
+    st.markdown("#### 📉 Pareto des causes :")
+    with etape("cube_causes"):
+        cube = moteur.causes_semaine(get_start_of_week(), get_heure_fr())
+        if semaines: cube = pd.concat([moteur.causes_archives(tuple(onglets)), cube], ignore_index=True)
+    if cube.empty:
+        st.info("Aucune panne clôturée sur la période.")
+    else:
+        c1, c2 = st.columns([2, 1])
+        axe = c1.radio("Regrouper par :", ["Cause", "Zone", "Poste", "MAT"], horizontal=True, key="axe_pareto")
+        choix_mat = c2.selectbox("🔎 N° MAT", ["Tous"] + sorted(m for m in cube["MAT"].unique() if m), key="mat_pareto")
+        if choix_mat != "Tous": cube = cube[cube["MAT"] == choix_mat]
+        pareto = pareto_causes(cube, lire_pannes(), axe)
+        if axe == "MAT": pareto["MAT"] = pareto["MAT"].replace("", "Sans MAT")
+        # Rang en tête du libellé : le graphe garde l'ordre du Pareto
+        pareto["Libelle"] = [f"{i + 1:02d}. {v}" for i, v in enumerate(pareto[axe])]
+        st.bar_chart(pareto.set_index("Libelle")[["Attente_min", "Reglage_min"]].rename(columns={"Attente_min": "⏳ Attente", "Reglage_min": "🔧 Réglage"}))
+        st.dataframe(
+            pareto[[axe, "Nb", "Attente_min", "Reglage_min", "Total_min", "Cumul (%)"]],
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Nb": st.column_config.NumberColumn("🔢 Pannes", format="%d"),
+                "Attente_min": st.column_config.NumberColumn("⏳ Attente", format="%d min"),
+                "Reglage_min": st.column_config.NumberColumn("🔧 Réglage", format="%d min"),
+                "Total_min": st.column_config.NumberColumn("⏱️ Total", format="%d min"),
+                "Cumul (%)": st.column_config.ProgressColumn("📈 Cumul", format="%.0f %%", min_value=0, max_value=100),
+            }
+        )
+
+    # Production par shift : semaine en cours + semaines archivées choisies. Les shifts
+    # terminés sont agrégés une fois par le moteur, la page ne fait que les assembler.
+    st.markdown("#### 🕘 Production par shift :")
+    with etape("agregats_shifts"):
+        df_shifts = moteur.shifts_semaine(get_start_of_week(), get_heure_fr())
+        if semaines: df_shifts = pd.concat([moteur.shifts_archives(tuple(onglets)), df_shifts], ignore_index=True)
+    cadence_cible = lire_objectif() / 9.0
+    libelles = np.array([f"{i + 1}. {s[1]}" for i, s in enumerate(SHIFTS)])
+    df_shifts["Libelle"] = libelles[df_shifts["Shift"].to_numpy()]
+    df_shifts["Cadence (%)"] = (100 * df_shifts["Série"] / cadence_cible).round() if cadence_cible else 0
+    courbes = df_shifts.pivot_table(index="Libelle", columns=df_shifts["Semaine"].dt.strftime("Sem. du %d/%m"), values="Série", aggfunc="sum")
+    courbes["🎯 Cadence"] = cadence_cible
+    st.line_chart(courbes)
+    st.dataframe(
+        df_shifts.assign(Semaine=df_shifts["Semaine"].dt.strftime("%d/%m"))[["Semaine", "Libelle", "Série", "Rework", "MIP", "Cadence (%)", "Arret_min"]],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Semaine": st.column_config.TextColumn("📅 Semaine", width="small"),
+            "Libelle": st.column_config.TextColumn("🕘 Shift", width="small"),
+            "Cadence (%)": st.column_config.ProgressColumn("🎯 Cadence", format="%d %%", min_value=0, max_value=150),
+            "Arret_min": st.column_config.NumberColumn("🛑 Arrêts", format="%d min"),
+        }
+    )
+
+# ==============================================================================
+# 7. PROFILAGE (MODE ADMIN)
+# ==============================================================================
+@st.fragment(run_every=INTERVALLE_LIVE)
+def afficher_profilage():
+    derniers = [m for m in profileur.dernieres() if m["type"] == "rerun" and not m["interrompu"]]
+    if derniers:
+        dernier = derniers[-1]
+        st.caption(f"Dernier rerun complet : {dernier['total_ms']:.0f} ms — appels stockage : {sum(dernier['appels'].values())}")
+        st.bar_chart(pd.Series(dernier["etapes"], name="ms"))
+    st.caption("Latences sur le shift (8 h glissantes)")
+    st.dataframe(profileur.synthese(), use_container_width=True, hide_index=True)
+    st.caption("Appels au stockage depuis le démarrage du serveur")
+    st.dataframe(stockage.tableau(), use_container_width=True, hide_index=True)
+    st.download_button("📥 Export JSON lignes", data=profileur.export_jsonl(), file_name="profilage_reruns.jsonl", mime="application/x-ndjson")
+
+if st.session_state.mode_admin:
+    st.divider()
+    with st.expander("⏱️ PROFILAGE DES RERUNS", expanded=True): afficher_profilage()
+
+profileur.terminer(mesure_rerun)
@@ -0,0 +1,73 @@
+from collections import Counter
+import pandas as pd
+from stockage import projeter
+from donnees import parser_logs, concat_logs
+from calculs import debut_semaine_de
+
+# ==============================================================================
+# ARCHIVES : UNE PARTITION PAR SEMAINE CLOSE
+# ==============================================================================
+# L'onglet Logs ne garde que la semaine en cours (celle de get_start_of_week) : c'est
+# lui que lit le tableau de bord à chaque rerun. Les semaines closes partent dans un
+# onglet / une table "Logs_AAAA-MM-JJ" (lundi 6h30 de la semaine), répertorié dans
+# l'onglet "Archives". Elles ne sont relues qu'à la demande (analyse Chef).
+#
+# Quelques événements anciens restent dans l'onglet actif (en plus d'être archivés) :
+# ceux qui portent encore l'état courant (dernier événement de chaque poste, pièce
+# pas finie, MSN encore en consigne). Ils sont réexaminés à chaque rotation.
+# Une pièce est finie dès le DESETUP : le FIN qui suit est saisi sur "Aucun".
+
+ONGLET_ARCHIVES = "Archives"
+COLS_ARCHIVES = ["Semaine", "Onglet"]
+ETAPES_MSN_CLOSES = ["PHASE_DESETUP", "FIN", "INCIDENT_FINI"]
+
+def nom_partition(semaine):
+    return f"Logs_{semaine:%Y-%m-%d}"
+
+def _index_report(df, msn_a_garder):
+    # Lignes nécessaires pour reconstruire EtatPostes / IndexMSN depuis l'onglet actif seul
+    tri = df.sort_values("DateTime", kind="stable")
+    etapes = tri["Etape"]
+    index = set()
+    for masque in [slice(None), etapes != "APPEL_REGLAGE", ~etapes.str.contains("INCIDENT|APPEL")]:
+        index.update(tri[masque].groupby("Poste", observed=True).tail(1).index)
+    cles = tri["MSN_Display"].astype(str).str.strip()
+    derniers = tri.assign(_cle=cles).drop_duplicates("_cle", keep="last")
+    ouverts = ~derniers["Etape"].isin(ETAPES_MSN_CLOSES) | derniers["_cle"].isin(set(msn_a_garder))
+    index.update(derniers[ouverts].index)
+    return index
+
+def archiver_semaines_closes(stockage, cols, debut_semaine, msn_a_garder=(), worksheet="Logs"):
+    # Rejouable sans risque : une rotation interrompue puis relancée ne duplique rien
+    brut = projeter(stockage.read(worksheet), cols)
+    df = parser_logs(brut)
+    closes = df[df["DateTime"] < pd.Timestamp(debut_semaine)]
+    if closes.empty: return []
+    connues = set(projeter(stockage.read(ONGLET_ARCHIVES), COLS_ARCHIVES)["Onglet"])
+    onglets = []
+    for semaine, lot in closes.groupby(debut_semaine_de(closes["DateTime"])):
+        onglet = nom_partition(semaine)
+        lignes = brut.loc[lot.index]
+        if onglet in connues:
+            # Copie par copie : une ligne en double (double clic) doit l'être aussi dans l'archive
+            deja, garder = Counter(projeter(stockage.read(onglet), cols).itertuples(index=False, name=None)), []
+            for l in lignes.itertuples(index=False, name=None):
+                garder.append(deja[l] <= 0)
+                deja[l] -= 1
+            lignes = lignes[garder]
+        if not lignes.empty: stockage.append(onglet, lignes.values.tolist(), cols)
+        if onglet not in connues: stockage.append(ONGLET_ARCHIVES, [[f"{semaine:%Y-%m-%d}", onglet]], COLS_ARCHIVES)
+        onglets.append(onglet)
+    # Suppression conditionnelle : ce qui a été ajouté entre-temps à l'onglet actif reste.
+    # Par occurrence : si la ligne reportée a un double, seul le double part.
+    reportees = _index_report(closes, msn_a_garder)
+    a_retirer = brut.loc[[i for i in closes.index if i not in reportees]]
+    if not a_retirer.empty: stockage.delete_rows(worksheet, cols, cols, a_retirer.values.tolist(), par_occurrence=True)
+    return onglets
+
+def charger_partitions(stockage, cols, onglets):
+    # Lecture paresseuse des semaines archivées demandées (événements parsés, triables)
+    morceaux = [parser_logs(projeter(stockage.read(o), cols)) for o in onglets]
+    morceaux = [m for m in morceaux if not m.empty]
+    if not morceaux: return None
+    return concat_logs(morceaux)
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stockage import projeter, StockageSQLite
+from archives import archiver_semaines_closes, ETAPES_MSN_CLOSES
+from donnees import parser_logs, EtatPostes, IndexMSN, DureesEtapes, QuantileP2
+from calculs import (compter_pieces, get_info_msn, calculer_kpi_pannes, deviner_contexte_poste, agreger_shifts,
+                     etats_live_postes, cube_causes, MINUTES_SEMAINE)
+from prevision import ModelePrevision, SERIE
+from bench.generateur import generer, COLS_LOGS
+
+# ==============================================================================
+# BENCHMARKS DES FONCTIONS CHAUDES
+# ==============================================================================
+# Usage (depuis la racine du dépôt) :
+#   python -m bench.bench                    -> mesure + comparaison aux références
+#   python -m bench.bench --tailles S M      -> seulement certaines tailles
+#   python -m bench.bench --enregistrer      -> remplace les références (bench/baselines.json)
+# Code retour 1 si une fonction est plus lente que sa référence au-delà de la tolérance,
+# ou si une fonction optimisée ne rend plus le même résultat (voir VÉRIFICATIONS).
+# Les références dépendent de la machine : les réenregistrer en changeant de serveur.
+
+FICHIER_REFERENCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Taille "M" ~ notre volume actuel sur un trimestre, "XL" ~ 10x postes sur un an
+TAILLES = {
+    "S": dict(nb_postes=3, nb_semaines=1),
+    "M": dict(nb_postes=3, nb_semaines=12),
+    "L": dict(nb_postes=10, nb_semaines=26),
+    "XL": dict(nb_postes=30, nb_semaines=52),
+}
+TOLERANCE = 1.5
+BRUIT_MIN = 0.002   # en dessous de 2 ms d'écart, on ne parle pas de régression
+
+def chrono(fonction, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        t0 = time.perf_counter(); fonction(); durees.append(time.perf_counter() - t0)
+    return statistics.median(durees)
+
+def mesurer(taille, repetitions):
+    params = TAILLES[taille]
+    brut, consignes, _ = generer(**params)
+    debut = datetime(2025, 1, 6, 6, 30)
+    debut_semaine = debut + timedelta(weeks=params["nb_semaines"] - 1)
+
+    df = parser_logs(projeter(brut, COLS_LOGS))
+    etats = EtatPostes(); etats.appliquer(df)
+    index = IndexMSN(); index.appliquer(df)
+    postes = sorted(df["Poste"].unique())
+    liste_msn = consignes["MSN"].tolist()
+    modele = ModelePrevision(df)
+    durees = DureesEtapes(); durees.appliquer(df)
+
+    fonctions = {
+        # safe_read : projection des colonnes + parsing Date/Heure
+        "lecture_logs": lambda: parser_logs(projeter(brut, COLS_LOGS)),
+        "etat_postes": lambda: EtatPostes().appliquer(df),
+        "index_msn": lambda: IndexMSN().appliquer(df),
+        # Bandeau : groupby("SE_Unique").last() sur la semaine
+        "compter_pieces": lambda: compter_pieces(df, debut_semaine),
+        "get_info_msn": lambda: [get_info_msn(m, index) for m in liste_msn],
+        "calculer_kpi_pannes": lambda: calculer_kpi_pannes(df),
+        "deviner_contexte_poste": lambda: [deviner_contexte_poste(p, etats) for p in postes],
+        # Durées d'étapes : apprentissage complet (démarrage à froid), puis cartes postes
+        "durees_etapes": lambda: DureesEtapes().appliquer(df),
+        "etats_live": lambda: etats_live_postes(etats, durees, postes, debut_semaine, debut_semaine + timedelta(days=2, hours=3)),
+        # Graphe par shift : tout l'historique chargé (semaines archivées comprises)
+        "agreger_shifts": lambda: agreger_shifts(df),
+        # Pareto des causes : découpage d'Info_Sup et cube sur tout l'historique chargé
+        "cube_causes": lambda: cube_causes(df),
+        # Prévision : apprentissage sur tout l'historique, puis une semaine entière à simuler
+        "apprendre_prevision": lambda: ModelePrevision(df),
+        "simuler_semaine": lambda: modele.simuler([0] * len(postes), [SERIE] * len(postes), [0.0] * len(postes),
+                                                  [float("nan")] * len(postes), MINUTES_SEMAINE),
+    }
+    temps = {nom: round(chrono(f, repetitions), 6) for nom, f in fonctions.items()}
+    # Empreinte mémoire des Logs parsés, tels que gardés par CacheLogs
+    memoire = round(df.memory_usage(deep=True).sum() / 1e6, 2)
+    return {"lignes": len(brut), "consignes": len(liste_msn), "postes": len(postes), "memoire_mo": memoire, "temps": temps}
+
+# ==============================================================================
+# VÉRIFICATIONS (MÊMES RÉSULTATS QU'AVANT LES OPTIMISATIONS)
+# ==============================================================================
+# Une version plus rapide doit rendre exactement ce que rendait l'ancienne : on garde
+# l'ancienne implémentation ici comme référence. Code retour 1 si un résultat diffère.
+
+def _kpi_pannes_boucle(dataframe):
+    # calculer_kpi_pannes avant vectorisation : machine à états par poste (iterrows)
+    if dataframe.empty: return pd.DataFrame()
+    df_maint = dataframe[dataframe['Etape'].isin(['APPEL_REGLAGE', 'INCIDENT_EN_COURS', 'INCIDENT_FINI'])].sort_values('DateTime')
+    rapports = []
+    for poste in df_maint['Poste'].unique():
+        logs_poste = df_maint[df_maint['Poste'] == poste].sort_values('DateTime')
+        current_cycle = {}
+        for index, row in logs_poste.iterrows():
+            etape = row['Etape']
+            msn_brut = str(row['MSN_Display'])
+            msn_clean = msn_brut.replace("MSN-", "") if "MSN-" in msn_brut else msn_brut
+            if etape == 'APPEL_REGLAGE':
+                current_cycle = {'Poste': poste, 'MSN': msn_clean, 'Cause': row['Info_Sup'], 'Heure_Appel': row['DateTime'], 'Heure_Debut': None, 'Heure_Fin': None}
+            elif etape == 'INCIDENT_EN_COURS':
+                if not current_cycle:
+                    current_cycle = {'Poste': poste, 'MSN': msn_clean, 'Cause': row['Info_Sup'], 'Heure_Appel': row['DateTime'], 'Heure_Debut': row['DateTime'], 'Heure_Fin': None}
+                else:
+                    current_cycle['Heure_Debut'] = row['DateTime']
+            elif etape == 'INCIDENT_FINI':
+                if current_cycle and current_cycle.get('Heure_Debut'):
+                    current_cycle['Heure_Fin'] = row['DateTime']
+                    attente = (current_cycle['Heure_Debut'] - current_cycle['Heure_Appel']).total_seconds() / 60
+                    reglage = (current_cycle['Heure_Fin'] - current_cycle['Heure_Debut']).total_seconds() / 60
+                    rapports.append({
+                        "Date": current_cycle['Heure_Appel'].strftime("%d/%m"),
+                        "Heure": current_cycle['Heure_Appel'].strftime("%H:%M"),
+                        "Poste": poste,
+                        "MSN": current_cycle.get('MSN', '?'),
+                        "Cause": current_cycle['Cause'],
+                        "Attente (min)": int(attente),
+                        "Réglage (min)": int(reglage),
+                        "Total (min)": int(attente + reglage)
+                    })
+                    current_cycle = {}
+    return pd.DataFrame(rapports)
+
+def _lignes_triees(df):
+    # Comparaison indépendante de l'ordre des lignes et des dtypes
+    return sorted(tuple(str(v) for v in ligne) for ligne in df.itertuples(index=False, name=None))
+
+def verifier_kpi_pannes(graines=(0, 1, 2)):
+    # Cycles générés, puis 15 % des événements de maintenance retirés : appels sans
+    # prise en charge, FINI sans EN_COURS, arrêts sans appel... les cas tordus de l'atelier
+    echecs = []
+    for graine in graines:
+        brut, _, _ = generer(nb_postes=5, nb_semaines=2, taux_incident=0.2, taux_arret=0.05, graine=graine)
+        df = parser_logs(projeter(brut, COLS_LOGS))
+        rng = np.random.default_rng(graine)
+        maint = df["Etape"].isin(["APPEL_REGLAGE", "INCIDENT_EN_COURS", "INCIDENT_FINI"]).to_numpy()
+        df = df[~(maint & (rng.random(len(df)) < 0.15))].copy()
+        # Événements d'un poste à la même seconde : l'ancienne boucle les ordonnait au hasard
+        # (tri non stable), la nouvelle dans l'ordre de l'onglet -- on les écarte d'une seconde
+        df["DateTime"] += pd.to_timedelta(df.groupby(["Poste", "DateTime"], observed=True).cumcount(), unit="s")
+        attendu, obtenu = _kpi_pannes_boucle(df), calculer_kpi_pannes(df)
+        if list(obtenu.columns) != list(attendu.columns) or _lignes_triees(obtenu) != _lignes_triees(attendu):
+            echecs.append(f"calculer_kpi_pannes (graine {graine}) : {len(obtenu)} cycles, {len(attendu)} attendus par l'ancienne boucle")
+    return echecs
+
+TOLERANCE_P2 = 0.01   # écart relatif toléré entre l'estimateur P² et le centile exact
+
+def verifier_quantiles_p2(graines=(0, 1, 2), n=20000):
+    # DureesEtapes garde médiane et p90 par P² au lieu de toutes les durées : l'estimation
+    # doit rester à 1 % du centile exact, valeur par valeur comme après un démarrage par lot
+    echecs = []
+    for graine in graines:
+        rng = np.random.default_rng(graine)
+        lois = {"exponentielle": rng.exponential(10, n), "normale": rng.normal(30, 8, n), "log-normale": rng.lognormal(2.5, 0.6, n)}
+        for loi, valeurs in lois.items():
+            for p in (0.5, 0.9):
+                exact = float(np.quantile(valeurs, p))
+                un_par_un, par_lot = QuantileP2(p), QuantileP2(p)
+                for x in valeurs.tolist(): un_par_un.ajouter(x)
+                par_lot.ajouter_lot(valeurs[:n // 10])
+                for x in valeurs[n // 10:].tolist(): par_lot.ajouter(x)
+                for mode, estimateur in (("valeur par valeur", un_par_un), ("après un lot", par_lot)):
+                    ecart = abs(estimateur.valeur() - exact) / exact
+                    if ecart > TOLERANCE_P2:
+                        echecs.append(f"QuantileP2 p{p * 100:.0f} {loi} {mode} (graine {graine}) : {ecart:.2%} du centile exact")
+    return echecs
+
+def _etat(evt):
+    return None if evt is None else tuple(str(evt[c]) for c in ("DateTime", "Etape", "SE_Unique", "MSN_Display", "Info_Sup"))
+
+def verifier_rotation(graines=(0, 1, 2)):
+    # Rotation hebdomadaire avec des lignes en double (double clic) : l'archive garde chaque
+    # copie, et l'onglet actif seul redonne le même état des postes et des MSN en cours
+    echecs = []
+    for graine in graines:
+        brut, _, _ = generer(nb_postes=4, nb_semaines=2, graine=graine)
+        rng = np.random.default_rng(graine)
+        brut = brut.loc[np.sort(np.r_[brut.index, brut.index[rng.random(len(brut)) < 0.05]])].reset_index(drop=True)
+        # Et au moins un dernier événement de poste en double
+        dernier = brut.groupby("Poste").tail(1).index[0]
+        brut = pd.concat([brut, brut.loc[[dernier]]], ignore_index=True)
+        with tempfile.TemporaryDirectory() as dossier:
+            stockage = StockageSQLite(os.path.join(dossier, "rotation.db"))
+            fin = datetime(2025, 1, 6, 6, 30) + timedelta(weeks=2)
+            # Le double du dernier événement n'arrive qu'après une première rotation (saisie
+            # restée en file) : la ligne est déjà archivée une fois, elle doit l'être deux fois
+            stockage.append("Logs", brut.iloc[:-1].values.tolist(), COLS_LOGS)
+            archiver_semaines_closes(stockage, COLS_LOGS, fin)
+            stockage.append("Logs", brut.iloc[-1:].values.tolist(), COLS_LOGS)
+            for _ in range(2):   # rejouée : ne change plus rien
+                onglets = archiver_semaines_closes(stockage, COLS_LOGS, fin)
+            archive = Counter(t for o in onglets for t in projeter(stockage.read(o), COLS_LOGS).itertuples(index=False, name=None))
+            if archive != Counter(projeter(brut, COLS_LOGS).itertuples(index=False, name=None)):
+                echecs.append(f"archiver_semaines_closes (graine {graine}) : {sum(archive.values())} lignes archivées sur {len(brut)}")
+            tout, actif = parser_logs(projeter(brut, COLS_LOGS)), parser_logs(projeter(stockage.read("Logs"), COLS_LOGS))
+        postes_tout, postes_actif = EtatPostes(), EtatPostes()
+        postes_tout.appliquer(tout); postes_actif.appliquer(actif)
+        msn_tout, msn_actif = IndexMSN(), IndexMSN()
+        msn_tout.appliquer(tout); msn_actif.appliquer(actif)
+        ecarts = [p for p in postes_tout.postes
+                  if {c: _etat(e) for c, e in postes_tout.get(p).items()} != {c: _etat(e) for c, e in postes_actif.get(p).items()}]
+        ecarts += [m for m, e in msn_tout.msn.items()
+                   if e["Etape"] not in ETAPES_MSN_CLOSES and _etat(e) != _etat(msn_actif.get(m))]
+        if ecarts:
+            echecs.append(f"archiver_semaines_closes (graine {graine}) : état perdu dans l'onglet actif pour {', '.join(map(str, ecarts[:5]))}")
+    return echecs
+
+def verifier():
+    echecs = verifier_kpi_pannes() + verifier_quantiles_p2() + verifier_rotation()
+    print("\nVérifications : " + ("OK" if not echecs else f"{len(echecs)} échec(s)"))
+    for e in echecs: print(f"  {e}")
+    return echecs
+
+def comparer(resultats, references, tolerance):
+    regressions = []
+    for taille, res in resultats.items():
+        ref = references.get("tailles", {}).get(taille)
+        print(f"\n[{taille}] {res['lignes']} lignes, {res['postes']} postes, {res['consignes']} consignes, {res['memoire_mo']} Mo en mémoire")
+        for nom, t in res["temps"].items():
+            t_ref = ref["temps"].get(nom) if ref else None
+            if t_ref is None:
+                print(f"  {nom:<24}{t * 1000:>10.2f} ms")
+                continue
+            ratio = t / t_ref if t_ref else float("inf")
+            lent = t > t_ref * tolerance and t - t_ref > BRUIT_MIN
+            if lent: regressions.append((taille, nom, ratio))
+            print(f"  {nom:<24}{t * 1000:>10.2f} ms   réf {t_ref * 1000:>9.2f} ms   x{ratio:.2f}{'  <-- RÉGRESSION' if lent else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des fonctions chaudes du tableau de bord")
+    parser.add_argument("--tailles", nargs="+", choices=list(TAILLES), default=list(TAILLES))
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--enregistrer", action="store_true", help="enregistre les mesures comme nouvelles références")
+    args = parser.parse_args()
+
+    resultats = {t: mesurer(t, args.repetitions) for t in args.tailles}
+    references = {}
+    if os.path.exists(FICHIER_REFERENCES):
+        with open(FICHIER_REFERENCES, encoding="utf-8") as f: references = json.load(f)
+    regressions = comparer(resultats, references, args.tolerance)
+    echecs = verifier()
+
+    if args.enregistrer:
+        references.setdefault("tailles", {}).update(resultats)
+        references["machine"] = f"{platform.machine()} / {os.cpu_count()} CPU / Python {platform.python_version()} / pandas {pd.__version__}"
+        with open(FICHIER_REFERENCES, "w", encoding="utf-8") as f: json.dump(references, f, indent=2, ensure_ascii=False)
+        print(f"\nRéférences enregistrées dans {FICHIER_REFERENCES}")
+    elif regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de x{args.tolerance}")
+    if echecs or (regressions and not args.enregistrer): sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+from streamlit import config as config_streamlit, logger as logger_streamlit
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from bench import faux_gsheets
+from bench.generateur import generer
+from calculs import heure_fr, debut_semaine
+
+# ==============================================================================
+# TEST DE CHARGE : PLUSIEURS SESSIONS SUR App.py
+# ==============================================================================
+# Usage (depuis la racine du dépôt) :
+#   python -m bench.charge                                  -> 6 opérateurs, 2 régleurs, 1 chef, 1 RDZ, 60 s
+#   python -m bench.charge --operateurs 20 --latence 0.4    -> plus de sessions, Sheets plus lent
+#   python -m bench.charge --taux-erreur 0.1 --json r.json  -> écritures qui échouent, résultat en JSON
+# Chaque session est un AppTest (le script complet, comme un onglet de navigateur) qui
+# clique au rythme d'un vrai poste : l'opérateur enchaîne les étapes et appelle parfois
+# le régleur, le régleur prend en charge puis clôt les appels, le chef consulte ses
+# analyses, le RDZ ajoute des consignes. Toutes les sessions tournent dans ce process,
+# donc partagent un seul moteur, contre un faux Google Sheets en mémoire
+# (bench/faux_gsheets.py) qui compte les appels et ajoute de la latence.
+# Résultat : latence des reruns (p50 / p95 / p99 par rôle), appels au stockage par
+# minute, écritures perdues ou en double. Code retour 1 s'il en manque ou en trop, ou si
+# l'application a levé une exception ; les erreurs du banc lui-même sont listées à part.
+
+FICHIER_APP = os.path.join(RACINE, "App.py")
+PIN_REGLEUR, PIN_CHEF = "1234", "0000"   # codes en dur dans App.py
+DELAI_RERUN = 120                         # s avant qu'AppTest abandonne un rerun
+
+# Bouton -> étape écrite dans Logs (une ligne attendue par clic)
+ETAPE_BOUTON = {"🟡 DÉMARRER (Setup)": "PHASE_SETUP", "🔵 Bras": "STATION_BRAS", "🔵 Trk 1": "STATION_TRK1",
+                "🔵 Track 2": "STATION_TRK2", "🟣 Fin / Démont.": "PHASE_DESETUP", "✅ LIBÉRER (FINI)": "FIN",
+                "📢 SONNER RÉGLEUR": "APPEL_REGLAGE", "✅ ACCEPTER & DÉMARRER": "INCIDENT_EN_COURS",
+                "✅ FIN RÉGLAGE (Reprise)": "INCIDENT_FINI"}
+SEQUENCE_OPERATEUR = ["🔵 Bras", "🔵 Trk 1", "🔵 Track 2", "🟣 Fin / Démont.", "✅ LIBÉRER (FINI)"]
+TAUX_APPEL = 0.15      # probabilité qu'une action opérateur soit un appel régleur
+TAUX_CONSIGNE = 0.3    # probabilité qu'une action RDZ soit un ajout de consigne
+
+# --- AppTest en parallèle ---
+# AppTest est prévu pour un test à la fois : chaque run installe un faux Runtime global puis
+# l'efface en sortant (la session voisine, en plein rerun, perd alors le sien), et recompile
+# App.py (deux compilations simultanées font planter ast.parse en 3.11). On garde le dernier
+# Runtime installé et on compile le script une seule fois, comme le fait un vrai serveur.
+# De même, chaque run remplace config.get_option le temps du script pour y lire
+# global.appTest, puis remet celui qu'il a trouvé : entrelacés, un run peut tourner sans
+# l'option, ses widgets ne gardent pas leur format_func et tous les runs suivants de la
+# session lèvent un KeyError. L'option vaut donc True pour tout le process.
+_RUNTIME_COMMUN = []
+_BYTECODE, _VERROU_COMPILATION = {}, threading.Lock()
+_get_bytecode = ScriptCache.get_bytecode
+
+def _runtime_instance(cls):
+    if cls._instance is not None: _RUNTIME_COMMUN[:] = [cls._instance]
+    if not _RUNTIME_COMMUN: raise RuntimeError("Runtime hasn't been created!")
+    return _RUNTIME_COMMUN[0]
+
+def _bytecode_partage(self, chemin):
+    chemin = os.path.abspath(chemin)
+    with _VERROU_COMPILATION:
+        if chemin not in _BYTECODE: _BYTECODE[chemin] = _get_bytecode(self, chemin)
+    return _BYTECODE[chemin]
+
+def autoriser_apptest_paralleles():
+    Runtime.instance = classmethod(_runtime_instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(_RUNTIME_COMMUN))
+    ScriptCache.get_bytecode = _bytecode_partage
+    get_option = config_streamlit.get_option
+    config_streamlit.get_option = lambda cle: True if cle == "global.appTest" else get_option(cle)
+
+def preparer_entrepot(nb_postes, graine=0):
+    # Semaine en cours jusqu'à maintenant, au format exact des onglets
+    maintenant = heure_fr()
+    logs, consignes, pannes = generer(nb_postes=nb_postes, nb_semaines=1, debut=debut_semaine(maintenant), graine=graine)
+    logs = logs[pd.to_datetime(logs["Date"] + " " + logs["Heure"]) <= maintenant]
+    entrepot = faux_gsheets.ENTREPOT
+    entrepot.remplacer("Logs", logs)
+    entrepot.remplacer("Consignes", consignes)
+    entrepot.remplacer("Pannes", pannes)
+    entrepot.remplacer("Postes", pd.DataFrame({"Poste": [f"Poste_{i + 1:02d}" for i in range(nb_postes)], "Cellule": "Atelier"}))
+    entrepot.remplacer("Objectif", pd.DataFrame({"Valeur": [nb_postes * 12]}))
+
+def _widget(liste, label):
+    return next((w for w in liste if w.label == label), None)
+
+def _widget_par_cle(liste, cle):
+    # Sur l'arbre du dernier run, et seulement si AppTest sait encore en lire l'état
+    # (sinon set_value puis run lèveraient un KeyError) : absent -> action sautée
+    try:
+        w = liste(key=cle); w._widget_state
+        return w
+    except KeyError: return None
+
+class Session:
+    def __init__(self, role, numero, postes, pause, graine, resultats):
+        self.role, self.numero, self.postes, self.pause = role, numero, postes, pause
+        self.rng = random.Random(graine)
+        self.resultats = resultats
+        self.at = AppTest.from_file(FICHIER_APP, default_timeout=DELAI_RERUN)
+        self.curseur = len(SEQUENCE_OPERATEUR) - 2   # état inconnu au départ : on libère d'abord
+        self.nb_actions = 0
+
+    def rerun(self):
+        t0 = time.perf_counter()
+        try: self.at.run()
+        except Exception as e:
+            self.resultats.erreur_banc(self.role, repr(e)); return
+        self.resultats.rerun(self.role, (time.perf_counter() - t0) * 1000)
+        for e in self.at.exception: self.resultats.erreur(self.role, e.message)
+
+    def choisir(self, liste, label, valeur, cle=None):
+        w = _widget(liste, label) if cle is None else _widget_par_cle(liste, cle)
+        if w is None: return False
+        w.set_value(valeur); self.rerun()
+        return True
+
+    def cliquer(self, label, poste=None):
+        bouton = _widget(self.at.button, label)
+        if bouton is None or bouton.disabled: return False
+        bouton.click(); self.rerun()
+        # Refus légitime (MSN pris par un autre poste entre l'affichage et le clic) : rien d'attendu
+        if label == "🟡 DÉMARRER (Setup)" and any("STOP !" in e.value for e in self.at.error): return False
+        if label in ETAPE_BOUTON: self.resultats.attendre("Logs", (poste, ETAPE_BOUTON[label]))
+        return True
+
+    def connecter(self):
+        self.rerun()
+        self.choisir(self.at.sidebar.selectbox, "👤 Qui êtes-vous ?", self.role)
+        pin = {"Régleur": ("🔑 Code PIN Régleur", PIN_REGLEUR), "Chef d'Équipe": ("🔑 Code PIN Chef", PIN_CHEF),
+               "RDZ (Responsable)": ("🔑 Code PIN RDZ", PIN_CHEF)}.get(self.role)
+        if pin: self.choisir(self.at.sidebar.text_input, *pin)
+        if self.role == "Opérateur": self.choisir(self.at.sidebar.selectbox, "📍 Poste concerné", self.postes[0])
+
+    def agir(self):
+        self.nb_actions += 1
+        getattr(self, {"Opérateur": "agir_operateur", "Régleur": "agir_regleur",
+                       "Chef d'Équipe": "agir_chef", "RDZ (Responsable)": "agir_rdz"}[self.role])()
+
+    def agir_operateur(self):
+        poste = self.postes[0]
+        if self.cliquer("🟡 DÉMARRER (Setup)", poste): self.curseur = -1; return
+        msn = _widget(self.at.sidebar.selectbox, "Sélection MSN")
+        if msn is not None:
+            # Poste libre mais MSN déjà pris ailleurs : on en prend un autre
+            self.choisir(self.at.sidebar.selectbox, "Sélection MSN", self.rng.choice(msn.options)); return
+        if _widget(self.at.button, "🔵 Bras") is None: self.rerun(); return   # appel en attente du régleur
+        if self.rng.random() < TAUX_APPEL:
+            # L'expander d'appel ne se construit qu'ouvert : ouverture (un rerun), choix, puis clic
+            self.at.session_state[f"appel_{poste}"] = True; self.rerun()
+            raisons = _widget(self.at.multiselect, "Quels réglages ?")
+            if raisons is None or not raisons.options: return
+            raisons.set_value([self.rng.choice(raisons.options)]); self.at.session_state[f"appel_{poste}"] = True
+            self.cliquer("📢 SONNER RÉGLEUR", poste); return
+        suivant = SEQUENCE_OPERATEUR[(self.curseur + 1) % len(SEQUENCE_OPERATEUR)]
+        if self.cliquer(suivant, poste): self.curseur = SEQUENCE_OPERATEUR.index(suivant)
+        else: self.rerun()
+
+    def agir_regleur(self):
+        # Tour des postes qui lui sont confiés : prise en charge des appels, puis reprise
+        poste = self.postes[self.nb_actions % len(self.postes)]
+        if not self.choisir(self.at.sidebar.selectbox, "📍 Poste concerné", poste): self.rerun(); return
+        if not self.cliquer("✅ ACCEPTER & DÉMARRER", poste): self.cliquer("✅ FIN RÉGLAGE (Reprise)", poste)
+
+    def agir_chef(self):
+        choix = self.rng.random()
+        if choix < 0.3: self.choisir(self.at.sidebar.checkbox, "🔮 Prévision fin de semaine", self.rng.random() < 0.5)
+        elif choix < 0.6: self.choisir(self.at.radio, "Regrouper par :", self.rng.choice(["Cause", "Zone", "Poste", "MAT"]), cle="axe_pareto")
+        else: self.rerun()
+
+    def agir_rdz(self):
+        numero, emplacement = _widget(self.at.sidebar.text_input, "Numéro MSN"), _widget(self.at.sidebar.text_input, "📍 Emplacement")
+        if numero is None or self.rng.random() >= TAUX_CONSIGNE: self.rerun(); return
+        msn = f"{900000 + self.numero * 10000 + self.nb_actions}"
+        numero.set_value(msn); emplacement.set_value("Charge")
+        if self.cliquer("Ajouter"): self.resultats.attendre("Consignes", f"MSN-{msn}")
+
+    def jouer(self, fin):
+        try:
+            self.connecter()
+            while time.monotonic() < fin:
+                self.agir()
+                time.sleep(self.pause * self.rng.uniform(0.5, 1.5))
+        except Exception as e:
+            self.resultats.erreur_banc(self.role, repr(e))
+
+class Resultats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latences = {}            # rôle -> [ms]
+        self.erreurs = Counter()      # (rôle, message) : exceptions de l'application (at.exception)
+        self.erreurs_banc = Counter() # (rôle, message) : échecs du pilotage AppTest lui-même
+        self.attendues = {"Logs": Counter(), "Consignes": Counter()}
+
+    def rerun(self, role, ms):
+        with self._lock: self.latences.setdefault(role, []).append(ms)
+
+    def erreur(self, role, message):
+        with self._lock: self.erreurs[(role, str(message)[:200])] += 1
+
+    def erreur_banc(self, role, message):
+        with self._lock: self.erreurs_banc[(role, str(message)[:200])] += 1
+
+    def attendre(self, onglet, cle):
+        with self._lock: self.attendues[onglet][cle] += 1
+
+def recues(depart):
+    # Lignes arrivées dans le faux Sheets depuis le début du test, par clé comparable
+    logs = faux_gsheets.ENTREPOT.lire("Logs").iloc[depart["Logs"]:]
+    consignes = faux_gsheets.ENTREPOT.lire("Consignes").iloc[depart["Consignes"]:]
+    return {"Logs": Counter(zip(logs["Poste"], logs["Etape"])), "Consignes": Counter(consignes["MSN"])}
+
+def bilan_ecritures(attendues, depart, attente):
+    # La file d'écritures se vide en fond : on attend que tout soit arrivé (ou `attente` s)
+    fin = time.monotonic() + attente
+    while True:
+        recu = recues(depart)
+        if all(not (attendues[o] - recu[o]) for o in attendues) or time.monotonic() > fin: break
+        time.sleep(0.5)
+    return {o: {"attendues": sum(attendues[o].values()), "recues": sum(recu[o].values()),
+                "perdues": sum((attendues[o] - recu[o]).values()), "en_double": sum((recu[o] - attendues[o]).values())}
+            for o in attendues}
+
+def percentiles(valeurs):
+    v = np.asarray(valeurs)
+    return {"n": len(v), "p50": round(float(np.percentile(v, 50)), 1), "p95": round(float(np.percentile(v, 95)), 1),
+            "p99": round(float(np.percentile(v, 99)), 1), "max": round(float(v.max()), 1)}
+
+def lancer(operateurs=6, regleurs=2, chefs=1, rdz=1, duree=60.0, pause=1.0, latence=0.2, taux_erreur=0.0,
+           attente=60.0, graine=0):
+    # Process neuf : le moteur (cache_resource) est créé par la première session, contre le faux Sheets
+    dossier = tempfile.mkdtemp(prefix="charge_")
+    os.environ.update(STOCKAGE_BACKEND="gsheets", INSTANTANE_LOGS=os.path.join(dossier, "instantane.pkl"),
+                      JOURNAL_ECRITURES=os.path.join(dossier, "journal.db"))
+    sys.modules["st_gsheets_connection"] = faux_gsheets
+    autoriser_apptest_paralleles()
+    nb_postes = max(operateurs, 3)
+    preparer_entrepot(nb_postes, graine)
+    entrepot = faux_gsheets.ENTREPOT
+    depart = {o: entrepot.nb_lignes(o) for o in ["Logs", "Consignes"]}
+
+    # Démarrage à froid (lecture initiale des onglets) hors mesure, sans latence
+    AppTest.from_file(FICHIER_APP, default_timeout=DELAI_RERUN).run()
+    entrepot.configurer(latence=latence, taux_erreur=taux_erreur, graine=graine)
+    entrepot.appels = {}
+
+    postes = [f"Poste_{i + 1:02d}" for i in range(nb_postes)]
+    resultats = Resultats()
+    sessions = [Session("Opérateur", i, [postes[i]], pause, graine + i, resultats) for i in range(operateurs)]
+    # Chaque régleur a ses postes : deux régleurs ne prennent pas le même appel
+    sessions += [Session("Régleur", i, postes[i::regleurs], pause, graine + 100 + i, resultats) for i in range(regleurs)]
+    sessions += [Session("Chef d'Équipe", i, postes, pause * 3, graine + 200 + i, resultats) for i in range(chefs)]
+    sessions += [Session("RDZ (Responsable)", i, postes, pause * 3, graine + 300 + i, resultats) for i in range(rdz)]
+
+    t0 = time.monotonic()
+    fils = [threading.Thread(target=s.jouer, args=(t0 + duree,), daemon=True) for s in sessions]
+    for f in fils: f.start()
+    for f in fils: f.join()
+    minutes = (time.monotonic() - t0) / 60
+    appels = dict(entrepot.appels)
+    # Après la fin des sessions : plus d'erreurs simulées, la file finit de se vider
+    entrepot.configurer(latence=latence)
+    ecritures = bilan_ecritures(resultats.attendues, depart, attente)
+
+    toutes = [ms for v in resultats.latences.values() for ms in v]
+    return {
+        "parametres": {"operateurs": operateurs, "regleurs": regleurs, "chefs": chefs, "rdz": rdz, "duree_s": duree,
+                       "pause_s": pause, "latence_s": latence, "taux_erreur": taux_erreur},
+        "reruns": dict({r: percentiles(v) for r, v in resultats.latences.items()}, **({"Tous": percentiles(toutes)} if toutes else {})),
+        "appels_par_minute": {op: round(n / minutes, 1) for op, n in sorted(appels.items())},
+        "erreurs_simulees": entrepot.nb_erreurs,
+        "ecritures": ecritures,
+        "exceptions": [{"role": r, "message": m, "n": n} for (r, m), n in resultats.erreurs.most_common()],
+        "erreurs_banc": [{"role": r, "message": m, "n": n} for (r, m), n in resultats.erreurs_banc.most_common()],
+    }
+
+def afficher(resultat):
+    p = resultat["parametres"]
+    print(f"{p['operateurs']} opérateurs, {p['regleurs']} régleurs, {p['chefs']} chef(s), {p['rdz']} RDZ pendant {p['duree_s']:.0f} s"
+          f" — latence Sheets {p['latence_s'] * 1000:.0f} ms, erreurs {p['taux_erreur']:.0%}")
+    print(f"\n{'Reruns (ms)':<22}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for role, s in resultat["reruns"].items():
+        print(f"  {role:<20}{s['n']:>6}{s['p50']:>10.0f}{s['p95']:>10.0f}{s['p99']:>10.0f}{s['max']:>10.0f}")
+    print("\nAppels au stockage (par minute)")
+    for op, n in resultat["appels_par_minute"].items(): print(f"  {op:<20}{n:>8.1f}")
+    print(f"\nÉcritures ({resultat['erreurs_simulees']} erreur(s) simulée(s))")
+    for onglet, e in resultat["ecritures"].items():
+        print(f"  {onglet:<20}attendues {e['attendues']:>5}   reçues {e['recues']:>5}   perdues {e['perdues']:>3}   en double {e['en_double']:>3}")
+    if resultat["exceptions"]:
+        print("\nExceptions")
+        for e in resultat["exceptions"][:10]: print(f"  {e['role']:<20}x{e['n']:<4} {e['message']}")
+    if resultat["erreurs_banc"]:
+        print("\nErreurs du banc (pilotage AppTest, pas l'application)")
+        for e in resultat["erreurs_banc"][:10]: print(f"  {e['role']:<20}x{e['n']:<4} {e['message']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge multi-sessions de App.py contre un faux Google Sheets")
+    parser.add_argument("--operateurs", type=int, default=6)
+    parser.add_argument("--regleurs", type=int, default=2)
+    parser.add_argument("--chefs", type=int, default=1)
+    parser.add_argument("--rdz", type=int, default=1)
+    parser.add_argument("--duree", type=float, default=60.0, help="s de clics par session")
+    parser.add_argument("--pause", type=float, default=1.0, help="s moyennes entre deux actions d'un opérateur")
+    parser.add_argument("--latence", type=float, default=0.2, help="s par appel au faux Sheets (± 50 %%)")
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="part des écritures qui échouent")
+    parser.add_argument("--attente", type=float, default=60.0, help="s max pour que la file d'écritures se vide")
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--json", help="écrit aussi le résultat dans ce fichier")
+    args = parser.parse_args()
+
+    # AppTest hors serveur : avertissements sans intérêt ici. La config est lue d'abord,
+    # sinon sa lecture remet le niveau par défaut au premier run.
+    config_streamlit.get_option("logger.level"); logger_streamlit.set_log_level("error")
+
+    resultat = lancer(args.operateurs, args.regleurs, args.chefs, args.rdz, args.duree, args.pause,
+                      args.latence, args.taux_erreur, args.attente, args.graine)
+    afficher(resultat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(resultat, f, ensure_ascii=False, indent=2)
+    ecarts = sum(e["perdues"] + e["en_double"] for e in resultat["ecritures"].values())
+    sys.exit(1 if ecarts or resultat["exceptions"] else 0)
+
+if __name__ == "__main__":
+    main()
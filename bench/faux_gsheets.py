@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+import pandas as pd
+from streamlit.connections import BaseConnection
+from stockage import WorksheetNotFound
+
+# ==============================================================================
+# FAUX GOOGLE SHEETS (EN MÉMOIRE, POUR LE TEST DE CHARGE)
+# ==============================================================================
+# Remplace le module st_gsheets_connection le temps d'un test (voir bench/charge.py) :
+# App.py tourne sans changement, mais ses onglets vivent dans ENTREPOT. Chaque appel
+# est compté et attend une latence tirée au hasard (comme un aller-retour vers l'API).
+# Les écritures peuvent échouer à un taux donné ; une partie de ces échecs arrive
+# après l'écriture (délai dépassé alors que Sheets a bien reçu la ligne).
+
+class Entrepot:
+    def __init__(self):
+        self.onglets = {}    # nom -> DataFrame (en-tête = colonnes, cellules en texte)
+        self.appels = {}     # opération -> nombre d'appels
+        self.latence = 0.0   # s par appel, ± 50 %
+        self.taux_erreur = 0.0
+        self.part_ambigue = 0.5
+        self.nb_erreurs = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+    def configurer(self, latence=0.0, taux_erreur=0.0, part_ambigue=0.5, graine=0):
+        self.latence, self.taux_erreur, self.part_ambigue = latence, taux_erreur, part_ambigue
+        self._rng = random.Random(graine)
+
+    def _appel(self, operation):
+        with self._lock:
+            self.appels[operation] = self.appels.get(operation, 0) + 1
+            attente = self.latence * self._rng.uniform(0.5, 1.5)
+        # Hors verrou : les appels de plusieurs sessions se chevauchent, comme sur l'API
+        if attente: time.sleep(attente)
+
+    def _ecrire(self, operation, ecriture):
+        self._appel(operation)
+        with self._lock:
+            echec = self._rng.random() < self.taux_erreur
+            apres = echec and self._rng.random() < self.part_ambigue
+            if echec: self.nb_erreurs += 1
+            if not echec or apres: ecriture()
+        if echec: raise ConnectionError(f"{operation} : erreur simulée" + (" (écriture faite)" if apres else ""))
+
+    def lire(self, onglet):
+        with self._lock:
+            if onglet not in self.onglets: raise WorksheetNotFound(onglet)
+            return self.onglets[onglet].copy()
+
+    def remplacer(self, onglet, df):
+        with self._lock: self.onglets[onglet] = df.astype(str).reset_index(drop=True)
+
+    def nb_lignes(self, onglet):
+        with self._lock: return len(self.onglets.get(onglet, ()))
+
+ENTREPOT = Entrepot()
+
+class _Feuille:
+    # Sous-ensemble de gspread.Worksheet utilisé par StockageGSheets
+    def __init__(self, nom): self.nom = nom
+
+    def row_values(self, i):
+        ENTREPOT._appel("row_values")
+        with ENTREPOT._lock:
+            df = ENTREPOT.onglets.get(self.nom)
+            return [] if df is None else list(df.columns)
+
+    def append_rows(self, values, **kwargs):
+        def ecriture():
+            df = ENTREPOT.onglets.get(self.nom)
+            if df is None or df.columns.empty: ENTREPOT.onglets[self.nom] = pd.DataFrame(values[1:], columns=values[0])
+            else: ENTREPOT.onglets[self.nom] = pd.concat([df, pd.DataFrame(values, columns=df.columns)], ignore_index=True)
+        ENTREPOT._ecrire("append_rows", ecriture)
+
+    def get_values(self, plage):
+        ENTREPOT._appel("get_values")
+        debut = int(plage.split(":")[0][1:]) - 2
+        with ENTREPOT._lock:
+            df = ENTREPOT.onglets.get(self.nom)
+            return [] if df is None else df.iloc[debut:].fillna("").astype(str).values.tolist()
+
+class _Client:
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        with ENTREPOT._lock:
+            if worksheet not in ENTREPOT.onglets: raise WorksheetNotFound(worksheet)
+        return _Feuille(worksheet)
+
+class GSheetsConnection(BaseConnection):
+    def _connect(self, **kwargs): return _Client()
+
+    @property
+    def client(self): return self._instance
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        ENTREPOT._appel("read")
+        return ENTREPOT.lire(worksheet)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        with ENTREPOT._lock:
+            if worksheet not in ENTREPOT.onglets: raise WorksheetNotFound(worksheet)
+        ENTREPOT._ecrire("update", lambda: ENTREPOT.onglets.__setitem__(worksheet, data.astype(str).reset_index(drop=True)))
+
+    def create(self, worksheet=None, data=None, **kwargs):
+        ENTREPOT._ecrire("create", lambda: ENTREPOT.onglets.__setitem__(worksheet, data.astype(str).reset_index(drop=True)))
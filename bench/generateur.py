@@ -0,0 +1,92 @@
+import random
+from datetime import datetime, timedelta
+import pandas as pd
+
+# ==============================================================================
+# GÉNÉRATEUR DE DONNÉES ATELIER (LOGS / CONSIGNES / PANNES)
+# ==============================================================================
+# Produit des onglets au format exact de l'application (texte, comme relu depuis Sheets) :
+# chaque poste enchaîne des pièces selon les vraies séquences d'étapes de la sidebar,
+# uniquement pendant les shifts, avec appels régleur et arrêts manuels aléatoires.
+
+COLS_LOGS = ["Date", "Heure", "Poste", "SE_Unique", "MSN_Display", "Etape", "Info_Sup"]
+COLS_CONSIGNES = ["Type", "MSN", "Poste", "Emplacement"]
+COLS_PANNES = ["Zone", "Nom"]
+
+PANNES_DEFAUT = [["GAUCHE", "🔧 Capot Gauche (ST1)"], ["GAUCHE", "🔧 PAF"],
+                 ["DROIT", "🔧 Capot Droit (ST2)"], ["GENERIC", "⚠️ SO3 - Pipes"]]
+
+# Étapes opérateur d'une pièce et durée moyenne (min) passée avant l'étape suivante
+SEQUENCE = [("PHASE_SETUP", 35), ("STATION_BRAS", 35), ("STATION_TRK1", 90), ("STATION_TRK2", 60), ("PHASE_DESETUP", 25)]
+# Zone des réglages proposés à l'opérateur selon l'étape (cf. deviner_contexte_poste)
+ZONE_ETAPE = {"PHASE_SETUP": "GAUCHE", "STATION_BRAS": "GAUCHE", "STATION_TRK1": "GAUCHE", "STATION_TRK2": "DROIT"}
+PREFIXES = {"Série": "S", "Rework": "R", "MIP": "M"}
+
+def plages_shifts(debut, nb_semaines):
+    # Lundi-jeudi 6h30 -> 0h09 (matin + soir), vendredi 6h30 -> 15h50, comme get_current_shift_info
+    for s in range(nb_semaines):
+        lundi = debut + timedelta(weeks=s)
+        for j in range(5):
+            jour = lundi + timedelta(days=j)
+            fin = jour + (timedelta(hours=17, minutes=39) if j < 4 else timedelta(hours=9, minutes=20))
+            yield jour, fin
+
+def _panne(pannes, zone, rng):
+    choix = [p for z, p in pannes if z in (zone, "GENERIC")] or [p for _, p in pannes]
+    raisons = " + ".join(rng.sample(choix, k=min(len(choix), rng.choice([1, 1, 1, 2]))))
+    return f"[MAT:{rng.randint(1000, 9999)}] {raisons}" if rng.random() < 0.3 else raisons
+
+def generer(nb_postes=3, nb_semaines=1, mix=(0.6, 0.2, 0.2), taux_incident=0.08, taux_arret=0.02,
+            nb_consignes=None, debut=None, graine=0):
+    rng = random.Random(graine)
+    # Par défaut : une date fixe (lundi 6h30) pour des jeux de données reproductibles
+    if debut is None: debut = datetime(2025, 1, 6, 6, 30)
+    postes = [f"Poste_{i + 1:02d}" for i in range(nb_postes)]
+    pannes = PANNES_DEFAUT + [[z, f"🔧 Réglage {z.title()} {i}"] for i, z in enumerate(["GAUCHE", "DROIT"] * 4)]
+    types = list(PREFIXES)
+    lignes = []
+    prochain_msn = [100]
+
+    def evt(t, poste, se, msn, etape, info=""):
+        lignes.append((t, poste, se, msn, etape, info))
+
+    for poste in postes:
+        t = debut
+        for ouverture, fermeture in plages_shifts(debut, nb_semaines):
+            # Une pièce commencée tard peut déborder : le poste reprend après elle
+            t = max(t, ouverture + timedelta(minutes=rng.randint(0, 20)))
+            while t < fermeture:
+                type_piece = rng.choices(types, weights=mix)[0]
+                prochain_msn[0] += 1
+                msn = f"MSN-{prochain_msn[0]}"
+                se = f"{PREFIXES[type_piece]}-SE-{msn}"
+                for etape, duree in SEQUENCE:
+                    evt(t, poste, se, msn, etape)
+                    t += timedelta(minutes=max(1, rng.gauss(duree, duree * 0.25)))
+                    if rng.random() < taux_incident:
+                        # Appel opérateur -> prise en charge régleur -> reprise
+                        info = _panne(pannes, ZONE_ETAPE.get(etape, "GENERIC"), rng)
+                        evt(t, poste, se, msn, "APPEL_REGLAGE", info)
+                        t += timedelta(minutes=rng.expovariate(1 / 12))
+                        evt(t, poste, "MAINTENANCE", "System", "INCIDENT_EN_COURS", info)
+                        t += timedelta(minutes=rng.expovariate(1 / 10))
+                        evt(t, poste, "MAINTENANCE", "System", "INCIDENT_FINI", "Reprise")
+                    elif rng.random() < taux_arret:
+                        # Arrêt manuel par le régleur, sans appel
+                        evt(t, poste, "MAINTENANCE", "System", "INCIDENT_EN_COURS", _panne(pannes, "GENERIC", rng))
+                        t += timedelta(minutes=rng.expovariate(1 / 8))
+                        evt(t, poste, "MAINTENANCE", "System", "INCIDENT_FINI", "Reprise")
+                evt(t, poste, "Aucun", "Aucun", "FIN")
+                t += timedelta(minutes=rng.randint(2, 15))
+
+    # L'onglet est rempli dans l'ordre des saisies, tous postes confondus
+    lignes.sort(key=lambda l: l[0])
+    logs = pd.DataFrame([(t.strftime("%Y-%m-%d"), t.strftime("%H:%M:%S"), *reste) for t, *reste in lignes], columns=COLS_LOGS)
+
+    # Consignes : moitié de pièces déjà passées (statut Fini / En cours), moitié de MSN à venir
+    if nb_consignes is None: nb_consignes = nb_postes * 10
+    passes = rng.sample(range(101, prochain_msn[0] + 1), k=min(nb_consignes // 2, prochain_msn[0] - 100))
+    a_venir = range(prochain_msn[0] + 1, prochain_msn[0] + 1 + nb_consignes - len(passes))
+    consignes = pd.DataFrame([[rng.choices(types, weights=mix)[0], f"MSN-{m}", "Indifférent", f"Étagère {rng.randint(1, 20)}"]
+                              for m in list(passes) + list(a_venir)], columns=COLS_CONSIGNES)
+    return logs, consignes, pd.DataFrame(pannes, columns=COLS_PANNES)
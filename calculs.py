@@ -0,0 +1,337 @@
+from datetime import datetime, timedelta, time
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# CALCULS MÉTIER (SANS STREAMLIT)
+# ==============================================================================
+# Fonctions pures sur les Logs parsés et le calendrier : utilisées par le moteur
+# (moteur.py) et par les benchmarks (bench/), sans lancer l'application.
+
+mapping_etapes = {"PHASE_SETUP": 5, "STATION_BRAS": 15, "STATION_TRK1": 30, "STATION_TRK2": 65, "PHASE_RAPPORT": 90, "PHASE_DESETUP": 95, "FIN": 100}
+TEMPS_RESTANT = { "PHASE_SETUP": 245, "STATION_BRAS": 210, "STATION_TRK1": 175, "STATION_TRK2": 85, "PHASE_RAPPORT": 45, "PHASE_DESETUP": 25, "FIN": 0 }
+ETAPES_PROD = list(mapping_etapes)
+# Enchaînement des étapes d'une pièce dans la sidebar opérateur (FIN -> pièce suivante)
+ETAPE_SUIVANTE = {"PHASE_SETUP": "STATION_BRAS", "STATION_BRAS": "STATION_TRK1", "STATION_TRK1": "STATION_TRK2",
+                  "STATION_TRK2": "PHASE_DESETUP", "PHASE_RAPPORT": "PHASE_DESETUP", "PHASE_DESETUP": "FIN",
+                  "FIN": "PHASE_SETUP"}
+TYPES_PREFIXE = {"S": "Série", "R": "Rework", "M": "MIP"}
+
+DTYPE_TYPE = pd.CategoricalDtype(["Série", "Rework", "MIP", "Autre", "Inconnu"])
+
+def types_se(se):
+    # Type de pièce d'après la 1re lettre du SE_Unique (vide / absent -> Inconnu), en colonne :
+    # calculé sur les quelques préfixes distincts puis redistribué ligne à ligne par code
+    prefixe = se.astype("string").str[:1].str.upper().astype("category")
+    noms = [TYPES_PREFIXE.get(p, "Autre" if p else "Inconnu") for p in prefixe.cat.categories] + ["Inconnu"]
+    codes = np.array([DTYPE_TYPE.categories.get_loc(n) for n in noms])
+    return pd.Series(pd.Categorical.from_codes(codes[prefixe.cat.codes.to_numpy()], dtype=DTYPE_TYPE), index=se.index)
+
+# ==============================================================================
+# CALENDRIER DES SHIFTS
+# ==============================================================================
+# Semaine : lundi 6h30 -> lundi suivant 6h30. 9 shifts : matin + soir du lundi au jeudi,
+# matin seul le vendredi. Les horodatages se découpent en colonnes (calendrier_shifts) :
+# le shift en cours, le bandeau et les agrégats par shift partagent la même table.
+
+DEBUT_SEMAINE = pd.Timedelta(hours=6, minutes=30)
+
+def _shift(jour, nom, libelle, debut, fin):
+    return (nom, libelle, pd.Timedelta(days=jour) + pd.Timedelta(debut), pd.Timedelta(days=jour) + pd.Timedelta(fin))
+
+# (nom affiché, libellé court, début, fin) depuis lundi 0h ; le soir va jusqu'à 00h09 comprise
+SHIFTS = [s for j, jour in enumerate(["Lun", "Mar", "Mer", "Jeu"])
+          for s in (_shift(j, "🌅 Shift Matin", f"{jour} matin", "6h30m", "14h50m"),
+                    _shift(j, "🌙 Shift Soir", f"{jour} soir", "14h50m", "24h10m"))]
+SHIFTS.append(_shift(4, "🌅 Shift Matin (Vendredi)", "Ven matin", "6h30m", "15h50m"))
+NB_SHIFTS = len(SHIFTS)
+_DEBUTS_SHIFTS = np.array([s[2].to_timedelta64() for s in SHIFTS])
+_FINS_SHIFTS = np.array([s[3].to_timedelta64() for s in SHIFTS])
+
+def heure_fr():
+    return datetime.utcnow() + timedelta(hours=1)
+
+def debut_semaine(now):
+    today_weekday = now.weekday()
+    monday_six_thirty = now.replace(hour=6, minute=30, second=0, microsecond=0) - timedelta(days=today_weekday)
+    if today_weekday == 0 and now.time() < time(6, 30): monday_six_thirty -= timedelta(days=7)
+    return monday_six_thirty
+
+def debut_semaine_de(dt):
+    # debut_semaine en colonne : lundi 6h30 -> lundi suivant 6h30
+    decale = dt - DEBUT_SEMAINE
+    return decale.dt.normalize() - pd.to_timedelta(decale.dt.weekday, unit="D") + DEBUT_SEMAINE
+
+def calendrier_shifts(dt):
+    # Une ligne par horodatage : semaine, dernier shift commencé (0..8), dans le shift ou
+    # après sa fin (soirée prolongée, nuit, week-end), fraction écoulée du shift (1 après
+    # la fin). Shift + Fraction = nombre de shifts écoulés dans la semaine.
+    dt = pd.Series(dt)
+    if dt.dtype.kind != "M": dt = pd.to_datetime(dt)
+    semaine = debut_semaine_de(dt)
+    ecart = (dt - semaine + DEBUT_SEMAINE).to_numpy()
+    vide = dt.isna().to_numpy()
+    shift = np.searchsorted(_DEBUTS_SHIFTS, np.where(vide, _DEBUTS_SHIFTS[0], ecart), side="right") - 1
+    debut, fin = _DEBUTS_SHIFTS[shift], _FINS_SHIFTS[shift]
+    fraction = np.clip((ecart - debut) / (fin - debut), 0.0, 1.0)
+    return pd.DataFrame({
+        "Semaine": semaine,
+        "Shift": np.where(vide, -1, shift).astype("int8"),
+        "En_Shift": ~vide & (ecart < fin),
+        "Fraction": np.where(vide, np.nan, fraction),
+    }, index=dt.index)
+
+# Horloge productive : minutes de shift écoulées depuis une origine fixe. Nuits et
+# week-ends n'existent pas : une étape commencée à 23h50 et reprise à 6h30 le lendemain
+# n'a duré que les minutes passées en shift.
+_DUREES_SHIFTS = (_FINS_SHIFTS - _DEBUTS_SHIFTS) / np.timedelta64(1, "m")
+_CUMUL_SHIFTS = np.r_[0, np.cumsum(_DUREES_SHIFTS)[:-1]]
+MINUTES_SEMAINE = _DUREES_SHIFTS.sum()
+_ORIGINE = pd.Timestamp("2000-01-03 06:30")   # un lundi, début de semaine
+
+def horloge_productive(dt):
+    cal = calendrier_shifts(dt)
+    semaines = ((cal["Semaine"] - _ORIGINE) // pd.Timedelta(days=7)).to_numpy()
+    shift = cal["Shift"].to_numpy()
+    return semaines * MINUTES_SEMAINE + _CUMUL_SHIFTS[shift] + cal["Fraction"].to_numpy() * _DUREES_SHIFTS[shift]
+
+def instant_productif(minutes):
+    # Réciproque : date et heure d'un instant de l'horloge productive
+    semaines, reste = np.divmod(np.asarray(minutes, dtype="float64"), MINUTES_SEMAINE)
+    shift = np.clip(np.searchsorted(_CUMUL_SHIFTS, reste, side="right") - 1, 0, NB_SHIFTS - 1)
+    return (_ORIGINE - DEBUT_SEMAINE + pd.to_timedelta(semaines * 7, unit="D") + pd.to_timedelta(_DEBUTS_SHIFTS[shift])
+            + pd.to_timedelta(reste - _CUMUL_SHIFTS[shift], unit="m"))
+
+def info_shift(now):
+    # (nom du shift en cours, nombre de shifts écoulés dans la semaine, demi-shift en cours compris)
+    cal = calendrier_shifts([now]).iloc[0]
+    shift = int(cal["Shift"])
+    if cal["En_Shift"]: return SHIFTS[shift][0], shift + 0.5
+    return "💤 Hors Shift", float(shift + 1)
+
+# ==============================================================================
+# ÉTAT D'UN POSTE / D'UN MSN
+# ==============================================================================
+
+def deviner_contexte_poste(poste_choisi, etats):
+    dernier_prod = etats.get(poste_choisi)["dernier_prod"]
+    if dernier_prod is None: return "Inconnu"
+    derniere_etape = dernier_prod["Etape"]
+    if derniere_etape in ["PHASE_SETUP", "STATION_BRAS", "STATION_TRK1"]: return "GAUCHE"
+    elif derniere_etape in ["STATION_TRK2", "PHASE_RAPPORT"]: return "DROIT"
+    else: return "GENERIC"
+
+def get_info_msn(msn_cherhe, index_msn):
+    last_log = index_msn.get(msn_cherhe)
+    if last_log is None: return "⚪ À faire", "⚡ Premier Dispo"
+    qui = last_log["Poste"]
+    if last_log["Etape"] == "FIN": return "🟢 Fini", f"✅ Fait par {qui}"
+    return "🟡 En cours", f"🛠️ Pris par {qui}"
+    
+TABLE_HEURES_MINUTES = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60)], dtype=object)
+
+def cycles_pannes(dataframe):
+    # Cycles APPEL -> EN_COURS -> FINI clos, en tableaux : (df_maint, ordre, heures,
+    # idx_appel, idx_debut, idx_fin), heures[idx_*] = instants des trois événements. None si aucun.
+    if dataframe.empty: return None
+    df_maint = dataframe[dataframe['Etape'].isin(['APPEL_REGLAGE', 'INCIDENT_EN_COURS', 'INCIDENT_FINI'])]
+    if df_maint.empty: return None
+
+    # Ordre de parcours : postes dans l'ordre de leur première panne, puis chronologique.
+    # On ne trie que des tableaux numériques, les colonnes texte ne sont lues qu'à la fin.
+    ordre = np.argsort(df_maint['DateTime'].to_numpy(), kind='stable')
+    codes_poste = pd.factorize(df_maint['Poste'].take(ordre))[0]
+    tri_poste = np.argsort(codes_poste, kind='stable')
+    ordre, poste = ordre[tri_poste], codes_poste[tri_poste]
+    heures = df_maint['DateTime'].to_numpy()[ordre]
+    etape = df_maint['Etape']
+    est_appel = (etape == 'APPEL_REGLAGE').to_numpy()[ordre]
+    est_cours = (etape == 'INCIDENT_EN_COURS').to_numpy()[ordre]
+    est_fini = (etape == 'INCIDENT_FINI').to_numpy()[ordre]
+
+    # Segment = suite d'événements d'un poste entre deux APPEL_REGLAGE (un APPEL ouvre toujours un cycle neuf)
+    debut_segment = np.r_[True, poste[1:] != poste[:-1]] | est_appel
+    # Un INCIDENT_FINI clôt le cycle ssi l'événement juste avant (dans le segment) est un INCIDENT_EN_COURS.
+    # Sinon (FINI sans début de réglage) il est ignoré, comme dans l'ancienne boucle.
+    cloture = est_fini & np.r_[False, est_cours[:-1]] & ~debut_segment
+    # Un cycle commence à chaque début de segment et juste après chaque clôture
+    cycle = np.cumsum(debut_segment | np.r_[False, cloture[:-1]])
+
+    idx_fin = np.flatnonzero(cloture)
+    if len(idx_fin) == 0: return None
+    # Ouverture du cycle = premier événement non-FINI du cycle (l'APPEL, ou l'EN_COURS sans appel préalable)
+    idx_ouvrants = np.flatnonzero(~est_fini)
+    cycles_ouverts, premiers = np.unique(cycle[idx_ouvrants], return_index=True)
+    idx_appel = idx_ouvrants[premiers[np.searchsorted(cycles_ouverts, cycle[idx_fin])]]
+    idx_debut = idx_fin - 1
+    return df_maint, ordre, heures, idx_appel, idx_debut, idx_fin
+
+def calculer_kpi_pannes(dataframe):
+    cycles = cycles_pannes(dataframe)
+    if cycles is None: return pd.DataFrame()
+    df_maint, ordre, heures, idx_appel, idx_debut, idx_fin = cycles
+
+    attente = (heures[idx_debut] - heures[idx_appel]) / np.timedelta64(1, 's') / 60
+    reglage = (heures[idx_fin] - heures[idx_debut]) / np.timedelta64(1, 's') / 60
+
+    # strftime ligne à ligne est le plus lent sur un an de données : on formate les jours
+    # distincts une seule fois, et les heures via une table des 1440 minutes de la journée
+    heure_appel = pd.Series(heures[idx_appel])
+    codes_jour, jours = pd.factorize(heure_appel.dt.normalize())
+    minutes_jour = (heure_appel.dt.hour * 60 + heure_appel.dt.minute).to_numpy()
+    lignes_appel = ordre[idx_appel]
+
+    return pd.DataFrame({
+        "Date": pd.Index(jours).strftime("%d/%m").to_numpy()[codes_jour],
+        "Heure": TABLE_HEURES_MINUTES[minutes_jour],
+        "Poste": df_maint['Poste'].take(ordre[idx_fin]).to_numpy(),
+        "MSN": df_maint['MSN_Display'].take(lignes_appel).astype(str).str.replace("MSN-", "", regex=False).to_numpy(),
+        "Cause": df_maint['Info_Sup'].take(lignes_appel).to_numpy(),
+        "Attente (min)": np.trunc(attente).astype(int),
+        "Réglage (min)": np.trunc(reglage).astype(int),
+        "Total (min)": np.trunc(attente + reglage).astype(int),
+    })
+
+def compter_pieces(df, debut_semaine):
+    # Pièces terminées (Série, Rework, MIP) de la semaine : dernier état de chaque SE_Unique
+    if df.empty: return 0, 0, 0
+    # Type et Progression sont déjà des colonnes des Logs parsés (cf. donnees.typer_logs)
+    df_week = df[df["DateTime"] >= debut_semaine]
+    if df_week.empty: return 0, 0, 0
+    df_prod_pure = df_week[~df_week["Etape"].str.contains("INCIDENT|APPEL")]
+    if df_prod_pure.empty: return 0, 0, 0
+    etat_global = df_prod_pure.sort_values("DateTime", kind="stable").drop_duplicates("SE_Unique", keep="last")
+    par_type = etat_global.loc[etat_global["Progression"] >= 95, "Type"].value_counts()
+    return int(par_type.get("Série", 0)), int(par_type.get("Rework", 0)), int(par_type.get("MIP", 0))
+
+COLS_SHIFTS = ["Semaine", "Shift", "Série", "Rework", "MIP", "Arret_min"]
+
+def agreger_shifts(df):
+    # Une ligne par (semaine, shift) présent dans df : pièces terminées dans le shift
+    # (dernier état de chaque SE_Unique dans sa semaine, comme compter_pieces) et minutes
+    # d'arrêt (attente + réglage) des pannes clôturées dans le shift. Ce qui se passe après
+    # la fin d'un shift (soirée prolongée, nuit) compte pour le dernier shift commencé.
+    if df.empty: return pd.DataFrame(columns=COLS_SHIFTS)
+    prod = df[~df["Etape"].str.contains("INCIDENT|APPEL")]
+    cal = calendrier_shifts(prod["DateTime"])
+    etat = prod.assign(Semaine=cal["Semaine"], Shift=cal["Shift"]).sort_values("DateTime", kind="stable")
+    etat = etat.drop_duplicates(["Semaine", "SE_Unique"], keep="last")
+    finies = etat[etat["Progression"] >= 95]
+    pieces = finies.groupby(["Semaine", "Shift", "Type"], observed=True).size().unstack("Type")
+    pieces = pieces.reindex(columns=["Série", "Rework", "MIP"], fill_value=0)
+
+    table = pieces
+    cycles = cycles_pannes(df)
+    if cycles is not None:
+        _, _, heures, idx_appel, _, idx_fin = cycles
+        cal_fin = calendrier_shifts(heures[idx_fin])
+        minutes = (heures[idx_fin] - heures[idx_appel]) / np.timedelta64(1, 's') / 60
+        arrets = pd.Series(minutes).groupby([cal_fin["Semaine"], cal_fin["Shift"]]).sum().rename("Arret_min")
+        table = pieces.join(arrets, how="outer")
+    table = table.reindex(columns=COLS_SHIFTS[2:]).fillna(0)
+    table[["Série", "Rework", "MIP"]] = table[["Série", "Rework", "MIP"]].astype(int)
+    return table.reset_index()[COLS_SHIFTS]
+
+def evenement_semaine(evt, debut_semaine):
+    # Le dashboard ne montre que l'activité de la semaine en cours
+    return evt if evt is not None and evt["DateTime"] >= debut_semaine else None
+
+# ==============================================================================
+# CAUSES D'INCIDENTS (CUBE POUR LE PARETO)
+# ==============================================================================
+# Info_Sup d'un appel ou d'un arrêt manuel : "[MAT:1234] 🔧 PAF + ⚠️ SO3 - Pipes".
+# Chaque panne clôturée devient une ligne par cause, puis le tout est agrégé par
+# (semaine, shift de clôture, poste, MAT, cause) : nombre de pannes, minutes d'attente et
+# de réglage. Les minutes d'une panne à plusieurs causes sont partagées à parts égales
+# (le Pareto retombe sur le temps perdu total) ; chaque cause compte la panne une fois.
+# La zone vient de l'onglet Pannes au moment de l'affichage (la liste est modifiable).
+
+COLS_CAUSES = ["Semaine", "Shift", "Poste", "MAT", "Cause", "Nb", "Attente_min", "Reglage_min"]
+RE_MAT = r"^\s*\[MAT:\s*([^\]]*?)\s*\]\s*"
+CAUSE_VIDE = "Non renseigné"
+ZONE_INCONNUE = "HORS LISTE"
+
+def separer_causes(info_sup):
+    # Une ligne par (texte, cause) : "Ligne" = position dans info_sup, "Poids" = 1 / nb de
+    # causes du texte. Découpé sur les textes distincts (une poignée), redistribué par code.
+    codes, textes = pd.factorize(pd.Series(info_sup, dtype="string").fillna(""))
+    textes = pd.Series(textes, dtype="string")
+    causes = textes.str.replace(RE_MAT, "", regex=True).str.split(r"\s+\+\s+", regex=True).explode().str.strip()
+    causes = causes.where(causes.fillna("") != "", CAUSE_VIDE)
+    par_texte = pd.DataFrame({"Code": causes.index, "Cause": causes.to_numpy(),
+                              "MAT": textes.str.extract(RE_MAT, expand=False).fillna("").to_numpy()[causes.index]})
+    par_texte["Poids"] = 1 / par_texte.groupby("Code")["Cause"].transform("size")
+    lignes = pd.DataFrame({"Ligne": np.arange(len(codes)), "Code": codes})
+    return lignes.merge(par_texte, on="Code").drop(columns="Code").sort_values("Ligne", kind="stable", ignore_index=True)
+
+def cube_causes(df):
+    cycles = cycles_pannes(df)
+    if cycles is None: return pd.DataFrame(columns=COLS_CAUSES)
+    df_maint, ordre, heures, idx_appel, idx_debut, idx_fin = cycles
+    attente = (heures[idx_debut] - heures[idx_appel]) / np.timedelta64(1, 's') / 60
+    reglage = (heures[idx_fin] - heures[idx_debut]) / np.timedelta64(1, 's') / 60
+    cal = calendrier_shifts(heures[idx_fin])
+    # Même texte de cause que calculer_kpi_pannes : celui de l'événement qui ouvre la panne
+    causes = separer_causes(df_maint["Info_Sup"].take(ordre[idx_appel]).astype(str).to_numpy())
+    l, poids = causes["Ligne"].to_numpy(), causes["Poids"].to_numpy()
+    lignes = pd.DataFrame({
+        "Semaine": cal["Semaine"].to_numpy()[l], "Shift": cal["Shift"].to_numpy()[l],
+        "Poste": df_maint["Poste"].take(ordre[idx_fin]).astype(str).to_numpy()[l],
+        "MAT": causes["MAT"].to_numpy(), "Cause": causes["Cause"].to_numpy(), "Nb": 1,
+        "Attente_min": attente[l] * poids, "Reglage_min": reglage[l] * poids})
+    return lignes.groupby(COLS_CAUSES[:5], sort=False).sum().reset_index()[COLS_CAUSES]
+
+def pareto_causes(cube, pannes, axe="Cause"):
+    # Cube (éventuellement filtré) -> une ligne par valeur de `axe` (Cause, Zone, Poste, MAT),
+    # de la plus coûteuse à la moins coûteuse, avec le cumul en % du temps perdu
+    zones = dict(zip(pannes["Nom"], pannes["Zone"]))
+    cube = cube.assign(Zone=cube["Cause"].map(zones).fillna(ZONE_INCONNUE))
+    t = cube.groupby(axe)[["Nb", "Attente_min", "Reglage_min"]].sum()
+    t["Total_min"] = t["Attente_min"] + t["Reglage_min"]
+    t = t.sort_values(["Total_min", "Nb"], ascending=False)
+    total = t["Total_min"].sum()
+    t["Cumul (%)"] = (100 * t["Total_min"].cumsum() / total).round(1) if total else 0.0
+    return t.reset_index()
+
+# ==============================================================================
+# ÉTAT LIVE DE TOUS LES POSTES (UNE SEULE PASSE)
+# ==============================================================================
+# Une ligne par poste, dans l'ordre de `postes`, avec tout ce qu'affiche sa carte.
+# Les derniers événements viennent d'EtatPostes (lecture O(1) par poste) ; le reste est
+# calculé en colonnes, donc le coût ne dépend plus du nombre de cartes dessinées.
+COLS_EVT = ["DateTime", "Etape", "MSN_Display", "SE_Unique", "Info_Sup"]
+
+JOURS_COURTS = ["Lun", "Mar", "Mer", "Jeu", "Ven", "Sam", "Dim"]
+
+def _heure_sortie(instants, now):
+    # "14:35" le jour même, "Mar 07:10" au-delà (la sortie passe la nuit / le week-end)
+    return [f"{d:%H:%M}" if d.date() == now.date() else f"{JOURS_COURTS[d.weekday()]} {d:%H:%M}" for d in instants]
+
+def etats_live_postes(etats, durees, postes, debut_semaine, now):
+    # durees : donnees.DureesEtapes (temps restant appris sur les Logs, lu en O(1) par poste)
+    def colonnes(cle, prefixe):
+        evts = [evenement_semaine(etats.get(p)[cle], debut_semaine) for p in postes]
+        df = pd.DataFrame([{c: e.get(c) for c in COLS_EVT} if e is not None else {} for e in evts], columns=COLS_EVT)
+        df["DateTime"] = pd.to_datetime(df["DateTime"])
+        return df.add_prefix(prefixe)
+    t = pd.concat([pd.DataFrame({"Poste": list(postes)}), colonnes("dernier", "abs_"), colonnes("dernier_prod", "prod_")], axis=1)
+
+    etape_abs, etape_prod = t["abs_Etape"], t["prod_Etape"]
+    t["Progression"] = etape_prod.map(mapping_etapes).fillna(0).astype(int)
+    a_prod = etape_prod.notna()
+    t["Statut"] = np.select(
+        [etape_abs.eq("APPEL_REGLAGE"), etape_abs.eq("INCIDENT_EN_COURS"), a_prod & (t["Progression"] < 100), a_prod],
+        ["APPEL", "REGLAGE", "PROD", "LIBRE"], default="ATTENTE")
+    t["Type"] = types_se(t["prod_SE_Unique"])
+    t["Duree_min"] = np.trunc((pd.Timestamp(now) - t["abs_DateTime"]).dt.total_seconds() / 60)
+    # Temps restant en minutes de shift : la sortie saute les nuits et les week-ends
+    now = pd.Timestamp(now)
+    h_now = horloge_productive([now])[0]
+    debuts = t["prod_DateTime"].fillna(now)
+    ecoules = np.maximum(h_now - horloge_productive(debuts), 0)
+    restes = np.array([durees.reste(y, e, x) for y, e, x in zip(t["Type"].astype(str), etape_prod.fillna("").astype(str), ecoules)]).reshape(-1, 2)
+    t["Reste_min"] = np.ceil(restes[:, 0]).astype(int)
+    t["Reste_max_min"] = np.ceil(restes[:, 1]).astype(int)
+    t["Sortie"] = _heure_sortie(instant_productif(h_now + t["Reste_min"].to_numpy()), now)
+    t["Sortie_max"] = _heure_sortie(instant_productif(h_now + t["Reste_max_min"].to_numpy()), now)
+    return t
@@ -0,0 +1,551 @@
+import copy
+import os
+import pickle
+import threading
+import time
+from bisect import bisect_right, insort
+import numpy as np
+import pandas as pd
+from profilage import etape
+from calculs import mapping_etapes, types_se, horloge_productive, ETAPES_PROD, ETAPE_SUIVANTE, TEMPS_RESTANT, DTYPE_TYPE
+
+# ==============================================================================
+# DONNÉES : LOGS PRÉ-PARSÉS, MIS À JOUR PAR INCRÉMENT
+# ==============================================================================
+# Le journal Logs ne fait que grossir : au lieu de tout relire et tout re-parser
+# à chaque rerun, on garde en mémoire (une fois par process) le DataFrame parsé
+# et on ne va chercher que les lignes ajoutées depuis la dernière lecture.
+
+FORMAT_DATETIME = "%Y-%m-%d %H:%M:%S"
+
+def parser_logs(df_brut):
+    df = df_brut.copy()
+    texte = df["Date"].astype(str) + " " + df["Heure"].astype(str)
+    dt = pd.to_datetime(texte, format=FORMAT_DATETIME, errors="coerce")
+    # Lignes saisies à la main / reformatées par Sheets : on laisse pandas deviner
+    a_deviner = dt.isna() & (df["Date"].astype(str) != "")
+    if a_deviner.any():
+        dt[a_deviner] = pd.to_datetime(texte[a_deviner], format="mixed", errors="coerce")
+    df["DateTime"] = dt
+    return typer_logs(df.dropna(subset=["DateTime"]))
+
+def logs_vides(cols):
+    df = pd.DataFrame(columns=cols)
+    df["DateTime"] = pd.to_datetime([])
+    return typer_logs(df)
+
+# ==============================================================================
+# SCHÉMA TYPÉ DES LOGS
+# ==============================================================================
+# Poste / Etape / Type ne prennent qu'une poignée de valeurs sur des centaines de
+# milliers de lignes : on les garde en catégories (un code entier par ligne), ce qui
+# allège la mémoire et accélère filtres et groupby. DateTime est un datetime64 (int64
+# en interne), Type et Progression sont calculés une fois au parsing.
+# Deux morceaux typés s'assemblent avec concat_logs (pd.concat repasserait en texte
+# des catégories qui diffèrent).
+
+def typer_logs(df):
+    df["Poste"] = df["Poste"].astype("category")
+    df["Etape"] = df["Etape"].astype("category")
+    df["Type"] = types_se(df["SE_Unique"])
+    # Sur une catégorie, le map ne porte que sur les étapes distinctes
+    df["Progression"] = df["Etape"].map(mapping_etapes).astype("float").fillna(0).astype("int8")
+    return df
+
+def concat_logs(morceaux):
+    morceaux = list(morceaux)
+    for c in ["Poste", "Etape"]:
+        # Catégories du premier morceau d'abord : les codes existants ne bougent pas
+        categories = morceaux[0][c].cat.categories
+        for m in morceaux[1:]: categories = categories.append(m[c].cat.categories.difference(categories))
+        morceaux = [m if m[c].cat.categories.equals(categories) else m.assign(**{c: m[c].cat.set_categories(categories)}) for m in morceaux]
+    return pd.concat(morceaux, ignore_index=True)
+
+# ==============================================================================
+# ÉTAT DES POSTES (INDEX MATÉRIALISÉ)
+# ==============================================================================
+# Pour chaque poste on garde les quelques événements qui suffisent à toutes les vues :
+#   - "dernier"            : dernier événement tout court (appel, incident, prod...)
+#   - "dernier_prod"       : dernier événement de production (hors INCIDENT / APPEL)
+#   - "dernier_hors_appel" : dernier événement qui n'est pas un APPEL_REGLAGE
+# Mis à jour à chaque nouvel événement, lu en O(1) par la sidebar et le dashboard.
+# Copie sur écriture (comme IndexMSN et EtatPieces) : appliquer construit un nouveau dict
+# et remplace la référence, les autres sessions lisent sans verrou un dict qui ne bouge plus.
+
+ETAT_POSTE_VIDE = {"dernier": None, "dernier_prod": None, "dernier_hors_appel": None}
+
+class EtatPostes:
+    def __init__(self):
+        self.postes = {}
+
+    def appliquer(self, df_nouveaux):
+        if df_nouveaux.empty: return
+        df_tri = df_nouveaux.sort_values("DateTime", kind="stable")
+        etapes = df_tri["Etape"]
+        masques = {
+            "dernier": slice(None),
+            "dernier_hors_appel": etapes != "APPEL_REGLAGE",
+            "dernier_prod": ~etapes.str.contains("INCIDENT|APPEL"),
+        }
+        # Un seul événement par poste et par catégorie à fusionner, quel que soit le lot
+        postes = dict(self.postes)
+        for cle, masque in masques.items():
+            for evt in df_tri[masque].groupby("Poste", observed=True).tail(1).to_dict("records"):
+                etat = postes.get(evt["Poste"], ETAT_POSTE_VIDE)
+                if etat[cle] is None or evt["DateTime"] >= etat[cle]["DateTime"]: postes[evt["Poste"]] = {**etat, cle: evt}
+        self.postes = postes
+
+    def get(self, poste):
+        return self.postes.get(poste, ETAT_POSTE_VIDE)
+
+
+# ==============================================================================
+# INDEX MSN → DERNIER ÉVÉNEMENT
+# ==============================================================================
+# Correspondance exacte sur MSN_Display (un "MSN-12" ne doit pas répondre pour "MSN-123").
+
+class IndexMSN:
+    def __init__(self):
+        self.msn = {}
+
+    def appliquer(self, df_nouveaux):
+        if df_nouveaux.empty: return
+        df_tri = df_nouveaux.sort_values("DateTime", kind="stable")
+        df_tri = df_tri.assign(_cle=df_tri["MSN_Display"].astype(str).str.strip())
+        msn = dict(self.msn)
+        for evt in df_tri.drop_duplicates("_cle", keep="last").to_dict("records"):
+            cle = evt.pop("_cle")
+            actuel = msn.get(cle)
+            if actuel is None or evt["DateTime"] >= actuel["DateTime"]: msn[cle] = evt
+        self.msn = msn
+
+    def get(self, msn):
+        return self.msn.get(str(msn).strip())
+
+
+# ==============================================================================
+# PIÈCES → DERNIER ÉTAT DE PRODUCTION
+# ==============================================================================
+# Pour chaque SE_Unique, son dernier événement hors INCIDENT / APPEL : suffit à compter
+# les pièces terminées de la semaine sans repasser sur les Logs (même résultat que
+# calculs.compter_pieces : le dernier état dans la semaine est le dernier tout court).
+
+class EtatPieces:
+    def __init__(self):
+        self.pieces = {}   # SE_Unique -> (DateTime, Progression, Type)
+
+    def appliquer(self, df_nouveaux):
+        if df_nouveaux.empty: return
+        prod = df_nouveaux[~df_nouveaux["Etape"].str.contains("INCIDENT|APPEL")]
+        derniers = prod.sort_values("DateTime", kind="stable").drop_duplicates("SE_Unique", keep="last")
+        pieces = dict(self.pieces)
+        for se, dt, progression, type_piece in zip(derniers["SE_Unique"], derniers["DateTime"], derniers["Progression"], derniers["Type"]):
+            actuel = pieces.get(se)
+            if actuel is None or dt >= actuel[0]: pieces[se] = (dt, int(progression), type_piece)
+        self.pieces = pieces
+
+    def compter(self, debut_semaine):
+        debut = pd.Timestamp(debut_semaine)
+        nb = {"Série": 0, "Rework": 0, "MIP": 0}
+        for dt, progression, type_piece in list(self.pieces.values()):
+            if dt >= debut and progression >= 95 and type_piece in nb: nb[type_piece] += 1
+        return nb["Série"], nb["Rework"], nb["MIP"]
+
+
+# ==============================================================================
+# DURÉES D'ÉTAPES (STATISTIQUES GLISSANTES)
+# ==============================================================================
+# Pour chaque (Type, Etape) : médiane et 90e centile de la durée de l'étape, en minutes
+# de shift (calculs.horloge_productive), depuis l'événement qui l'ouvre jusqu'à
+# l'événement de production suivant du même poste (un re-clic sur la même étape la
+# prolonge). Les centiles sont estimés au fil de l'eau (P², Jain & Chlamtac) : 5 valeurs
+# par estimateur quel que soit le nombre d'événements, et chaque carte poste lit son
+# temps restant dans une table précalculée.
+# Les estimateurs survivent aux relectures complètes de l'onglet (rotation du lundi, RAZ,
+# saisie refusée) : une étape déjà apprise (terminée avant le dernier événement appris du
+# poste) n'est pas comptée deux fois. Copie sur écriture du dict des estimateurs, comme
+# les index : la table des cartes se construit sans verrou sur un dict qui ne bouge plus.
+
+MIN_ECHANTILLONS = 5   # en dessous, on prend l'étape toutes pièces confondues
+LOT_MIN = 50           # taille de lot à partir de laquelle un estimateur vide part des centiles exacts
+# Sans historique : les écarts de l'ancienne table TEMPS_RESTANT (même affichage qu'avant)
+DUREE_ETAPE_DEFAUT = {e: TEMPS_RESTANT[e] - TEMPS_RESTANT[ETAPE_SUIVANTE[e]] for e in ETAPES_PROD if e != "FIN"}
+
+class QuantileP2:
+    def __init__(self, p):
+        self.p = p
+        self.n = 0
+        self.q = []                                   # hauteurs des 5 marqueurs (les 5 premières valeurs, triées)
+        self.pos = [1, 2, 3, 4, 5]                    # positions réelles
+        self.voulu = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.pas = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def ajouter(self, x):
+        self.n += 1
+        q, pos = self.q, self.pos
+        if self.n <= 5: insort(q, x); return
+        if x < q[0]: q[0] = x; k = 0
+        elif x >= q[4]: q[4] = x; k = 3
+        else: k = bisect_right(q, x) - 1
+        for i in range(k + 1, 5): pos[i] += 1
+        for i in range(5): self.voulu[i] += self.pas[i]
+        # Ajustement des marqueurs intermédiaires (parabolique, linéaire s'il sort de l'intervalle)
+        for i in (1, 2, 3):
+            d = self.voulu[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                h = q[i] + d / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + d) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - d) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1]))
+                if not q[i - 1] < h < q[i + 1]: h = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = h; pos[i] += d
+
+    def ajouter_lot(self, valeurs):
+        # Estimateur vide et lot assez grand (démarrage, relecture complète) : marqueurs posés
+        # directement sur les centiles exacts du lot, au lieu de valeur par valeur
+        valeurs = np.asarray(valeurs, dtype="float64")
+        n = len(valeurs)
+        if self.n == 0 and n >= LOT_MIN:
+            tri = np.sort(valeurs)
+            voulu = [1 + (n - 1) * d for d in self.pas]
+            pos = [int(round(v)) for v in voulu]
+            if all(a < b for a, b in zip(pos, pos[1:])):
+                self.n, self.voulu, self.pos = n, voulu, pos
+                self.q = [float(tri[i - 1]) for i in pos]
+                return
+        for x in valeurs.tolist(): self.ajouter(x)
+
+    def valeur(self):
+        if self.n == 0: return None
+        if self.n <= 5: return float(np.quantile(self.q, self.p))
+        return self.q[2]
+
+class DureesEtapes:
+    def __init__(self):
+        self.derniers = {}   # Poste -> (horloge, code Etape, code Type, instant) de l'événement qui a ouvert l'étape en cours
+        self.appris = {}     # Poste -> instant (ns) du dernier événement appris
+        self.stats = {}      # (Type, Etape) et (None, Etape) -> [médiane, 90e centile]
+        self._table = None   # (stats, {(Type, Etape) -> (reste médian, reste haut) après l'étape, jusqu'à FIN})
+
+    def reprendre(self):
+        # Relecture complète de l'onglet : les étapes en cours repartent de zéro, les
+        # estimateurs et ce qui est déjà appris restent
+        self.derniers = {}
+
+    def _ajouter(self, stats, cle, durees):
+        if cle not in stats: stats[cle] = [QuantileP2(0.5), QuantileP2(0.9)]
+        for s in stats[cle]: s.ajouter_lot(durees)
+
+    def appliquer(self, df_nouveaux):
+        prod = df_nouveaux[df_nouveaux["Etape"].isin(ETAPES_PROD)]
+        if prod.empty: return
+        prod = prod.sort_values(["Poste", "DateTime"], kind="stable")
+        horloge = horloge_productive(prod["DateTime"])
+        instants = prod["DateTime"].to_numpy("datetime64[ns]").astype("int64")
+        etapes = pd.Categorical(prod["Etape"].astype(str), categories=ETAPES_PROD).codes.astype("int64")
+        types = prod["Type"].cat.codes.to_numpy().astype("int64")
+        durees, cles = [], []
+        for poste, idx in prod.groupby("Poste", observed=True, sort=False).indices.items():
+            h, e, y, t = horloge[idx], etapes[idx], types[idx], instants[idx]
+            prec = self.derniers.get(poste)
+            if prec is not None:
+                # Étape ouverte dans un lot précédent ; un événement arrivé en retard est ignoré
+                garde = h >= prec[0]
+                h, e, y, t = (np.r_[p, v[garde]] for p, v in zip(prec, (h, e, y, t)))
+            # Un re-clic sur la même étape ne la coupe pas : seuls les changements d'étape comptent
+            debut = np.r_[True, e[1:] != e[:-1]]
+            h, e, y, t = h[debut], e[debut], y[debut], t[debut]
+            self.derniers[poste] = (h[-1], e[-1], y[-1], t[-1])
+            # Étapes terminées après le dernier événement appris du poste (relecture complète)
+            nouvelles = t[1:] > self.appris.get(poste, np.iinfo("int64").min)
+            self.appris[poste] = max(self.appris.get(poste, t[-1]), t[-1])
+            durees.append(np.diff(h)[nouvelles]); cles.append((y[:-1] * len(ETAPES_PROD) + e[:-1])[nouvelles])
+        if not durees: return
+        durees, cles = np.concatenate(durees), np.concatenate(cles)
+        if not len(durees): return
+        noms_types = list(DTYPE_TYPE.categories)
+        stats = dict(self.stats)
+        for k in np.unique(cles):
+            type_piece, e = divmod(int(k), len(ETAPES_PROD))
+            self._ajouter(stats, (noms_types[type_piece], ETAPES_PROD[e]), durees[cles == k])
+        for e in np.unique(cles % len(ETAPES_PROD)):
+            self._ajouter(stats, (None, ETAPES_PROD[int(e)]), durees[cles % len(ETAPES_PROD) == e])
+        self.stats = stats
+
+    @staticmethod
+    def _duree(stats, type_piece, nom_etape):
+        # (médiane, 90e centile) d'une étape, avec repli sur l'étape toutes pièces puis la table fixe
+        for cle in ((type_piece, nom_etape), (None, nom_etape)):
+            estimateurs = stats.get(cle)
+            if estimateurs is not None and (estimateurs[0].n >= MIN_ECHANTILLONS or cle[0] is None):
+                return estimateurs[0].valeur(), estimateurs[1].valeur()
+        d = DUREE_ETAPE_DEFAUT.get(nom_etape, 30)
+        return d, d
+
+    def _construire(self, stats):
+        table = {}
+        for type_piece in {c[0] for c in stats if c[0] is not None} | {None}:
+            for e in ETAPES_PROD:
+                med = haut = 0.0
+                suivante = ETAPE_SUIVANTE[e] if e != "FIN" else "FIN"
+                while suivante != "FIN":
+                    m, h = self._duree(stats, type_piece, suivante)
+                    med += m; haut += h
+                    suivante = ETAPE_SUIVANTE[suivante]
+                table[(type_piece, e)] = (med, haut)
+        # Table rattachée au dict qui l'a produite : périmée dès que appliquer en publie un autre
+        self._table = (stats, table)
+        return table
+
+    def reste(self, type_piece, nom_etape, ecoule=0.0):
+        # Minutes de shift avant FIN : (médiane, borne haute = somme des 90e centiles)
+        if nom_etape not in ETAPE_SUIVANTE or nom_etape == "FIN": return 0.0, 0.0
+        stats, table = self.stats, self._table
+        table = table[1] if table is not None and table[0] is stats else self._construire(stats)
+        apres = table.get((type_piece, nom_etape)) or table[(None, nom_etape)]
+        m, h = self._duree(stats, type_piece, nom_etape)
+        return max(m - ecoule, 0) + apres[0], max(h - ecoule, 0) + apres[1]
+
+
+# ==============================================================================
+# CACHE PARTAGÉ DES AUTRES ONGLETS (Consignes, Pannes, Objectif)
+# ==============================================================================
+# Un seul instantané par onglet et par process, relu au plus une fois par `intervalle`
+# quel que soit le nombre d'écrans ouverts. Les écritures l'invalident tout de suite.
+# L'instantané est partagé : ne jamais le modifier en place.
+
+class CacheFeuilles:
+    def __init__(self, stockage, intervalle=5.0):
+        self.stockage = stockage
+        self.intervalle = intervalle
+        self._instantanes = {}   # onglet -> (horodatage, DataFrame brut)
+        self._verrous = {}
+        self._lock = threading.Lock()
+        self.stats = {}          # onglet -> {"hits": n, "misses": n}
+
+    def _compter(self, worksheet, cle):
+        self.stats.setdefault(worksheet, {"hits": 0, "misses": 0})[cle] += 1
+
+    def lire(self, worksheet):
+        with self._lock: verrou = self._verrous.setdefault(worksheet, threading.Lock())
+        # Un seul rechargement à la fois par onglet : les autres sessions attendent et
+        # récupèrent le même instantané au lieu d'appeler l'API en parallèle
+        with verrou:
+            instantane = self._instantanes.get(worksheet)
+            if instantane is not None and time.monotonic() - instantane[0] < self.intervalle:
+                self._compter(worksheet, "hits")
+                return instantane[1]
+            self._compter(worksheet, "misses")
+            df = self.stockage.read(worksheet)
+            self._instantanes[worksheet] = (time.monotonic(), df)
+            return df
+
+    def invalider(self, worksheet):
+        self._instantanes.pop(worksheet, None)
+
+    def appliquer_local(self, worksheet, df_nouveau=None, lignes=None):
+        # Affichage optimiste en attendant que la file d'écritures ait fini
+        with self._lock: verrou = self._verrous.setdefault(worksheet, threading.Lock())
+        with verrou:
+            if df_nouveau is not None:
+                self._instantanes[worksheet] = (time.monotonic(), df_nouveau)
+                return
+            instantane = self._instantanes.get(worksheet)
+            if instantane is None or len(instantane[1].columns) != len(lignes[0]):
+                self._instantanes.pop(worksheet, None)
+                return
+            ajout = pd.DataFrame(lignes, columns=instantane[1].columns)
+            self._instantanes[worksheet] = (time.monotonic(), pd.concat([instantane[1], ajout], ignore_index=True))
+
+
+# ==============================================================================
+# CACHE DES LOGS (+ INSTANTANÉS SUR DISQUE)
+# ==============================================================================
+# Tout l'état dérivé (Logs parsés, EtatPostes, IndexMSN, EtatPieces, DureesEtapes) est un pli sur le
+# flux d'événements. Il est écrit régulièrement dans un fichier local avec le nombre de
+# lignes qu'il couvre : au démarrage du serveur on recharge l'instantané et on ne relit
+# que les lignes suivantes. Si la ligne de raccord a changé (onglet réécrit : rotation,
+# RAZ, suppression), l'instantané est ignoré et on relit tout.
+# Seul l'état confirmé est écrit : jamais tant que des saisies locales sont en attente.
+# Les durées d'étapes ne voient que les lignes confirmées (les saisies locales sont
+# réappliquées à chaque lecture et compteraient plusieurs fois).
+
+VERSION_INSTANTANE = 3
+INSTANTANE_TOUTES_LES = 200   # lignes lues entre deux instantanés
+
+class CacheLogs:
+    def __init__(self, stockage, cols, worksheet="Logs", delai_min=1.0, fichier_instantane=None, identite=""):
+        self.stockage = stockage
+        self.cols = cols
+        self.worksheet = worksheet
+        # Toutes les sessions partagent ce cache : au plus une lecture par `delai_min`
+        self.delai_min = delai_min
+        self._derniere_lecture = 0.0
+        self._a_relire = False
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        self.version = 0   # change à chaque modification du contenu (jeton pour les caches)
+        # Événements saisis ici mais pas encore relus depuis le stockage (affichage optimiste)
+        self._locaux = []  # {"ligne": tuple brut, "ecrit_a": instant de l'écriture confirmée}
+        self.fichier_instantane = fichier_instantane
+        self.identite = identite  # backend / base : un instantané d'une autre source est ignoré
+        self._instantane_lu = fichier_instantane is None
+        self._lignes_instantane = 0
+        self._ecriture_instantane = threading.Lock()
+        self._vider()
+
+    def invalider(self):
+        # Onglet réécrit par ce process : on repart de zéro à la prochaine lecture
+        with self._lock:
+            self._locaux = []
+            self._vider()
+            self._a_relire = True
+
+    def forcer_rechargement(self):
+        # Onglet raccourci par la rotation des archives : relecture complète au prochain
+        # rafraîchissement, sans perdre les événements locaux pas encore écrits
+        with self._lock:
+            self.nb_lignes = 0
+            self._a_relire = True
+
+    def retirer_locaux(self, rows):
+        # Saisies refusées par le stockage : on les retire de l'affichage. Les index les ont
+        # déjà intégrées, d'où une relecture complète (les autres saisies locales sont gardées)
+        lignes = {tuple(str(v) for v in r) for r in rows}
+        with self._lock:
+            self._locaux = [l for l in self._locaux if l["ligne"] not in lignes]
+            self.nb_lignes = 0
+            self._a_relire = True
+
+    def _vider(self):
+        self.version += 1
+        self.df_confirme = logs_vides(self.cols)
+        self.df = self.df_confirme
+        self.etats = EtatPostes()
+        self.index_msn = IndexMSN()
+        self.pieces = EtatPieces()
+        # Les durées apprises restent : seules les étapes ouvertes sont oubliées
+        self.durees = getattr(self, "durees", None) or DureesEtapes()
+        self.durees.reprendre()
+        self.nb_lignes = 0           # lignes brutes lues (y compris non parsables)
+        self.derniere_ligne = None   # dernière ligne brute, pour détecter une réécriture
+
+    def _recharger(self):
+        brut = self.stockage.read_from(self.worksheet, 0, self.cols)
+        self._vider()
+        self._ajouter(brut)
+        # Les événements locaux restent les plus récents : on les réapplique par-dessus
+        self._appliquer_locaux(self._df_locaux())
+
+    def _df_locaux(self):
+        if not self._locaux: return logs_vides(self.cols)
+        return parser_logs(pd.DataFrame([l["ligne"] for l in self._locaux], columns=self.cols))
+
+    def _appliquer_locaux(self, df_locaux):
+        self.etats.appliquer(df_locaux)
+        self.index_msn.appliquer(df_locaux)
+        self.pieces.appliquer(df_locaux)
+        self.df = self.df_confirme if df_locaux.empty else concat_logs([self.df_confirme, df_locaux])
+
+    def _ajouter(self, brut):
+        if brut.empty: return
+        self.version += 1
+        self.nb_lignes += len(brut)
+        self.derniere_ligne = tuple(brut.iloc[-1])
+        with etape("parser_logs"): nouveaux = parser_logs(brut)
+        if nouveaux.empty: return
+        self.etats.appliquer(nouveaux)
+        self.index_msn.appliquer(nouveaux)
+        self.pieces.appliquer(nouveaux)
+        with etape("durees_etapes"): self.durees.appliquer(nouveaux)
+        if self.df_confirme.empty: self.df_confirme = nouveaux.reset_index(drop=True)
+        else: self.df_confirme = concat_logs([self.df_confirme, nouveaux])
+        self.df = self.df_confirme
+
+    def _restaurer_instantane(self):
+        # Démarrage à froid uniquement : après une réécriture connue, on relit tout
+        self._instantane_lu = True
+        try:
+            with open(self.fichier_instantane, "rb") as f: inst = pickle.load(f)
+        except Exception:
+            return   # absent, tronqué ou écrit par une autre version de pandas : on relit tout
+        if inst.get("version") != VERSION_INSTANTANE or inst.get("identite") != self.identite or inst.get("cols") != self.cols: return
+        self.version += 1
+        self.df_confirme = self.df = inst["df"]
+        self.etats.postes = inst["etats"]
+        self.index_msn.msn = inst["index_msn"]
+        self.pieces.pieces = inst["pieces"]
+        self.durees = inst["durees"]
+        self.nb_lignes = self._lignes_instantane = inst["nb_lignes"]
+        self.derniere_ligne = inst["derniere_ligne"]
+
+    def _preparer_instantane(self, forcer=False):
+        # Sous le verrou : seulement les références (DataFrame et index sont remplacés, jamais
+        # modifiés en place) et une copie des durées, qui évoluent en place
+        if self.fichier_instantane is None or self._locaux or self.nb_lignes == 0: return None
+        if not forcer and self.nb_lignes - self._lignes_instantane < INSTANTANE_TOUTES_LES: return None
+        if self._ecriture_instantane.locked(): return None   # un instantané part déjà
+        self._lignes_instantane = self.nb_lignes
+        return {"version": VERSION_INSTANTANE, "identite": self.identite, "cols": self.cols,
+                "nb_lignes": self.nb_lignes, "derniere_ligne": self.derniere_ligne, "df": self.df_confirme,
+                "etats": self.etats.postes, "index_msn": self.index_msn.msn, "pieces": self.pieces.pieces,
+                "durees": copy.deepcopy(self.durees)}
+
+    def _ecrire_instantane(self, inst):
+        # Hors verrou : les autres sessions continuent de lire le cache pendant le pickle
+        if not self._ecriture_instantane.acquire(blocking=False): return
+        # Écriture atomique : un serveur coupé en plein milieu laisse l'ancien instantané
+        temporaire = f"{self.fichier_instantane}.tmp"
+        try:
+            with open(temporaire, "wb") as f: pickle.dump(inst, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporaire, self.fichier_instantane)
+        except Exception:
+            pass   # disque plein / lecture seule : on continue sans instantané
+        finally:
+            self._ecriture_instantane.release()
+
+    def ajouter_local(self, rows):
+        # Clic opérateur / régleur : visible tout de suite, avant même l'écriture réelle
+        lignes = [tuple(str(v) for v in r) for r in rows]
+        with self._lock:
+            self._locaux += [{"ligne": l, "ecrit_a": None} for l in lignes]
+            self.version += 1
+            self._appliquer_locaux(self._df_locaux())
+
+    def marquer_ecrits(self, rows):
+        # Appelé par la file d'écritures : ces lignes sont maintenant dans le stockage
+        lignes = {tuple(str(v) for v in r) for r in rows}
+        with self._lock:
+            for l in self._locaux:
+                if l["ecrit_a"] is None and l["ligne"] in lignes: l["ecrit_a"] = time.monotonic()
+            self._a_relire = True
+
+    def rafraichir(self):
+        with self._lock: df, inst = self._rafraichir()
+        if inst is not None: self._ecrire_instantane(inst)
+        return df
+
+    def _rafraichir(self):
+        maintenant = time.monotonic()
+        if not self._a_relire and maintenant - self._derniere_lecture < self.delai_min:
+            self.stats["hits"] += 1
+            return self.df, None
+        self.stats["misses"] += 1
+        self._a_relire = False
+        self._derniere_lecture = maintenant
+        if not self._instantane_lu: self._restaurer_instantane()
+        recharge = self.nb_lignes == 0
+        if not recharge:
+            # On relit la dernière ligne connue + les nouvelles : si elle a changé,
+            # l'onglet a été réécrit (RAZ, suppression...) et on recharge tout.
+            brut = self.stockage.read_from(self.worksheet, self.nb_lignes - 1, self.cols)
+            recharge = brut.empty or tuple(brut.iloc[0]) != self.derniere_ligne
+            if not recharge: self._ajouter(brut.iloc[1:])
+        if recharge: self._recharger()
+        # Événements écrits avant cette lecture : ils font désormais partie du confirmé
+        confirmes = [l for l in self._locaux if l["ecrit_a"] is not None and l["ecrit_a"] < maintenant]
+        if confirmes:
+            self._locaux = [l for l in self._locaux if l not in confirmes]
+            self.version += 1
+        if self._locaux or confirmes: self._appliquer_locaux(self._df_locaux())
+        return self.df, self._preparer_instantane(forcer=recharge)
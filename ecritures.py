@@ -0,0 +1,201 @@
+import sqlite3
+import threading
+import time
+import itertools
+from stockage import projeter
+from archives import archiver_semaines_closes
+
+# ==============================================================================
+# FILE D'ÉCRITURES (NON BLOQUANTE, REGROUPÉE)
+# ==============================================================================
+# Un clic ne doit plus attendre l'aller-retour vers Google Sheets : append_row /
+# overwrite_data déposent l'opération ici et rendent la main tout de suite.
+# Un thread de fond vide la file : les ajouts successifs sur un même onglet partent
+# en un seul appel, un écrasement rend inutiles les opérations précédentes sur
+# l'onglet, et chaque appel raté est retenté avec une attente croissante.
+# Les suppressions voyagent comme une intention ("ces clés"), pas comme un onglet
+# entier : le stockage les applique au contenu à jour (voir Stockage.delete_rows).
+# Avec un journal (journal.py), chaque opération est sur disque avant de rendre la main,
+# et ce qui n'a pas été envoyé au dernier arrêt du serveur repart au démarrage.
+# Un onglet en échec n'arrête que ses propres opérations (l'ordre ne compte qu'à
+# l'intérieur d'un onglet) : les autres continuent de partir. Une erreur passagère
+# (réseau, quota, 5xx) est retentée sans limite ; une erreur qui se répète à l'identique
+# (ligne mal formée, 4xx, bug) est mise de côté après NB_ESSAIS_MAX essais, pour ne pas
+# bloquer l'onglet indéfiniment. Le Mode Admin la montre et peut la renvoyer.
+
+DELAI_INITIAL = 0.5
+DELAI_MAX = 30.0
+NB_ESSAIS_MAX = 5
+
+def erreur_passagere(e):
+    statut = getattr(getattr(e, "response", None), "status_code", None)
+    if statut is not None: return statut in (408, 429) or statut >= 500
+    # OSError couvre ConnectionError, TimeoutError et les erreurs réseau de requests
+    return isinstance(e, (OSError, sqlite3.OperationalError))
+
+def regrouper(operations):
+    # operations : liste de dicts {"id", "type": "append"|"overwrite"|"delete"|"archive", "worksheet", ...}
+    # L'ordre ne compte qu'à l'intérieur d'un même onglet.
+    # Une opération renvoyée depuis le Mode Admin est déjà regroupée : elle garde ses "ids".
+    par_onglet = {}
+    for op in operations:
+        lot = par_onglet.setdefault(op["worksheet"], [])
+        ids_op = list(op.get("ids") or [op["id"]])
+        if op["type"] == "overwrite":
+            # Tout ce qui précède sur cet onglet est écrasé de toute façon (mais compte comme fait)
+            ids = [i for o in lot for i in o["ids"]] + ids_op
+            lot.clear(); lot.append(dict(op, ids=ids))
+        elif op["type"] == "append" and lot and lot[-1]["type"] == "append" and lot[-1]["cols"] == op["cols"]:
+            lot[-1]["rows"] = lot[-1]["rows"] + op["rows"]
+            lot[-1]["ids"] += ids_op
+            lot[-1]["incertain"] = lot[-1].get("incertain") or op.get("incertain")
+        elif op["type"] == "delete" and lot and lot[-1]["type"] == "delete" and lot[-1]["cle"] == op["cle"]:
+            lot[-1]["valeurs"] = lot[-1]["valeurs"] + op["valeurs"]
+            lot[-1]["ids"] += ids_op
+        else:
+            lot.append(dict(op, ids=ids_op))
+    return [op for lot in par_onglet.values() for op in lot]
+
+class FileEcritures:
+    def __init__(self, stockage, apres_ecriture=None, journal=None, apres_rejet=None):
+        self.stockage = stockage
+        # Appelé avec l'opération (hors Streamlit, depuis le thread) après chaque écriture réussie
+        self.apres_ecriture = apres_ecriture
+        # Idem quand une opération est mise de côté (l'affichage optimiste doit la retirer)
+        self.apres_rejet = apres_rejet
+        self.journal = journal
+        # Rejeu : opérations journalisées mais pas confirmées avant le dernier arrêt
+        self._file = journal.en_attente() if journal else []
+        # Opérations mises de côté : {"op", "erreur", "quand"}
+        self.rejetees = journal.rejetees() if journal else []
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._en_cours = 0
+        self.derniere_erreur = None
+        self.dernier_succes = None
+        self.nb_appels = 0
+        self._thread = threading.Thread(target=self._boucle, name="file-ecritures", daemon=True)
+        self._thread.start()
+
+    def _deposer(self, op):
+        with self._cond:
+            if self.journal:
+                # Sur disque avant d'accuser réception ; None = événement déjà en attente
+                op["id"] = self.journal.deposer(op)
+                if op["id"] is None: return None
+            else: op["id"] = next(self._ids)
+            self._file.append(op)
+            self._cond.notify()
+            return op["id"]
+
+    def ajouter(self, worksheet, rows, cols):
+        return self._deposer({"type": "append", "worksheet": worksheet, "rows": list(rows), "cols": list(cols)})
+
+    def ecraser(self, worksheet, df):
+        return self._deposer({"type": "overwrite", "worksheet": worksheet, "df": df.copy()})
+
+    def supprimer(self, worksheet, cols, cle, valeurs):
+        return self._deposer({"type": "delete", "worksheet": worksheet, "cols": list(cols), "cle": list(cle),
+                              "valeurs": [tuple(v) for v in valeurs]})
+
+    def archiver(self, worksheet, cols, debut_semaine, msn_a_garder=()):
+        # Rotation hebdomadaire : passe après les ajouts déjà en file sur l'onglet
+        return self._deposer({"type": "archive", "worksheet": worksheet, "cols": list(cols),
+                              "debut_semaine": debut_semaine, "msn_a_garder": list(msn_a_garder)})
+
+    def relancer(self):
+        # Mode Admin : les opérations mises de côté repartent (après ce qui est déjà en file)
+        with self._cond:
+            ops = [{k: v for k, v in r["op"].items() if k not in ("essais", "prochain_essai")} for r in self.rejetees]
+            ops, self.rejetees = [dict(op, incertain=True) for op in ops], []
+            if self.journal: self.journal.relancer([i for op in ops for i in op.get("ids") or [op["id"]]])
+            self._file += ops
+            self._cond.notify()
+        return ops
+
+    def abandonner(self):
+        # Mode Admin : on renonce aux opérations mises de côté (gardées au journal jusqu'à la purge)
+        with self._cond:
+            ops, self.rejetees = [r["op"] for r in self.rejetees], []
+            if self.journal: self.journal.marquer_envoyes([i for op in ops for i in op.get("ids") or [op["id"]]])
+
+    @property
+    def en_attente(self):
+        with self._cond: return len(self._file) + self._en_cours
+
+    def vider(self, timeout=None):
+        # Attend que tout soit écrit (scripts, tests, arrêt du serveur)
+        fin = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._file or self._en_cours:
+                reste = None if fin is None else fin - time.monotonic()
+                if reste is not None and reste <= 0: return False
+                self._cond.wait(reste)
+        return True
+
+    def _executer(self, op):
+        if op["type"] == "append":
+            rows = op["rows"]
+            if op.get("incertain"):
+                # Un envoi précédent a peut-être abouti (délai dépassé, serveur coupé) : on ne
+                # renvoie que les lignes absentes de l'onglet
+                deja = set(projeter(self.stockage.read(op["worksheet"]), op["cols"]).itertuples(index=False, name=None))
+                rows = [r for r in rows if tuple(str(v) for v in r) not in deja]
+            if rows: self.stockage.append(op["worksheet"], rows, op["cols"])
+        elif op["type"] == "delete": self.stockage.delete_rows(op["worksheet"], op["cols"], op["cle"], op["valeurs"])
+        elif op["type"] == "archive":
+            archiver_semaines_closes(self.stockage, op["cols"], op["debut_semaine"], op["msn_a_garder"], op["worksheet"])
+        else: self.stockage.overwrite(op["worksheet"], op["df"])
+        self.nb_appels += 1
+
+    def _rejeter(self, op, erreur):
+        with self._cond:
+            self.rejetees.append({"op": op, "erreur": erreur, "quand": time.time()})
+            if self.journal: self.journal.marquer_rejetes(op["ids"], erreur)
+        if self.apres_rejet:
+            try: self.apres_rejet(op)
+            except Exception: pass
+
+    def _boucle(self):
+        a_faire = []   # opérations regroupées, dans l'ordre ; celles d'un onglet en échec attendent
+        while True:
+            with self._cond:
+                while not self._file:
+                    if not a_faire: self._cond.wait()
+                    else:
+                        # Rien de neuf : on attend le prochain essai prévu (une saisie réveille la boucle)
+                        attente = min((op["prochain_essai"] for op in a_faire if "prochain_essai" in op), default=0) - time.monotonic()
+                        if attente <= 0: break
+                        self._cond.wait(attente)
+                lot, self._file = self._file, []
+            a_faire += regrouper(lot)
+            with self._cond: self._en_cours = sum(len(op["ids"]) for op in a_faire)
+            bloques, reste = set(), []
+            for op in a_faire:
+                # Un onglet en échec garde son ordre : ses opérations suivantes attendent
+                if op["worksheet"] in bloques or op.get("prochain_essai", 0) > time.monotonic():
+                    bloques.add(op["worksheet"]); reste.append(op); continue
+                try:
+                    if self.journal: self.journal.marquer_tentes(op["ids"])
+                    self._executer(op)
+                except Exception as e:
+                    erreur = f"{op['worksheet']} : {e}"
+                    op["incertain"] = True
+                    op["essais"] = op.get("essais", 0) + 1
+                    if not erreur_passagere(e) and op["essais"] >= NB_ESSAIS_MAX:
+                        self._rejeter(op, erreur); continue
+                    # On ne perd rien : même opération plus tard, après une pause croissante
+                    self.derniere_erreur = (time.time(), erreur)
+                    op["prochain_essai"] = time.monotonic() + min(DELAI_INITIAL * 2 ** (op["essais"] - 1), DELAI_MAX)
+                    bloques.add(op["worksheet"]); reste.append(op)
+                    continue
+                if self.journal: self.journal.marquer_envoyes(op["ids"])
+                self.dernier_succes = time.time()
+                if self.apres_ecriture:
+                    try: self.apres_ecriture(op)
+                    except Exception: pass
+            a_faire = reste
+            if not any(op.get("essais") for op in a_faire): self.derniere_erreur = None
+            with self._cond:
+                self._en_cours = sum(len(op["ids"]) for op in a_faire)
+                self._cond.notify_all()
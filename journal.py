@@ -0,0 +1,98 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+# ==============================================================================
+# JOURNAL LOCAL DES ÉCRITURES (AVANT ENVOI AU STOCKAGE)
+# ==============================================================================
+# Chaque opération de la file d'écritures est d'abord écrite ici (SQLite, synchronous
+# FULL : sur disque au retour de l'appel), puis envoyée au stockage par le thread de
+# fond. Une coupure de Sheets, un serveur redémarré ou planté ne perdent donc aucune
+# saisie : au démarrage, ce qui n'a pas été confirmé est rejoué dans l'ordre.
+#
+# Identifiant d'événement : empreinte du contenu pour un ajout (la ligne Logs porte son
+# horodatage à la seconde), aléatoire sinon. Un même événement déposé deux fois tant
+# qu'il n'est pas envoyé n'est journalisé qu'une fois.
+# `tente` = un envoi a commencé : si le serveur tombe pendant l'appel, on ne sait pas
+# s'il a abouti, et le rejeu vérifie d'abord ce qui est déjà dans l'onglet.
+# `rejete` = mise de côté par la file après des échecs répétés (voir ecritures.py) : pas
+# rejouée au démarrage, mais listée dans le Mode Admin jusqu'à ce qu'on la renvoie.
+
+RETENTION_JOURS = 7
+
+def id_evenement(op):
+    if op["type"] != "append": return uuid.uuid4().hex
+    contenu = repr((op["worksheet"], [tuple(str(v) for v in r) for r in op["rows"]]))
+    return hashlib.sha1(contenu.encode("utf-8")).hexdigest()
+
+class JournalLocal:
+    def __init__(self, chemin, identite="", anciennes_identites=()):
+        self.chemin = chemin
+        # Un journal ne rejoue que vers la source qui l'a écrit (backend / base)
+        self.identite = identite
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(chemin, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS journal (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT, evt TEXT, identite TEXT, op BLOB,
+            depose REAL, tente INTEGER DEFAULT 0, envoye REAL, rejete REAL, erreur TEXT)""")
+        # Journal créé par une version précédente : colonnes ajoutées
+        colonnes = {c[1] for c in self._db.execute("PRAGMA table_info(journal)")}
+        for colonne, type_sql in (("rejete", "REAL"), ("erreur", "TEXT")):
+            if colonne not in colonnes: self._db.execute(f"ALTER TABLE journal ADD COLUMN {colonne} {type_sql}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS journal_attente ON journal (identite, envoye, evt)")
+        # Même source sous un ancien nom : ses saisies en attente sont reprises
+        for ancienne in anciennes_identites:
+            if ancienne != identite:
+                self._db.execute("UPDATE journal SET identite = ? WHERE identite = ? AND envoye IS NULL", (identite, ancienne))
+        # Purge des opérations envoyées depuis longtemps (le journal n'est pas une archive)
+        self._db.execute("DELETE FROM journal WHERE envoye IS NOT NULL AND envoye < ?", (time.time() - RETENTION_JOURS * 86400,))
+
+    def deposer(self, op):
+        # Renvoie le numéro d'ordre de l'opération, ou None si l'événement attend déjà
+        evt = id_evenement(op)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                deja = self._db.execute("SELECT 1 FROM journal WHERE identite = ? AND evt = ? AND envoye IS NULL AND rejete IS NULL",
+                                        (self.identite, evt)).fetchone()
+                if deja: seq = None
+                else:
+                    seq = self._db.execute("INSERT INTO journal (evt, identite, op, depose) VALUES (?, ?, ?, ?)",
+                                           (evt, self.identite, pickle.dumps(op), time.time())).lastrowid
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK"); raise
+        return seq
+
+    def en_attente(self):
+        # Opérations pas encore confirmées par le stockage, dans l'ordre de dépôt
+        with self._lock:
+            lignes = self._db.execute("SELECT seq, op, tente FROM journal WHERE identite = ? AND envoye IS NULL AND rejete IS NULL ORDER BY seq",
+                                      (self.identite,)).fetchall()
+        return [dict(pickle.loads(op), id=seq, incertain=bool(tente)) for seq, op, tente in lignes]
+
+    def rejetees(self):
+        with self._lock:
+            lignes = self._db.execute("SELECT seq, op, erreur, rejete FROM journal WHERE identite = ? AND envoye IS NULL AND rejete IS NOT NULL ORDER BY seq",
+                                      (self.identite,)).fetchall()
+        return [{"op": dict(pickle.loads(op), id=seq), "erreur": erreur, "quand": rejete} for seq, op, erreur, rejete in lignes]
+
+    def _marquer(self, colonne, valeur, seqs, erreur=None):
+        if not seqs: return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany(f"UPDATE journal SET {colonne} = ?, erreur = ? WHERE seq = ?", [(valeur, erreur, s) for s in seqs])
+            self._db.execute("COMMIT")
+
+    def marquer_tentes(self, seqs): self._marquer("tente", 1, seqs)
+
+    def marquer_envoyes(self, seqs): self._marquer("envoye", time.time(), seqs)
+
+    def marquer_rejetes(self, seqs, erreur): self._marquer("rejete", time.time(), seqs, erreur)
+
+    def relancer(self, seqs): self._marquer("rejete", None, seqs)
@@ -0,0 +1,330 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from stockage import projeter
+from donnees import CacheLogs, CacheFeuilles, concat_logs
+from ecritures import FileEcritures
+from journal import JournalLocal
+from archives import ONGLET_ARCHIVES, COLS_ARCHIVES, charger_partitions
+from prevision import ModelePrevision, ETAPES, NB_SIMULATIONS
+from profilage import etape
+from calculs import (deviner_contexte_poste, get_info_msn, calculer_kpi_pannes, etats_live_postes,
+                     heure_fr, debut_semaine, info_shift, agreger_shifts, SHIFTS, NB_SHIFTS,
+                     DEBUT_SEMAINE, COLS_SHIFTS, DTYPE_TYPE, horloge_productive, instant_productif,
+                     cube_causes, COLS_CAUSES)
+
+# ==============================================================================
+# MOTEUR DE L'ATELIER (SANS STREAMLIT)
+# ==============================================================================
+# Tout ce qui ne dépend pas de l'affichage : caches partagés des onglets, file
+# d'écritures, calendrier des shifts et calculs sur les Logs. Un seul moteur par
+# process (App.py le garde en st.cache_resource) : un rerun ne fait plus que lire
+# son état et dessiner. Utilisable tel quel depuis un script ou les benchmarks :
+#
+#   moteur = Moteur(StockageSQLite("atelier.db"))
+#   moteur.rafraichir_logs()
+#   moteur.comptages_semaine(moteur.debut_semaine())
+
+COLS_LOGS = ["Date", "Heure", "Poste", "SE_Unique", "MSN_Display", "Etape", "Info_Sup"]
+COLS_PANNES = ["Zone", "Nom"]
+ETAPES_PANNE = ["APPEL_REGLAGE", "INCIDENT_EN_COURS", "INCIDENT_FINI"]
+PANNES_DEFAUT = [["GAUCHE", "🔧 Capot Gauche (ST1)"], ["GAUCHE", "🔧 PAF"],
+                 ["DROIT", "🔧 Capot Droit (ST2)"], ["GENERIC", "⚠️ SO3 - Pipes"]]
+INTERVALLE_CACHE = 5
+NB_SEMAINES_APPRENTISSAGE = 4   # semaines archivées (les plus récentes) apprises par la prévision
+MAJ_MODELE = 600                # s entre deux apprentissages du modèle de prévision
+
+class Moteur:
+    def __init__(self, stockage, intervalle=INTERVALLE_CACHE, fichier_instantane=None, identite="", fichier_journal=None,
+                 anciennes_identites=()):
+        self.stockage = stockage
+        self.cache_feuilles = CacheFeuilles(stockage, intervalle=intervalle)
+        # fichier_instantane : état dérivé des Logs sur disque, pour redémarrer sans tout relire
+        self.cache_logs = CacheLogs(stockage, COLS_LOGS, delai_min=intervalle,
+                                    fichier_instantane=fichier_instantane, identite=identite)
+        # fichier_journal : saisies sur disque avant envoi, rejouées après un redémarrage
+        journal = JournalLocal(fichier_journal, identite, anciennes_identites) if fichier_journal else None
+        if journal:
+            # Ce qui n'est pas encore dans le stockage reste visible dès le démarrage
+            for op in journal.en_attente(): self._afficher_local(op)
+        self.file_ecritures = FileEcritures(stockage, self._apres_ecriture, journal, self._apres_rejet)
+        self._lock = threading.Lock()
+        self._rotations = set()      # semaines dont la rotation est déjà en file
+        self._shifts_clos = {}       # (semaine, shift) -> agrégats figés d'un shift terminé
+        self._shifts_live = (None, None)
+        self._shifts_archives = {}   # onglet d'archive -> agrégats de ses shifts (immuables)
+        self._causes_clos = {}       # (semaine, shift) -> cube des causes d'un shift terminé
+        self._causes_live = (None, None)
+        self._causes_archives = {}   # onglet d'archive -> cube des causes de la semaine
+        self._partitions = {}        # onglet d'archive -> Logs parsés (immuables)
+        self._modele = (None, None)  # (instant d'apprentissage, ModelePrevision)
+        self._prevision = (None, None)
+
+    def _apres_ecriture(self, op):
+        if op["worksheet"] != "Logs": self.cache_feuilles.invalider(op["worksheet"])
+        elif op["type"] == "append": self.cache_logs.marquer_ecrits(op["rows"])
+        elif op["type"] == "archive": self.cache_feuilles.invalider(ONGLET_ARCHIVES); self.cache_logs.forcer_rechargement()
+        else: self.cache_logs.invalider()
+
+    def _apres_rejet(self, op):
+        # Opération mise de côté par la file : l'écran ne doit plus la montrer comme faite
+        if op["worksheet"] != "Logs": self.cache_feuilles.invalider(op["worksheet"])
+        elif op["type"] == "append": self.cache_logs.retirer_locaux(op["rows"])
+        else: self.cache_logs.invalider()
+
+    def _afficher_local(self, op):
+        if op["type"] == "append":
+            if op["worksheet"] == "Logs": self.cache_logs.ajouter_local(op["rows"])
+            else: self.cache_feuilles.appliquer_local(op["worksheet"], lignes=op["rows"])
+        elif op["type"] == "overwrite" and op["worksheet"] != "Logs":
+            self.cache_feuilles.appliquer_local(op["worksheet"], df_nouveau=op["df"].copy())
+
+    # --- MIGRATIONS (une fois au démarrage du process, jamais pendant une lecture) ---
+    def migrer(self):
+        # Onglet Pannes vide ou absent : liste par défaut. Écriture conditionnelle : si un
+        # autre serveur l'a rempli entre-temps, on n'y touche pas.
+        try:
+            df, revision = self.stockage.read_versioned("Pannes")
+            if not projeter(df, COLS_PANNES).empty: return
+            self.stockage.overwrite("Pannes", pd.DataFrame(PANNES_DEFAUT, columns=COLS_PANNES), revision=revision)
+            self.cache_feuilles.invalider("Pannes")
+        except Exception:
+            pass   # conflit ou réseau : réessayé au prochain démarrage, l'affichage a sa liste par défaut
+
+    # --- LECTURES ---
+    def lire(self, worksheet, cols):
+        # Onglet absent, trop étroit ou illisible : tableau vide aux bonnes colonnes
+        with etape(f"safe_read:{worksheet}"):
+            try:
+                df = self.cache_feuilles.lire(worksheet)
+                if df.empty or len(df.columns) < len(cols):
+                    return pd.DataFrame(columns=cols)
+                return df[df.columns[:len(cols)]].set_axis(cols, axis=1)
+            except Exception:
+                return pd.DataFrame(columns=cols)
+
+    def rafraichir_logs(self):
+        # Lecture incrémentale ; en cas d'erreur réseau on garde le dernier état connu
+        try: return self.cache_logs.rafraichir()
+        except Exception: return self.cache_logs.df
+
+    @property
+    def etats(self): return self.cache_logs.etats
+
+    @property
+    def index_msn(self): return self.cache_logs.index_msn
+
+    def charger_archives(self, onglets):
+        return charger_partitions(self.stockage, COLS_LOGS, list(onglets))
+
+    # --- ÉCRITURES (en file, affichage optimiste immédiat) ---
+    def ajouter(self, worksheet, row, cols):
+        # None : le même événement attend déjà son envoi (double clic, formulaire renvoyé)
+        if self.file_ecritures.ajouter(worksheet, [row], cols) is None: return
+        if worksheet == "Logs": self.cache_logs.ajouter_local([row])
+        else: self.cache_feuilles.appliquer_local(worksheet, lignes=[row])
+
+    def ecraser(self, worksheet, df):
+        self.file_ecritures.ecraser(worksheet, df)
+        if worksheet == "Logs": self.cache_logs.invalider()
+        else: self.cache_feuilles.appliquer_local(worksheet, df_nouveau=df.copy())
+
+    def supprimer(self, worksheet, cols, cle, df_a_supprimer, df_restant):
+        self.file_ecritures.supprimer(worksheet, cols, cle, df_a_supprimer[cle].astype(str).values.tolist())
+        self.cache_feuilles.appliquer_local(worksheet, df_nouveau=df_restant.copy())
+
+    def relancer_rejetees(self):
+        # Mode Admin : les écritures mises de côté repartent et réapparaissent tout de suite
+        for op in self.file_ecritures.relancer(): self._afficher_local(op)
+
+    def abandonner_rejetees(self): self.file_ecritures.abandonner()
+
+    def planifier_rotation(self, debut, msn_a_garder=()):
+        # Une fois par process et par semaine : les semaines closes quittent l'onglet Logs
+        # (voir archives.py). Rejouable, donc sans risque si plusieurs serveurs le font.
+        with self._lock:
+            if debut in self._rotations: return
+            self._rotations.add(debut)
+        self.file_ecritures.archiver("Logs", COLS_LOGS, debut, list(msn_a_garder))
+
+    # --- CALENDRIER ---
+    def maintenant(self): return heure_fr()
+    def debut_semaine(self): return debut_semaine(heure_fr())
+    def info_shift(self): return info_shift(heure_fr())
+
+    # --- CALCULS ---
+    def comptages_semaine(self, debut):
+        # Série / Rework / MIP terminées, d'après le dernier état de chaque pièce (EtatPieces)
+        return self.cache_logs.pieces.compter(debut)
+
+    @staticmethod
+    def _shifts_termines(debut, now):
+        # Un shift est clos quand le suivant a commencé (ce qui suit sa fin lui est encore compté)
+        lundi, now = debut - DEBUT_SEMAINE, pd.Timestamp(now)
+        fin_semaine = debut + pd.Timedelta(days=7)
+        return [now >= (lundi + SHIFTS[i + 1][2] if i + 1 < NB_SHIFTS else fin_semaine) for i in range(NB_SHIFTS)]
+
+    def _logs_a_recalculer(self, debut, premier):
+        # Lignes utiles aux shifts non figés (premier = index du premier) : depuis le début de
+        # ce shift, et plus tôt si une panne y était encore ouverte (elle compte pour son shift
+        # de clôture, attente depuis l'appel) -- on remonte alors au dernier APPEL du poste
+        df = self.cache_logs.df
+        coupure = debut - DEBUT_SEMAINE + SHIFTS[premier][2]
+        avant = df[(df["DateTime"] < coupure) & df["Etape"].isin(ETAPES_PANNE)]
+        borne = coupure
+        if not avant.empty:
+            avant = avant.sort_values("DateTime", kind="stable")
+            etape = avant["Etape"].astype(str)
+            precedente = etape.groupby(avant["Poste"], observed=True).shift()
+            # Même règle que cycles_pannes : clos ssi le dernier événement est un FINI juste après un EN_COURS
+            clos = (etape == "INCIDENT_FINI") & (precedente == "INCIDENT_EN_COURS")
+            ouverts = avant.loc[~avant["Poste"].duplicated(keep="last") & ~clos, "Poste"]
+            if len(ouverts):
+                avant = avant[avant["Poste"].isin(ouverts)]
+                appels = avant[avant["Etape"] == "APPEL_REGLAGE"].groupby("Poste", observed=True)["DateTime"].max()
+                premiers = avant.groupby("Poste", observed=True)["DateTime"].min()
+                borne = min(borne, appels.combine_first(premiers).min())
+        return df[df["DateTime"] >= borne]
+
+    def shifts_semaine(self, debut, now):
+        # Les 9 shifts de la semaine (à venir : zéros). Un shift clos est calculé une dernière
+        # fois, puis figé. Le reste n'est recalculé que si les Logs ont changé, et seulement
+        # à partir du premier shift non figé.
+        debut = pd.Timestamp(debut)
+        clos = self._shifts_termines(debut, now)
+        with self._lock:
+            lignes = [self._shifts_clos.get((debut, i)) for i in range(NB_SHIFTS)]
+            if any(l is None for l in lignes):
+                premier = next(i for i, l in enumerate(lignes) if l is None)
+                cle = (debut, self.cache_logs.version, premier)
+                if self._shifts_live[0] != cle:
+                    table = agreger_shifts(self._logs_a_recalculer(debut, premier))
+                    table = table[table["Semaine"] == debut].set_index("Shift")
+                    self._shifts_live = (cle, table)
+                table = self._shifts_live[1]
+                for i in range(NB_SHIFTS):
+                    if lignes[i] is not None: continue
+                    lignes[i] = dict(table.loc[i]) if i in table.index else {"Série": 0, "Rework": 0, "MIP": 0, "Arret_min": 0.0}
+                    lignes[i].update(Semaine=debut, Shift=i)
+                    if clos[i]: self._shifts_clos[(debut, i)] = lignes[i]
+        return pd.DataFrame(lignes, columns=COLS_SHIFTS)
+
+    def shifts_archives(self, onglets):
+        # Semaines archivées : une partition ne change plus, agrégée une fois par process
+        morceaux = []
+        for onglet in onglets:
+            if onglet not in self._shifts_archives:
+                df = self._partition(onglet)
+                self._shifts_archives[onglet] = agreger_shifts(df) if df is not None else pd.DataFrame(columns=COLS_SHIFTS)
+            morceaux.append(self._shifts_archives[onglet])
+        if not morceaux: return pd.DataFrame(columns=COLS_SHIFTS)
+        return pd.concat(morceaux, ignore_index=True).sort_values(["Semaine", "Shift"], ignore_index=True)
+
+    def causes_semaine(self, debut, now):
+        # Cube des causes de la semaine (calculs.cube_causes), figé shift par shift comme
+        # shifts_semaine : seul le shift en cours est recalculé quand les Logs changent, sur les
+        # lignes de ce shift (_logs_a_recalculer) et non plus tout l'onglet
+        debut = pd.Timestamp(debut)
+        clos = self._shifts_termines(debut, now)
+        with self._lock:
+            morceaux = [self._causes_clos.get((debut, i)) for i in range(NB_SHIFTS)]
+            if any(m is None for m in morceaux):
+                premier = next(i for i, m in enumerate(morceaux) if m is None)
+                cle = (debut, self.cache_logs.version, premier)
+                if self._causes_live[0] != cle:
+                    # Seulement les shifts non figés (un cube est rangé par shift de clôture)
+                    cube = cube_causes(self._logs_a_recalculer(debut, premier))
+                    self._causes_live = (cle, cube[cube["Semaine"] == debut])
+                cube = self._causes_live[1]
+                for i in range(NB_SHIFTS):
+                    if morceaux[i] is not None: continue
+                    morceaux[i] = cube[cube["Shift"] == i]
+                    if clos[i]: self._causes_clos[(debut, i)] = morceaux[i]
+        morceaux = [m for m in morceaux if len(m)]
+        return pd.concat(morceaux, ignore_index=True) if morceaux else pd.DataFrame(columns=COLS_CAUSES)
+
+    def causes_archives(self, onglets):
+        # Semaines archivées : cube calculé une fois par partition et par process
+        morceaux = []
+        for onglet in onglets:
+            if onglet not in self._causes_archives:
+                df = self._partition(onglet)
+                self._causes_archives[onglet] = cube_causes(df) if df is not None else pd.DataFrame(columns=COLS_CAUSES)
+            if len(self._causes_archives[onglet]): morceaux.append(self._causes_archives[onglet])
+        return pd.concat(morceaux, ignore_index=True) if morceaux else pd.DataFrame(columns=COLS_CAUSES)
+
+    def _partition(self, onglet):
+        if onglet not in self._partitions:
+            self._partitions[onglet] = charger_partitions(self.stockage, COLS_LOGS, [onglet])
+        return self._partitions[onglet]
+
+    def _modele_prevision(self):
+        # Appris sur la semaine en cours + les dernières semaines archivées, réappris au plus
+        # toutes les MAJ_MODELE secondes (les durées d'étapes bougent lentement)
+        appris_a, modele = self._modele
+        if modele is not None and time.monotonic() - appris_a < MAJ_MODELE: return modele
+        onglets = self.lire(ONGLET_ARCHIVES, COLS_ARCHIVES)["Onglet"].tolist()[-NB_SEMAINES_APPRENTISSAGE:]
+        morceaux = [p for p in map(self._partition, onglets) if p is not None] + [self.cache_logs.df]
+        modele = ModelePrevision(concat_logs(morceaux))
+        self._modele = (time.monotonic(), modele)
+        return modele
+
+    def prevision(self, postes, debut, now, objectif, nb_realise, nb_simulations=NB_SIMULATIONS):
+        # Fin de semaine simulée depuis l'état actuel des postes (prevision.py). Même résultat
+        # tant que ni les Logs ni la minute ne changent : un seul calcul pour toutes les sessions.
+        cle = (self.cache_logs.version, pd.Timestamp(now).floor("min"), objectif, nb_realise, tuple(postes))
+        with self._lock:
+            if self._prevision[0] == cle: return self._prevision[1]
+        modele = self._modele_prevision()
+
+        # État de départ : étape en cours de chaque poste, temps passé dedans (et dans une panne en cours)
+        h_now = horloge_productive([now])[0]
+        lignes = []
+        for poste in postes:
+            etat = self.cache_logs.etats.get(poste)
+            prod, dernier = etat["dernier_prod"], etat["dernier"]
+            if prod is None or prod["Etape"] not in ETAPES: continue
+            ecoule = h_now - horloge_productive([prod["DateTime"]])[0]
+            en_panne = dernier["Etape"] in ("APPEL_REGLAGE", "INCIDENT_EN_COURS")
+            panne = h_now - horloge_productive([dernier["DateTime"]])[0] if en_panne else np.nan
+            lignes.append((poste, prod["Etape"], prod.get("MSN_Display"), ETAPES.index(prod["Etape"]),
+                           DTYPE_TYPE.categories.get_loc(prod["Type"]), max(ecoule - np.nan_to_num(panne), 0.0), panne))
+        horizon = horloge_productive([pd.Timestamp(debut) + pd.Timedelta(days=7)])[0] - h_now
+
+        if lignes:
+            _, _, _, etapes, types, ecoules, pannes = zip(*lignes)
+            series, pieces, sortie = modele.simuler(etapes, types, ecoules, pannes, horizon, nb_simulations)
+        else:
+            series, pieces, sortie = np.zeros(nb_simulations, dtype="int64"), np.zeros((nb_simulations, 0)), np.zeros((nb_simulations, 0))
+        total = nb_realise + series
+        sort_finie = np.isfinite(sortie)
+        # Heure de sortie : médiane des simulations où la pièce sort avant la fin de semaine
+        mediane = np.array([np.median(s[f]) if f.any() else np.nan for s, f in zip(sortie.T, sort_finie.T)])
+        resultat = {
+            "proba": float((total >= objectif).mean()),
+            "attendu": float(total.mean()),
+            "p10": int(np.percentile(total, 10)), "p50": int(np.percentile(total, 50)), "p90": int(np.percentile(total, 90)),
+            "postes": pd.DataFrame({
+                "Poste": [l[0] for l in lignes],
+                "Etape": [l[1] for l in lignes],
+                "MSN": [l[2] for l in lignes],
+                "Sortie": pd.Series(instant_productif(h_now + mediane)).where(~np.isnan(mediane)),
+                "Proba_sortie": sort_finie.mean(axis=0),
+                "Pieces": pieces.mean(axis=0),
+            }),
+        }
+        with self._lock: self._prevision = (cle, resultat)
+        return resultat
+
+    def statut_msn(self, msn):
+        return get_info_msn(msn, self.cache_logs.index_msn)
+
+    def contexte_poste(self, poste):
+        return deviner_contexte_poste(poste, self.cache_logs.etats)
+
+    def etats_live(self, postes, debut, now):
+        return etats_live_postes(self.cache_logs.etats, self.cache_logs.durees, postes, debut, now)
+
+    def kpi_pannes(self, df):
+        return calculer_kpi_pannes(df)
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from calculs import (cycles_pannes, horloge_productive, DTYPE_TYPE, mapping_etapes, ETAPES_PROD,
+                     ETAPE_SUIVANTE)
+
+# ==============================================================================
+# PRÉVISION DE FIN DE SEMAINE (MONTE CARLO)
+# ==============================================================================
+# Durées d'étapes et incidents appris sur les Logs, par (Type, Etape). À partir de l'état
+# actuel des postes, des milliers de fins de semaine sont simulées d'un coup (tableaux
+# simulations x postes) : probabilité d'atteindre l'objectif, nombre de Série attendu,
+# heure de sortie probable de la prochaine pièce de chaque poste.
+# Le temps est compté en minutes de shift (calculs.horloge_productive).
+
+NB_SIMULATIONS = 2000
+ETAPES = ETAPES_PROD
+# Durées (min) quand les Logs ne disent rien
+DUREE_DEFAUT = {"PHASE_SETUP": 35, "STATION_BRAS": 35, "STATION_TRK1": 90, "STATION_TRK2": 60,
+                "PHASE_RAPPORT": 40, "PHASE_DESETUP": 25, "FIN": 10}
+DUREE_MIN = 0.5   # une étape simulée dure au moins 30 s (pas de boucle infinie sur des durées nulles)
+SEUIL_FINIE = 95  # Progression à partir de laquelle une pièce compte comme terminée (compter_pieces)
+
+NB_ETAPES, NB_TYPES = len(ETAPES), len(DTYPE_TYPE.categories)
+SERIE = DTYPE_TYPE.categories.get_loc("Série")
+_PROGRESSION = np.array([mapping_etapes[e] for e in ETAPES])
+
+def _echantillons(cles, valeurs, nb_cles, repli):
+    # Échantillons triés de chaque clé, mis bout à bout : valeurs[debut[k]:debut[k] + nb[k]].
+    # repli(k) fournit les échantillons d'une clé sans données.
+    morceaux = []
+    for k in range(nb_cles):
+        v = valeurs[cles == k]
+        morceaux.append(np.sort(v if len(v) else np.asarray(repli(k), dtype="float64")))
+    nb = np.array([len(m) for m in morceaux])
+    return np.concatenate(morceaux), np.r_[0, np.cumsum(nb)[:-1]], nb
+
+class ModelePrevision:
+    def __init__(self, df):
+        # --- Étapes de production, poste par poste, sur l'horloge productive ---
+        prod = df[df["Etape"].isin(ETAPES)].sort_values(["Poste", "DateTime"], kind="stable")
+        poste = prod["Poste"].cat.codes.to_numpy() if len(prod) else np.zeros(0, dtype="int64")
+        etape = pd.Categorical(prod["Etape"].astype(str), categories=ETAPES).codes.astype("int64")
+        type_ = prod["Type"].cat.codes.to_numpy().astype("int64")
+        t = horloge_productive(prod["DateTime"]) if len(prod) else np.zeros(0)
+
+        # --- Arrêts (pannes clôturées) ---
+        cycles = cycles_pannes(df)
+        if cycles is None: debuts_arret = fins_arret = np.zeros(0); arrets_poste = np.zeros(0, dtype="int64")
+        else:
+            df_maint, ordre, heures, idx_appel, _, idx_fin = cycles
+            arrets_poste = df_maint["Poste"].cat.codes.to_numpy()[ordre[idx_fin]].astype("int64")
+            debuts_arret, fins_arret = horloge_productive(heures[idx_appel]), horloge_productive(heures[idx_fin])
+
+        # Postes décalés sur l'axe du temps : un seul tableau trié pour tous les postes
+        tout = np.r_[t, debuts_arret, fins_arret]
+        origine, etendue = (tout.min(), tout.max() - tout.min() + 1) if len(tout) else (0.0, 1.0)
+        x = t - origine + poste * etendue
+        debuts_arret = debuts_arret - origine + arrets_poste * etendue
+        fins_arret = fins_arret - origine + arrets_poste * etendue
+
+        # Cumul du temps d'arrêt le long de l'axe (linéaire pendant une panne)
+        tri = np.argsort(debuts_arret, kind="stable")
+        debuts_arret, fins_arret, arrets_poste = debuts_arret[tri], fins_arret[tri], arrets_poste[tri]
+        duree_arrets = np.maximum(fins_arret - debuts_arret, 0)
+        noeuds = np.column_stack([debuts_arret, debuts_arret + duree_arrets]).ravel()
+        cumul = np.column_stack([np.r_[0, np.cumsum(duree_arrets)[:-1]], np.cumsum(duree_arrets)]).ravel()
+        arret_cumule = (lambda v: np.interp(v, noeuds, cumul)) if len(noeuds) else (lambda v: np.zeros(len(v)))
+
+        # --- Durée nette de chaque étape : jusqu'à l'événement suivant du même poste, arrêts déduits ---
+        suite = poste[1:] == poste[:-1] if len(poste) else np.zeros(0, dtype=bool)
+        duree = (x[1:] - x[:-1]) - (arret_cumule(x[1:]) - arret_cumule(x[:-1]))
+        cles = (type_[:-1] * NB_ETAPES + etape[:-1])[suite]
+        duree, etape_de, etape_vers = np.maximum(duree[suite], 0), etape[:-1][suite], etape[1:][suite]
+
+        # Enchaînement appris : étape suivante la plus fréquente (sinon celui de la sidebar)
+        self.suivante = np.array([ETAPES.index(ETAPE_SUIVANTE[e]) for e in ETAPES])
+        for e in range(NB_ETAPES):
+            vers = etape_vers[etape_de == e]
+            if len(vers): self.suivante[e] = np.bincount(vers, minlength=NB_ETAPES).argmax()
+        self.termine = (_PROGRESSION < SEUIL_FINIE) & (_PROGRESSION[self.suivante] >= SEUIL_FINIE)
+
+        # Durées par (Type, Etape) ; à défaut toutes pièces confondues pour l'étape ; à défaut la table fixe
+        self.durees, self.debut, self.nb = _echantillons(
+            cles, duree, NB_TYPES * NB_ETAPES,
+            lambda k: duree[etape_de == k % NB_ETAPES] if (etape_de == k % NB_ETAPES).any() else [DUREE_DEFAUT[ETAPES[k % NB_ETAPES]]])
+        # Axe trié par clé (pour tirer une durée restante au-delà du temps déjà passé)
+        self._borne = self.durees.max() + 1 if len(self.durees) else 1.0
+        self._axe = self.durees + np.repeat(np.arange(len(self.nb)), self.nb) * self._borne
+
+        # --- Incidents : taux par minute d'étape pour chaque (Type, Etape), durées toutes pannes ---
+        self.arrets = np.sort(duree_arrets)
+        if len(debuts_arret) and len(x):
+            pendant = np.clip(np.searchsorted(x, debuts_arret, side="right") - 1, 0, len(x) - 1)
+            valide = poste[pendant] == arrets_poste
+            nb_incidents = np.bincount((type_ * NB_ETAPES + etape)[pendant[valide]], minlength=NB_TYPES * NB_ETAPES)
+        else: nb_incidents = np.zeros(NB_TYPES * NB_ETAPES)
+        minutes = np.bincount(cles, weights=duree, minlength=NB_TYPES * NB_ETAPES)
+        self.taux = np.divide(nb_incidents, minutes, out=np.zeros(NB_TYPES * NB_ETAPES), where=minutes > 0)
+
+        # Mix des pièces lancées (Série / Rework / MIP) pour les pièces à venir
+        lancees = np.bincount(type_[etape == 0], minlength=NB_TYPES).astype("float64")
+        self.mix = lancees / lancees.sum() if lancees.sum() else np.eye(NB_TYPES)[SERIE]
+
+    def _tirer(self, cles, rng):
+        return self.durees[self.debut[cles] + (rng.random(cles.shape) * self.nb[cles]).astype("int64")]
+
+    def _reste(self, cles, ecoule, rng):
+        # Durée restante sachant `ecoule` minutes déjà passées dans l'étape (échantillons plus longs)
+        fin = self.debut[cles] + self.nb[cles]
+        bas = np.maximum(np.searchsorted(self._axe, ecoule + cles * self._borne, side="right"), self.debut[cles])
+        idx = bas + (rng.random(cles.shape) * np.maximum(fin - bas, 0)).astype("int64")
+        return np.where(bas < fin, self.durees[np.minimum(idx, len(self.durees) - 1)] - ecoule, 0.0)
+
+    def _incidents(self, cles, duree, rng):
+        # Nombre de pannes (Poisson) sur la durée de l'étape, chacune avec une durée observée
+        if not len(self.arrets): return np.zeros(duree.shape)
+        nb = rng.poisson(self.taux[cles] * duree)
+        arret = np.zeros(duree.shape)
+        for j in range(nb.max()):
+            qui = nb > j
+            arret[qui] += self.arrets[rng.integers(len(self.arrets), size=qui.sum())]
+        return arret
+
+    def simuler(self, etapes, types, ecoules, arrets_ecoules, horizon, nb_simulations=NB_SIMULATIONS, graine=0):
+        # Un poste par colonne : étape en cours, type de la pièce, minutes déjà passées dans
+        # l'étape, minutes déjà passées dans une panne en cours (NaN : pas de panne).
+        # Renvoie (Série terminées par simulation, pièces terminées par simulation et poste,
+        # instant de la prochaine sortie par simulation et poste, inf si après `horizon`).
+        rng = np.random.default_rng(graine)
+        forme = (nb_simulations, len(etapes))
+        e = np.broadcast_to(np.asarray(etapes, dtype="int64"), forme).copy()
+        y = np.broadcast_to(np.asarray(types, dtype="int64"), forme).copy()
+        cles = y * NB_ETAPES + e
+        en_panne = ~np.isnan(np.asarray(arrets_ecoules, dtype="float64"))
+        t = np.zeros(forme)
+        if en_panne.any() and len(self.arrets):
+            # Panne en cours : reste d'une durée de panne plus longue que ce qui est déjà passé
+            ecoule_panne = np.broadcast_to(np.nan_to_num(arrets_ecoules), forme)
+            bas = np.searchsorted(self.arrets, ecoule_panne, side="right")
+            idx = bas + (rng.random(forme) * (len(self.arrets) - bas)).astype("int64")
+            reste = np.where(bas < len(self.arrets), self.arrets[np.minimum(idx, len(self.arrets) - 1)] - ecoule_panne, 0.0)
+            t += np.where(en_panne, reste, 0.0)
+        reste = np.maximum(self._reste(cles, np.broadcast_to(np.asarray(ecoules, dtype="float64"), forme), rng), DUREE_MIN)
+        t += reste + self._incidents(cles, reste, rng)
+
+        series = np.zeros(nb_simulations, dtype="int64")
+        pieces = np.zeros(forme, dtype="int64")
+        sortie = np.full(forme, np.inf)
+        actif = np.ones(forme, dtype=bool)
+        while True:
+            # Fin de l'étape en cours à l'instant t : passage à la suivante
+            fini = actif & self.termine[e] & (t <= horizon)
+            series += (fini & (y == SERIE)).sum(axis=1)
+            pieces += fini
+            sortie = np.where(fini & np.isinf(sortie), t, sortie)
+            e = np.where(actif, self.suivante[e], e)
+            nouvelle = actif & (e == 0)
+            if nouvelle.any(): y[nouvelle] = rng.choice(NB_TYPES, size=nouvelle.sum(), p=self.mix)
+            actif &= t < horizon
+            if not actif.any(): break
+            cles = y * NB_ETAPES + e
+            duree = np.maximum(self._tirer(cles, rng), DUREE_MIN)
+            t = np.where(actif, t + duree + self._incidents(cles, duree, rng), t)
+        return series, pieces, sortie
@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+import collections
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# PROFILAGE DES RERUNS (MODE ADMIN)
+# ==============================================================================
+# Chaque rerun (script complet ou fragment live) est une "mesure" : durée totale, durée
+# de chaque étape (lectures, parsing, sidebar, agrégations...) et appels au stockage
+# faits pendant le rerun. Les dernières mesures sont gardées en mémoire (une file par
+# process) pour le panneau admin, et peuvent être écrites en JSON lignes dans un fichier.
+#
+#   with etape("calculer_kpi_pannes"): ...     # no-op si aucune mesure en cours
+
+NB_MESURES = 2000
+FENETRE_SHIFT = 8 * 3600
+
+_courante = threading.local()
+
+class Mesure:
+    def __init__(self, type_run, session):
+        self.type = type_run
+        self.session = session
+        self.debut = time.time()
+        self._t0 = time.perf_counter()
+        self.etapes = {}          # nom -> [ms cumulées, nb d'appels]
+        self.appels = {}          # opération stockage -> nb (thread du rerun uniquement)
+        self.interrompu = False
+
+    def ajouter(self, nom, ms):
+        e = self.etapes.setdefault(nom, [0.0, 0])
+        e[0] += ms; e[1] += 1
+
+    def en_dict(self):
+        total = (time.perf_counter() - self._t0) * 1000
+        return {"debut": round(self.debut, 3), "type": self.type, "session": self.session,
+                "total_ms": round(total, 2), "interrompu": self.interrompu,
+                "etapes": {n: round(v[0], 2) for n, v in self.etapes.items()},
+                "appels": dict(self.appels)}
+
+@contextmanager
+def etape(nom):
+    mesure = getattr(_courante, "mesure", None)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if mesure is not None: mesure.ajouter(nom, (time.perf_counter() - t0) * 1000)
+
+def chronometre(nom):
+    # Décorateur : toute la fonction compte comme une étape
+    def decorer(fonction):
+        def envelopper(*args, **kwargs):
+            with etape(nom): return fonction(*args, **kwargs)
+        envelopper.__name__ = fonction.__name__
+        return envelopper
+    return decorer
+
+class Profileur:
+    def __init__(self, fichier=None):
+        self.mesures = collections.deque(maxlen=NB_MESURES)
+        self.fichier = fichier
+        self._lock = threading.Lock()
+
+    def demarrer(self, type_run, session):
+        # Un rerun coupé par st.rerun() / st.stop() n'atteint jamais terminer() : on l'enregistre ici
+        ancienne = getattr(_courante, "mesure", None)
+        if ancienne is not None:
+            ancienne.interrompu = True
+            self._enregistrer(ancienne)
+        _courante.mesure = Mesure(type_run, session)
+        return _courante.mesure
+
+    def terminer(self, mesure):
+        if getattr(_courante, "mesure", None) is mesure: _courante.mesure = None
+        self._enregistrer(mesure)
+
+    @contextmanager
+    def mesure(self, type_run, session):
+        # Fragment : mesure propre s'il tourne seul, simple étape s'il fait partie du rerun complet
+        if getattr(_courante, "mesure", None) is not None:
+            with etape(type_run): yield
+            return
+        m = self.demarrer(type_run, session)
+        try:
+            yield
+        finally:
+            self.terminer(m)
+
+    def _enregistrer(self, mesure):
+        ligne = mesure.en_dict()
+        with self._lock:
+            self.mesures.append(ligne)
+            if self.fichier:
+                with open(self.fichier, "a", encoding="utf-8") as f: f.write(json.dumps(ligne, ensure_ascii=False) + "\n")
+
+    def dernieres(self, fenetre=FENETRE_SHIFT):
+        limite = time.time() - fenetre
+        with self._lock: return [m for m in self.mesures if m["debut"] >= limite]
+
+    def export_jsonl(self):
+        with self._lock: return "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in self.mesures)
+
+    def synthese(self, fenetre=FENETRE_SHIFT):
+        # p50 / p95 par type de rerun et par étape, sur la fenêtre (un shift par défaut)
+        mesures = self.dernieres(fenetre)
+        if not mesures: return pd.DataFrame()
+        lignes = []
+        for type_run in sorted({m["type"] for m in mesures}):
+            du_type = [m for m in mesures if m["type"] == type_run]
+            series = {"TOTAL": [m["total_ms"] for m in du_type]}
+            for m in du_type:
+                for nom, ms in m["etapes"].items(): series.setdefault(nom, []).append(ms)
+            for nom, valeurs in series.items():
+                p50, p95 = np.percentile(valeurs, [50, 95])
+                lignes.append({"Run": type_run, "Étape": nom, "N": len(valeurs),
+                               "p50 (ms)": round(p50, 1), "p95 (ms)": round(p95, 1), "max (ms)": round(max(valeurs), 1)})
+        return pd.DataFrame(lignes)
+
+
+# ==============================================================================
+# COMPTEUR D'APPELS AU STOCKAGE
+# ==============================================================================
+# Enveloppe transparente autour d'un Stockage : compte et chronomètre chaque opération,
+# au total (process, file d'écritures comprise) et pour le rerun en cours.
+
+OPERATIONS_STOCKAGE = {"read", "read_from", "read_versioned", "append", "overwrite", "delete_rows"}
+
+class CompteurAppels:
+    def __init__(self, stockage):
+        self._stockage = stockage
+        self._lock = threading.Lock()
+        self.debut = time.time()
+        self.totaux = {}     # opération -> {"n": appels, "ms": temps cumulé}
+
+    def __getattr__(self, nom):
+        attribut = getattr(self._stockage, nom)
+        if nom not in OPERATIONS_STOCKAGE: return attribut
+        def appeler(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return attribut(*args, **kwargs)
+            finally:
+                ms = (time.perf_counter() - t0) * 1000
+                cle = f"{nom}:{args[0]}" if args else nom
+                with self._lock:
+                    total = self.totaux.setdefault(cle, {"n": 0, "ms": 0.0})
+                    total["n"] += 1; total["ms"] += ms
+                mesure = getattr(_courante, "mesure", None)
+                if mesure is not None:
+                    mesure.appels[cle] = mesure.appels.get(cle, 0) + 1
+                    mesure.ajouter(f"stockage:{cle}", ms)
+        return appeler
+
+    def tableau(self):
+        minutes = max((time.time() - self.debut) / 60, 1e-9)
+        with self._lock:
+            return pd.DataFrame([{"Opération": cle, "Appels": v["n"], "Par minute": round(v["n"] / minutes, 2),
+                                  "ms moyen": round(v["ms"] / v["n"], 1)} for cle, v in sorted(self.totaux.items())])
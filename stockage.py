@@ -0,0 +1,247 @@
+import sqlite3
+import threading
+import hashlib
+import random
+import time
+from collections import Counter
+import pandas as pd
+try:
+    from gspread.exceptions import WorksheetNotFound
+except ImportError:
+    # Installation SQLite seule : l'exception ne peut de toute façon pas survenir
+    class WorksheetNotFound(Exception): pass
+
+# ==============================================================================
+# STOCKAGE : INTERFACE COMMUNE (GOOGLE SHEETS / SQLITE LOCAL)
+# ==============================================================================
+# App.py ne parle qu'à cette interface via safe_read / append_row / overwrite_data.
+# Chaque "worksheet" (Logs, Consignes, Pannes, Objectif) est un onglet côté Sheets
+# et une table côté SQLite.
+#
+# Écritures concurrentes : les ajouts sont des ajouts natifs (rien à fusionner), et
+# tout ce qui réécrit un onglet passe par une compare-and-swap sur sa révision
+# (compteur côté SQLite, empreinte du contenu côté Sheets). En cas de conflit,
+# l'intention (ex: "supprimer ces lignes") est réappliquée sur le contenu à jour.
+
+ESSAIS_CONFLIT = 5
+
+class ConflitEcriture(Exception):
+    # L'onglet a changé entre la lecture et l'écriture
+    pass
+
+def empreinte(df):
+    # Révision d'un onglet sans compteur natif : hachage ordonné de l'en-tête et des cellules
+    h = hashlib.sha1("\x1f".join(map(str, df.columns)).encode())
+    if not df.empty:
+        h.update(pd.util.hash_pandas_object(df.fillna("").astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def projeter(df, cols):
+    # Contenu brut -> colonnes `cols` en texte (onglet vide ou incomplet -> DataFrame vide)
+    if df.empty or len(df.columns) < len(cols): return pd.DataFrame(columns=cols)
+    return df[df.columns[:len(cols)]].set_axis(cols, axis=1).fillna("").astype(str).reset_index(drop=True)
+
+class Stockage:
+    # Contenu brut de l'onglet (DataFrame vide s'il n'existe pas)
+    def read(self, worksheet):
+        raise NotImplementedError
+
+    # Ajout de lignes en fin d'onglet, dans l'ordre de `cols`
+    def append(self, worksheet, rows, cols):
+        raise NotImplementedError
+
+    # Remplacement complet du contenu de l'onglet. Avec `revision`, n'écrit que si
+    # l'onglet est toujours à cette révision (sinon ConflitEcriture).
+    def overwrite(self, worksheet, df, revision=None):
+        raise NotImplementedError
+
+    # Contenu brut + révision courante de l'onglet
+    def read_versioned(self, worksheet):
+        df = self.read(worksheet)
+        return df, empreinte(df)
+
+    # Lignes de données à partir de l'indice `start` (0 = première ligne sous l'en-tête),
+    # en texte brut, avec les colonnes `cols`. Sert à la lecture incrémentale des Logs.
+    def read_from(self, worksheet, start, cols):
+        return projeter(self.read(worksheet), cols).iloc[start:].reset_index(drop=True)
+
+    # Lecture - transformation - écriture conditionnelle, rejouée tant que l'onglet bouge
+    def _modifier(self, worksheet, cols, transformation):
+        for essai in range(ESSAIS_CONFLIT):
+            df, revision = self.read_versioned(worksheet)
+            try:
+                self.overwrite(worksheet, transformation(projeter(df, cols)), revision=revision)
+                return
+            except ConflitEcriture:
+                time.sleep(random.uniform(0, 0.1 * (essai + 1)))
+        raise ConflitEcriture(f"{worksheet} : modifié en continu, écriture abandonnée")
+
+    # Supprime les lignes dont les colonnes `cle` valent l'un des tuples de `valeurs`.
+    # Appliqué au contenu à jour : une ligne ajoutée entre-temps par un autre écran reste.
+    # par_occurrence : une ligne en double n'est supprimée qu'autant de fois qu'elle figure
+    # dans `valeurs`, ses autres copies restent (sinon toutes ses copies partent).
+    def delete_rows(self, worksheet, cols, cle, valeurs, par_occurrence=False):
+        a_supprimer = Counter(tuple(str(v) for v in val) for val in valeurs)
+        def sans(df):
+            lignes = [tuple(r) for r in df[cle].itertuples(index=False)]
+            if not par_occurrence: return df[[l not in a_supprimer for l in lignes]]
+            reste, garder = a_supprimer.copy(), []   # copie : la transformation peut être rejouée
+            for l in lignes:
+                garder.append(reste[l] <= 0)
+                reste[l] -= 1
+            return df[garder]
+        self._modifier(worksheet, cols, sans)
+
+
+# --- GOOGLE SHEETS ---
+class StockageGSheets(Stockage):
+    def __init__(self, conn, ttl=5):
+        self.conn = conn
+        self.ttl = ttl
+        # Onglets dont on sait déjà qu'ils ont leur ligne d'en-tête
+        self._onglets_avec_entete = set()
+
+    def read(self, worksheet):
+        try: return self.conn.read(worksheet=worksheet, ttl=self.ttl)
+        except WorksheetNotFound: return pd.DataFrame()
+
+    def append(self, worksheet, rows, cols):
+        # Ajout en fin d'onglet : on n'envoie QUE les nouvelles lignes (coût constant)
+        df_new = pd.DataFrame(rows, columns=cols)
+        valeurs = df_new[cols].astype(str).values.tolist()
+        try:
+            ws = self.conn.client._select_worksheet(worksheet=worksheet)
+        except WorksheetNotFound:
+            # Nouvel onglet (ex: partition d'archive) : créé avec son en-tête et ses lignes
+            self.conn.create(worksheet=worksheet, data=df_new.astype(str))
+            self._onglets_avec_entete.add(worksheet)
+            return
+        except AttributeError:
+            # Client sans accès gspread (ex: feuille publique) : lecture + réécriture conditionnelle,
+            # refaite sur le contenu à jour si quelqu'un a écrit entre les deux
+            self._modifier(worksheet, cols, lambda df_old: pd.concat([df_old, df_new.astype(str)], ignore_index=True))
+            return
+        # Onglet vierge : on pose l'en-tête dans le même appel
+        if worksheet not in self._onglets_avec_entete:
+            if not ws.row_values(1): valeurs = [cols] + valeurs
+            self._onglets_avec_entete.add(worksheet)
+        ws.append_rows(valeurs, value_input_option="USER_ENTERED", insert_data_option="INSERT_ROWS", table_range="A1")
+
+    def read_versioned(self, worksheet):
+        # Toujours une lecture fraîche : la révision doit refléter l'état réel de la feuille
+        try: df = self.conn.read(worksheet=worksheet, ttl=0)
+        except WorksheetNotFound: df = pd.DataFrame()
+        return df, empreinte(df)
+
+    def overwrite(self, worksheet, df, revision=None):
+        # Sheets n'a pas d'écriture conditionnelle : on revérifie l'empreinte juste avant
+        # d'écrire, ce qui réduit la fenêtre de conflit à un aller-retour
+        if revision is not None and self.read_versioned(worksheet)[1] != revision:
+            raise ConflitEcriture(worksheet)
+        try: self.conn.update(worksheet=worksheet, data=df)
+        except WorksheetNotFound: self.conn.create(worksheet=worksheet, data=df)
+
+    def read_from(self, worksheet, start, cols):
+        try:
+            ws = self.conn.client._select_worksheet(worksheet=worksheet)
+        except WorksheetNotFound:
+            return pd.DataFrame(columns=cols)
+        except AttributeError:
+            return super().read_from(worksheet, start, cols)
+        # Ligne 1 = en-tête, donc la donnée d'indice `start` est en ligne start + 2
+        plage = f"A{start + 2}:{chr(ord('A') + len(cols) - 1)}"
+        valeurs = ws.get_values(plage)
+        # L'API coupe les cellules vides en fin de ligne : on complète
+        valeurs = [(list(v) + [""] * len(cols))[:len(cols)] for v in valeurs]
+        return pd.DataFrame(valeurs, columns=cols)
+
+
+# --- SQLITE (SERVEUR ATELIER / HORS-LIGNE) ---
+# Tables indexées pour les filtres fréquents du tableau de bord
+INDEX_SQLITE = {"Logs": ["Poste", "MSN_Display", "Date"], "Consignes": ["MSN"]}
+
+class StockageSQLite(Stockage):
+    def __init__(self, chemin="atelier.db"):
+        self.chemin = chemin
+        # Une seule connexion partagée par toutes les sessions Streamlit (threads)
+        self._db = sqlite3.connect(chemin, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Compteur de révision par onglet, incrémenté dans la même transaction que l'écriture
+        self._db.execute('CREATE TABLE IF NOT EXISTS "_revisions" (onglet TEXT PRIMARY KEY, rev INTEGER NOT NULL)')
+        self._lock = threading.Lock()
+
+    def _transaction(self, action):
+        # IMMEDIATE : le verrou d'écriture est pris dès le début, y compris face à un autre process
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            action()
+        except Exception:
+            self._db.execute("ROLLBACK"); raise
+        self._db.execute("COMMIT")
+
+    def _revision(self, worksheet):
+        ligne = self._db.execute('SELECT rev FROM "_revisions" WHERE onglet = ?', (worksheet,)).fetchone()
+        return ligne[0] if ligne else 0
+
+    def _incrementer(self, worksheet):
+        self._db.execute('INSERT INTO "_revisions" VALUES (?, 1) ON CONFLICT(onglet) DO UPDATE SET rev = rev + 1', (worksheet,))
+
+    def _colonnes(self, worksheet):
+        return [r[1] for r in self._db.execute(f'PRAGMA table_info("{worksheet}")')]
+
+    def _creer_table(self, worksheet, cols):
+        defs = ", ".join(f'"{c}" TEXT' for c in cols)
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS "{worksheet}" ({defs})')
+        for c in INDEX_SQLITE.get(worksheet, []):
+            if c in cols:
+                self._db.execute(f'CREATE INDEX IF NOT EXISTS "idx_{worksheet}_{c}" ON "{worksheet}" ("{c}")')
+
+    def read(self, worksheet):
+        with self._lock:
+            cols = self._colonnes(worksheet)
+            if not cols: return pd.DataFrame()
+            return pd.read_sql_query(f'SELECT * FROM "{worksheet}" ORDER BY rowid', self._db)
+
+    def read_versioned(self, worksheet):
+        # Lecture et révision dans la même transaction de lecture (instantané WAL cohérent)
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                cols = self._colonnes(worksheet)
+                df = pd.read_sql_query(f'SELECT * FROM "{worksheet}" ORDER BY rowid', self._db) if cols else pd.DataFrame()
+                return df, self._revision(worksheet)
+            finally:
+                self._db.execute("COMMIT")
+
+    def read_from(self, worksheet, start, cols):
+        with self._lock:
+            existantes = self._colonnes(worksheet)
+            if len(existantes) < len(cols): return pd.DataFrame(columns=cols)
+            noms = ", ".join(f'"{c}"' for c in existantes[:len(cols)])
+            df = pd.read_sql_query(f'SELECT {noms} FROM "{worksheet}" ORDER BY rowid LIMIT -1 OFFSET ?', self._db, params=(int(start),))
+        return df.set_axis(cols, axis=1).fillna("").astype(str)
+
+    def append(self, worksheet, rows, cols):
+        valeurs = pd.DataFrame(rows, columns=cols)[cols].astype(str).values.tolist()
+        marques = ", ".join("?" for _ in cols)
+        noms = ", ".join(f'"{c}"' for c in cols)
+        def action():
+            self._creer_table(worksheet, cols)
+            self._db.executemany(f'INSERT INTO "{worksheet}" ({noms}) VALUES ({marques})', valeurs)
+            self._incrementer(worksheet)
+        with self._lock: self._transaction(action)
+
+    def overwrite(self, worksheet, df, revision=None):
+        cols = [str(c) for c in df.columns]
+        valeurs = df.astype(str).values.tolist()
+        marques = ", ".join("?" for _ in cols)
+        def action():
+            # Vérification et écriture sous le même verrou d'écriture : vraie compare-and-swap
+            if revision is not None and self._revision(worksheet) != revision:
+                raise ConflitEcriture(worksheet)
+            self._incrementer(worksheet)
+            self._db.execute(f'DROP TABLE IF EXISTS "{worksheet}"')
+            self._creer_table(worksheet, cols)
+            if valeurs: self._db.executemany(f'INSERT INTO "{worksheet}" VALUES ({marques})', valeurs)
+        with self._lock: self._transaction(action)